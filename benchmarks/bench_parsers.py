@@ -0,0 +1,68 @@
+# bench_parsers.py - 函釋列表頁解析後端效能比較
+import argparse
+import os
+import sys
+import time
+
+SCRIPTS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+sys.path.insert(0, SCRIPTS_PATH)
+
+from archive_store import RawArchive
+from fixture_server import synthetic_listing
+from ruling_parser import PARSER_BACKENDS, parse_listing
+
+
+def load_pages(max_pages, synthetic_size):
+    """讀取封存的列表頁快照；沒有快照時使用合成頁面"""
+    pages = []
+    for _, content in RawArchive().iter_snapshots('dot_rulings'):
+        pages.append(content)
+        if len(pages) >= max_pages:
+            break
+
+    if not pages:
+        print(f"⚠ 封存區沒有快照，改用合成頁面（{synthetic_size} 筆函釋）")
+        pages = [synthetic_listing(synthetic_size)]
+    return pages
+
+
+def bench_backend(backend, pages, repeat, limit):
+    """回傳 (最佳秒數, 平均秒數, 找到的函釋數)"""
+    timings = []
+    found = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        found = sum(len(parse_listing(page, backend, limit)['rulings']) for page in pages)
+        timings.append(time.perf_counter() - started)
+    return min(timings), sum(timings) / len(timings), found
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比較函釋列表頁解析後端')
+    parser.add_argument('--repeat', type=int, default=5, help='每個後端重複次數')
+    parser.add_argument('--max-pages', type=int, default=50, help='最多讀取的封存快照數')
+    parser.add_argument('--synthetic-size', type=int, default=5000, help='合成頁面的函釋筆數')
+    parser.add_argument('--limit', type=int, default=None, help='每頁找到幾筆後提早停止')
+    args = parser.parse_args()
+
+    pages = load_pages(args.max_pages, args.synthetic_size)
+    total_bytes = sum(len(page) for page in pages)
+    print(f"頁面數: {len(pages)}, 總大小: {total_bytes:,} bytes\n")
+
+    # 先確認各後端解析結果一致
+    reference = None
+    for name in PARSER_BACKENDS:
+        keys = [[(r['title'], r['url']) for r in parse_listing(page, name)['rulings']] for page in pages]
+        if reference is None:
+            reference = keys
+        elif keys != reference:
+            print(f"⚠ 後端 {name} 的解析結果與其他後端不同")
+
+    print(f"{'後端':<8}{'函釋數':>8}{'最佳(ms)':>12}{'平均(ms)':>12}{'MB/s':>10}")
+    for name in PARSER_BACKENDS:
+        best, mean, found = bench_backend(name, pages, args.repeat, args.limit)
+        throughput = total_bytes / best / 1024 / 1024 if best else 0
+        print(f"{name:<8}{found:>8}{best * 1000:>12.1f}{mean * 1000:>12.1f}{throughput:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# bench_ruling_number.py - 函釋字號擷取效能比較
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+SCRIPTS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+sys.path.insert(0, SCRIPTS_PATH)
+
+from ruling_number import extract_ruling_number, extract_ruling_numbers
+
+# 標題範本（含各種字號格式、全形數字與不含字號的標題）
+TITLE_TEMPLATES = [
+    '財政部{roc}年{m}月{d}日台財稅字第{n11}號令',
+    '臺財關字第{n10_full}號函：進口貨物稅則疑義',
+    '台財產字第 {n10} 號 國有財產處分相關規定',
+    '財政部{n5}號公告修正營業稅法施行細則',
+    '有關營利事業列報交際費支出之認定標準（{n12}號）',
+    '賦稅署新聞稿：{roc}年度綜合所得稅結算申報',
+    '境外電商課徵營業稅執行要點',
+]
+
+
+def legacy_extract(text):
+    """舊版做法：每次呼叫重新準備三個正則表達式並逐一嘗試"""
+    patterns = [
+        r'台財稅字第\d+號',
+        r'財政部\d+號',
+        r'\d{10,12}號'
+    ]
+    for pattern in patterns:
+        match = re.search(pattern, text)
+        if match:
+            return match.group()
+    return None
+
+
+def build_corpus(size, seed=42):
+    """產生大量模擬標題"""
+    rng = random.Random(seed)
+    fullwidth = str.maketrans('0123456789', '０１２３４５６７８９')
+    corpus = []
+    for _ in range(size):
+        n10 = str(rng.randrange(10 ** 9, 10 ** 10))
+        corpus.append(rng.choice(TITLE_TEMPLATES).format(
+            roc=rng.randint(100, 114), m=rng.randint(1, 12), d=rng.randint(1, 28),
+            n5=rng.randrange(10000, 99999), n10=n10, n10_full=n10.translate(fullwidth),
+            n11=rng.randrange(10 ** 10, 10 ** 11), n12=rng.randrange(10 ** 11, 10 ** 12)
+        ))
+    return corpus
+
+
+def timed(func, corpus, repeat):
+    """回傳 (最佳秒數, 找到字號的標題數)"""
+    best = None
+    found = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        found = sum(1 for title in corpus if func(title))
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比較函釋字號擷取效能')
+    parser.add_argument('--size', type=int, default=200000, help='模擬標題數')
+    parser.add_argument('--repeat', type=int, default=3, help='重複次數')
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.size)
+    print(f"標題數: {len(corpus):,}\n")
+    print(f"{'方法':<28}{'命中':>10}{'最佳(ms)':>12}{'標題/秒':>14}")
+
+    for label, func in [
+        ('舊版（三個正則逐一嘗試）', legacy_extract),
+        ('單一交替式（第一個字號）', extract_ruling_number),
+        ('單一交替式（全部字號）', extract_ruling_numbers),
+    ]:
+        best, found = timed(func, corpus, args.repeat)
+        print(f"{label:<28}{found:>10,}{best * 1000:>12.1f}{len(corpus) / best:>14,.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+# fixture_server.py - 本機測試用 HTTP 伺服器（提供錄製頁面與合成頁面，可模擬延遲）
+import argparse
+import hashlib
+import os
+import re
+import threading
+import time
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# 副檔名對應的 Content-Type
+CONTENT_TYPES = {
+    '.html': 'text/html; charset=utf-8',
+    '.xml': 'application/rss+xml; charset=utf-8',
+}
+
+# 合成頁面的主題（輪流使用）
+SYNTHETIC_SUBJECTS = [
+    '營利事業交際費列支限額', '個人出售房地適用房地合一稅2.0', '境外電商銷售電子勞務課徵營業稅',
+    '遺產稅不計入遺產總額', '綜合所得稅列舉扣除額', '土地增值稅重購退稅',
+]
+
+
+def synthetic_listing(count):
+    """產生含 count 筆函釋連結（夾雜一般連結）的列表頁"""
+    rows = []
+    for i in range(count):
+        rows.append(
+            f'<li><span class="date">113-10-{i % 28 + 1:02d}</span>'
+            f'<a href="/ch/home.jsp?id=30&amp;dataserno={i}">'
+            f'財政部113年10月{i % 28 + 1}日台財稅字第11304{i:06d}號令</a></li>'
+            f'<li><a href="/ch/news.jsp?id={i}">賦稅署新聞稿第{i}則</a></li>'
+        )
+    return (
+        '<html><head><meta charset="utf-8"><title>函釋查詢-財政部賦稅署</title></head>'
+        '<body><ul class="list">' + ''.join(rows) + '</ul></body></html>'
+    ).encode('utf-8')
+
+
+def synthetic_rss(count):
+    """產生含 count 個項目的 RSS（半數為函釋）"""
+    published = datetime(2024, 10, 14, 9, 0, tzinfo=timezone(timedelta(hours=8)))
+    items = []
+    for i in range(count):
+        subject = SYNTHETIC_SUBJECTS[i % len(SYNTHETIC_SUBJECTS)]
+        title = (f'台財稅字第11305{i:06d}號令 有關{subject}之解釋令' if i % 2 == 0
+                 else f'賦稅署新聞稿：{subject}說明第{i}則')
+        items.append(
+            f'<item><title>{title}</title><link>https://fixture.local/item/{i}</link>'
+            f'<guid>https://fixture.local/item/{i}</guid>'
+            f'<pubDate>{format_datetime(published - timedelta(hours=i))}</pubDate>'
+            f'<description>{title}。</description></item>'
+        )
+    return (
+        '<?xml version="1.0" encoding="utf-8"?><rss version="2.0"><channel>'
+        '<title>合成RSS</title><link>https://fixture.local</link>'
+        + ''.join(items) + '</channel></rss>'
+    ).encode('utf-8')
+
+
+def synthetic_detail(number):
+    """產生第 number 則函釋的內容頁（與 synthetic_listing 的連結對應）"""
+    subject = SYNTHETIC_SUBJECTS[number % len(SYNTHETIC_SUBJECTS)]
+    day = number % 28 + 1
+    return (
+        '<html><head><meta charset="utf-8"><title>函釋內容-財政部賦稅署</title></head><body>'
+        '<header><nav><a href="/ch/index.jsp">首頁</a></nav></header>'
+        f'<div class="content"><h2>有關{subject}之解釋令</h2>'
+        f'<p>發文單位：財政部</p><p>發文字號：台財稅字第11304{number:06d}號</p>'
+        f'<p>發文日期：民國113年10月{day}日</p>'
+        f'<p>一、核釋{subject}相關規定，自即日起生效。</p>'
+        '<p>二、本令發布前尚未核課確定之案件，適用本令規定。</p></div>'
+        '<footer>財政部賦稅署 版權所有</footer></body></html>'
+    ).encode('utf-8')
+
+
+def pad_html(content, size):
+    """在 </body> 前補上註解，使頁面至少達到 size 位元組（模擬大型頁面）"""
+    missing = size - len(content)
+    if missing <= 0:
+        return content
+    padding = b'<!--' + b'x' * max(missing - 7, 0) + b'-->'
+    marker = content.rfind(b'</body>')
+    if marker < 0:
+        return content + padding
+    return content[:marker] + padding + content[marker:]
+
+
+def transcode(body, content_type, charset, declare=True):
+    """將 UTF-8 內容轉為 charset 編碼，declare 為 False 時移除標頭與文件內的編碼宣告"""
+    text = body.decode('utf-8')
+    declared = f'charset="{charset}"' if declare else ''
+    text = re.sub(r'charset="?utf-8"?', declared, text, count=1, flags=re.IGNORECASE)
+    text = re.sub(r'encoding="utf-8"', f'encoding="{charset}"' if declare else '', text, count=1)
+    content_type = content_type.split(';')[0] + (f'; charset={charset}' if declare else '')
+    return text.encode(charset, errors='xmlcharrefreplace'), content_type
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """路徑：
+    /fixtures/<檔名>              錄製的頁面（benchmarks/fixtures）
+    /synthetic/listing?count=N     合成函釋列表頁
+    /synthetic/rss?count=N         合成 RSS
+    /ch/home.jsp?dataserno=N       合成函釋內容頁（合成列表頁連結的目標）
+    共用參數：latency=毫秒（覆寫伺服器預設延遲）、size=位元組（補足頁面大小）、
+    status=狀態碼（回應指定的錯誤碼，可測試限流與斷路）、retry_after=秒數、
+    charset=編碼（以指定編碼輸出，如 big5）、declare=0（不在標頭與 <meta> 宣告編碼）
+    """
+
+    def log_message(self, format, *args):
+        """不輸出每個請求的記錄"""
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        latency = float(query.get('latency', self.server.latency_ms)) / 1000
+        if latency:
+            time.sleep(latency)
+
+        if 'status' in query:
+            self.server.requests += 1
+            self.send_response(int(query['status']))
+            if 'retry_after' in query:
+                self.send_header('Retry-After', query['retry_after'])
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body, content_type = self.resolve(url.path, query)
+        if body is None:
+            self.send_error(404)
+            return
+        if 'size' in query:
+            body = pad_html(body, int(query['size']))
+        if 'charset' in query:
+            body, content_type = transcode(body, content_type, query['charset'], query.get('declare') != '0')
+
+        # 支援 ETag 條件式請求，可測試 HTTP 快取路徑
+        etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+        self.server.requests += 1
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def resolve(self, path, query):
+        """依路徑取得 (內容, Content-Type)，找不到時回傳 (None, None)"""
+        count = int(query.get('count', 1000))
+        if path == '/synthetic/listing':
+            return synthetic_listing(count), CONTENT_TYPES['.html']
+        if path == '/synthetic/rss':
+            return synthetic_rss(count), CONTENT_TYPES['.xml']
+        if path == '/ch/home.jsp' and 'dataserno' in query:
+            return synthetic_detail(int(query['dataserno'])), CONTENT_TYPES['.html']
+
+        if path.startswith('/fixtures/'):
+            name = os.path.basename(path)
+            file_path = os.path.join(FIXTURES_PATH, name)
+            if os.path.isfile(file_path):
+                with open(file_path, 'rb') as f:
+                    content = f.read()
+                return content, CONTENT_TYPES.get(os.path.splitext(name)[1], 'application/octet-stream')
+        return None, None
+
+
+class FixtureServer:
+    """在背景執行緒啟動本機伺服器（port 0 表示自動選擇可用埠）"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=0):
+        self.httpd = ThreadingHTTPServer((host, port), FixtureHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency_ms = latency_ms
+        self.httpd.requests = 0
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def requests(self):
+        """已處理的請求數"""
+        return self.httpd.requests
+
+    def url(self, path, **params):
+        """組合伺服器網址，例如 url('/synthetic/listing', count=5000)"""
+        query = '&'.join(f'{key}={value}' for key, value in params.items())
+        return f"{self.base_url}{path}" + (f"?{query}" if query else '')
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='啟動本機測試伺服器')
+    parser.add_argument('--port', type=int, default=8765, help='埠號')
+    parser.add_argument('--latency-ms', type=float, default=0, help='每個回應的延遲（毫秒）')
+    args = parser.parse_args()
+
+    server = FixtureServer(port=args.port, latency_ms=args.latency_ms)
+    print(f"✓ 測試伺服器: {server.base_url}（Ctrl+C 結束）")
+    print(f"  {server.url('/fixtures/dot_rulings.html')}")
+    print(f"  {server.url('/synthetic/listing', count=5000)}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
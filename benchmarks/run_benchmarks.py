@@ -0,0 +1,315 @@
+# run_benchmarks.py - 整體效能基準（本機測試伺服器 + 各元件），結果依 commit 累積記錄
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCHMARKS_PATH = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_PATH = os.path.join(os.path.dirname(BENCHMARKS_PATH), 'scripts')
+sys.path.insert(0, SCRIPTS_PATH)
+
+from advanced_collector import AdvancedTaxCollector
+from archive_store import RawArchive
+from bench_ruling_number import build_corpus
+from database_manager import TaxDatabaseManager
+from encoding_resolver import EncodingResolver
+from feed_stream import FeedState, StreamingFeedReader
+from fetch_engine import AsyncFetchEngine
+from fixture_server import CONTENT_TYPES, FixtureServer, synthetic_listing, transcode
+from mof_scraper import MOFTaxScraper
+from pipeline import CollectionPipeline
+from ruling_number import extract_ruling_number
+from run_store import RunStore
+
+# 結果檔（每次執行附加一行 JSON）
+RESULTS_PATH = os.path.join(BENCHMARKS_PATH, 'results.jsonl')
+
+# 搜尋基準使用的關鍵字
+SEARCH_KEYWORDS = ['交際費', '房地合一', '營業稅', '境外電商', '遺產稅', '扣除額']
+
+# 各規模設定：(列表頁函釋數, 字號標題數, 單筆寫入數, 批次寫入數, 搜尋次數, RSS項目數)
+SIZES = {
+    'quick': {'listing': 500, 'titles': 20000, 'single': 100, 'bulk': 1000, 'searches': 60,
+              'rss': 2000},
+    'full': {'listing': 5000, 'titles': 200000, 'single': 500, 'bulk': 10000, 'searches': 300,
+             'rss': 20000},
+}
+
+
+def git_revision():
+    """目前 commit（有未提交變更時加上 -dirty），非 git 目錄時回傳 None"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARKS_PATH,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                cwd=BENCHMARKS_PATH, capture_output=True, text=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if status.strip() else '')
+
+
+def measure(func, repeat):
+    """執行 repeat 次（隱藏輸出），回傳 (最佳秒數, 最後一次的回傳值)"""
+    best, result = None, None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def sample_rulings(count):
+    """產生 count 筆模擬函釋"""
+    subjects = ['營利事業交際費列支限額', '個人出售房地適用房地合一稅', '境外電商營業稅申報',
+                '遺產稅不計入遺產總額', '綜合所得稅列舉扣除額', '土地增值稅重購退稅']
+    return [
+        {
+            'ruling_number': f'台財稅字第11306{i:06d}號',
+            'title': f'財政部令 有關{subjects[i % len(subjects)]}之解釋令（第{i}號）',
+            'content': f'核釋{subjects[i % len(subjects)]}相關規定，自即日起生效。案例編號{i}。',
+            'source': '基準測試',
+            'issue_date': f'2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}',
+            'url': f'https://fixture.local/ruling/{i}'
+        }
+        for i in range(count)
+    ]
+
+
+def temp_db(directory):
+    """在暫存目錄建立新的資料庫"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return TaxDatabaseManager(os.path.join(directory, f'bench_{time.perf_counter_ns()}.db'))
+
+
+def bench_parse_rulings(size, repeat, workdir):
+    page = synthetic_listing(size['listing'])
+    with contextlib.redirect_stdout(io.StringIO()):
+        scraper = MOFTaxScraper(fetcher=AsyncFetchEngine())
+    scraper.archive = RawArchive(os.path.join(workdir, 'archive'))
+    seconds, rulings = measure(lambda: scraper.parse_rulings(page), repeat)
+    return {'seconds': seconds, 'ops': len(rulings), 'bytes': len(page)}
+
+
+def bench_extract_ruling_number(size, repeat, workdir):
+    corpus = build_corpus(size['titles'])
+    seconds, found = measure(lambda: sum(1 for title in corpus if extract_ruling_number(title)), repeat)
+    return {'seconds': seconds, 'ops': len(corpus), 'found': found}
+
+
+def bench_insert_ruling(size, repeat, workdir):
+    rulings = sample_rulings(size['single'])
+
+    def run():
+        db = temp_db(workdir)
+        for ruling in rulings:
+            db.insert_ruling(ruling)
+
+    seconds, _ = measure(run, repeat)
+    return {'seconds': seconds, 'ops': len(rulings)}
+
+
+def bench_insert_rulings_bulk(size, repeat, workdir):
+    rulings = sample_rulings(size['bulk'])
+
+    def run():
+        db = temp_db(workdir)
+        with db:
+            return db.insert_rulings_bulk(rulings)
+
+    seconds, counts = measure(run, repeat)
+    return {'seconds': seconds, 'ops': len(rulings), 'inserted': counts['inserted']}
+
+
+def bench_search_rulings(size, repeat, workdir):
+    db = temp_db(workdir)
+    with contextlib.redirect_stdout(io.StringIO()):
+        db.insert_rulings_bulk(sample_rulings(size['bulk']))
+    queries = [SEARCH_KEYWORDS[i % len(SEARCH_KEYWORDS)] for i in range(size['searches'])]
+
+    def run():
+        with db:
+            return sum(len(db.search_rulings(keyword)) for keyword in queries)
+
+    seconds, hits = measure(run, repeat)
+    return {'seconds': seconds, 'ops': len(queries), 'hits': hits}
+
+
+def bench_decode_pages(size, repeat, workdir):
+    """判斷編碼並解碼列表頁（UTF-8 宣告、Big5 宣告、Big5 未宣告各半，後者依主機快取）"""
+    page = synthetic_listing(size['listing'])
+    variants = [
+        (page, CONTENT_TYPES['.html']),
+        transcode(page, CONTENT_TYPES['.html'], 'big5'),
+        transcode(page, CONTENT_TYPES['.html'], 'big5', declare=False),
+    ]
+    pages = variants * 20
+
+    def run():
+        resolver = EncodingResolver()
+        return sum(len(resolver.decode(body, content_type, 'fixture.local')[1])
+                   for body, content_type in pages)
+
+    seconds, chars = measure(run, repeat)
+    return {'seconds': seconds, 'ops': len(pages), 'chars': chars,
+            'bytes': sum(len(body) for body, _ in pages)}
+
+
+def point_sources_at(pipeline, server, size, workdir):
+    """將流程中各來源的網址改為本機測試伺服器"""
+    for plugin in pipeline.plugins:
+        if plugin.name == 'dot_rulings':
+            plugin.scraper.rulings_url = server.url('/synthetic/listing', count=size['listing'])
+            plugin.scraper.archive = RawArchive(os.path.join(workdir, 'archive'))
+        elif plugin.name == 'mof_home':
+            plugin.collector.mof_url = server.url('/fixtures/mof_home.html')
+        elif plugin.name == 'rss':
+            plugin.collector.rss_feeds = {
+                '財政部RSS': server.url('/fixtures/mof_rss.xml'),
+                '賦稅署RSS': server.url('/fixtures/dot_rss.xml'),
+            }
+            # 每次使用新的狀態檔，避免前一次讀過的項目讓解析提早停止
+            plugin.state = FeedState(os.path.join(workdir, f'feed_state_{time.perf_counter_ns()}.json'))
+
+
+def bench_pipeline(size, repeat, workdir, latency_ms=0):
+    """所有來源經本機伺服器的完整流程（每次使用新的資料庫，不使用 HTTP 快取）"""
+    with FixtureServer(latency_ms=latency_ms) as server:
+        def run():
+            pipeline = CollectionPipeline(fetcher=AsyncFetchEngine(), db=temp_db(workdir))
+            pipeline.run_store = RunStore(os.path.join(workdir, 'runs'))
+            point_sources_at(pipeline, server, size, workdir)
+            summary = pipeline.fetcher.run(pipeline.run_async())
+            pipeline.fetcher.close()
+            return summary
+
+        seconds, summary = measure(run, repeat)
+    return {'seconds': seconds, 'ops': len(summary['rulings']), 'timings': summary['timings']}
+
+
+def bench_rss_stream(size, repeat, workdir):
+    """大型RSS經本機伺服器串流解析並寫入資料庫（不限項目數）"""
+    with FixtureServer() as server:
+        url = server.url('/synthetic/rss', count=size['rss'])
+
+        def run():
+            fetcher = AsyncFetchEngine()
+            collector = AdvancedTaxCollector(fetcher=fetcher, db=temp_db(workdir))
+            state = FeedState(os.path.join(workdir, f'feed_state_{time.perf_counter_ns()}.json'))
+            reader = StreamingFeedReader(fetcher, collector.db, state=state, limit=None)
+            with collector.db:
+                stats, _ = reader.ingest({'合成RSS': url}, collector.extract_candidate)
+            fetcher.close()
+            return stats['合成RSS']
+
+        seconds, stats = measure(run, repeat)
+    return {'seconds': seconds, 'ops': stats['items'], 'bytes': stats['bytes']}
+
+
+BENCHMARKS = {
+    'parse_rulings': bench_parse_rulings,
+    'extract_ruling_number': bench_extract_ruling_number,
+    'insert_ruling': bench_insert_ruling,
+    'insert_rulings_bulk': bench_insert_rulings_bulk,
+    'search_rulings': bench_search_rulings,
+    'pipeline': bench_pipeline,
+    'rss_stream': bench_rss_stream,
+    'decode_pages': bench_decode_pages,
+}
+
+
+def load_previous(results_path, current_commit):
+    """讀取最近一筆來自其他 commit 的結果"""
+    if not os.path.exists(results_path):
+        return None
+    previous = None
+    with open(results_path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get('commit') != current_commit:
+                previous = record
+    return previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description='執行效能基準並記錄結果')
+    parser.add_argument('--size', choices=SIZES, default='full', help='資料規模')
+    parser.add_argument('--repeat', type=int, default=3, help='每項重複次數（取最佳值）')
+    parser.add_argument('--only', help=f"以逗號分隔的項目（預設全部: {', '.join(BENCHMARKS)}）")
+    parser.add_argument('--latency-ms', type=float, default=0, help='測試伺服器回應延遲（毫秒）')
+    parser.add_argument('--threshold', type=float, default=10.0, help='視為效能退步的降幅（%%）')
+    parser.add_argument('--no-save', action='store_true', help='不寫入 results.jsonl')
+    parser.add_argument('--fail-on-regression', action='store_true', help='有退步時以非零狀態結束')
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.only.split(',')] if args.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"未知的項目: {', '.join(unknown)}")
+
+    size = SIZES[args.size]
+    commit = git_revision()
+    previous = load_previous(RESULTS_PATH, commit)
+    baseline = previous['results'] if previous and previous.get('size') == args.size else {}
+
+    print(f"commit: {commit or '未知'}, 規模: {args.size}, 重複: {args.repeat}")
+    if baseline:
+        print(f"比較對象: {previous['commit']} ({previous['timestamp']})")
+    print(f"\n{'項目':<24}{'數量':>10}{'最佳(ms)':>12}{'每秒':>14}{'變化':>10}")
+
+    results = {}
+    regressions = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in names:
+            if name == 'pipeline':
+                result = bench_pipeline(size, args.repeat, workdir, args.latency_ms)
+            else:
+                result = BENCHMARKS[name](size, args.repeat, workdir)
+            result['ops_per_sec'] = round(result['ops'] / result['seconds'], 1) if result['seconds'] else None
+            result['seconds'] = round(result['seconds'], 6)
+            results[name] = result
+
+            change = ''
+            old = baseline.get(name, {}).get('ops_per_sec')
+            if old and result['ops_per_sec']:
+                delta = (result['ops_per_sec'] - old) / old * 100
+                change = f"{delta:+.1f}%"
+                if delta < -args.threshold:
+                    regressions.append(name)
+                    change += ' ⚠'
+            print(f"{name:<24}{result['ops']:>10,}{result['seconds'] * 1000:>12.1f}"
+                  f"{result['ops_per_sec'] or 0:>14,.0f}{change:>10}")
+
+    if not args.no_save:
+        record = {
+            'commit': commit,
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'size': args.size,
+            'repeat': args.repeat,
+            'latency_ms': args.latency_ms,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'results': results
+        }
+        with open(RESULTS_PATH, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        print(f"\n✓ 結果已附加至 {os.path.basename(RESULTS_PATH)}")
+
+    if regressions:
+        print(f"⚠ 效能退步超過 {args.threshold}%: {', '.join(regressions)}")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
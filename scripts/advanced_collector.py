@@ -1,19 +1,26 @@
 # advanced_collector.py - 進階稅務資料收集系統
-import requests
-from bs4 import BeautifulSoup
-import feedparser
-import json
 import os
 from datetime import datetime
+import metrics
 from database_manager import TaxDatabaseManager
+from feed_stream import DEFAULT_FEED_LIMIT, StreamingFeedReader
+from fetch_engine import AsyncFetchEngine
+from http_cache import HttpValidatorCache
+from rate_limiter import HostRateLimiter
+from ruling_number import extract_ruling_number
+from run_store import RunStore
 
 class AdvancedTaxCollector:
-    def __init__(self):
+    def __init__(self, fetcher=None, db=None):
         # Use the project directory (parent of scripts folder)
         self.base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         # Ensure data directory exists
         os.makedirs(os.path.join(self.base_path, 'data'), exist_ok=True)
-        self.db = TaxDatabaseManager()
+        self.db = db or TaxDatabaseManager()
+        # 共用抓取引擎（可由呼叫端注入，與其他收集器共用連線池）
+        self.fetcher = fetcher or AsyncFetchEngine(cache=HttpValidatorCache(), limiter=HostRateLimiter())
+        # 執行紀錄儲存區（取代每次執行一個 JSON 檔）
+        self.run_store = RunStore()
         
         # 多元化資料源策略
         self.rss_feeds = {
@@ -27,40 +34,34 @@ class AdvancedTaxCollector:
             '政府資料開放平台': 'https://data.gov.tw/api/v2/rest/datastore'
         }
         
-    def collect_rss_feeds(self):
-        """RSS訂閱源收集策略"""
-        all_items = []
-        
-        for source, url in self.rss_feeds.items():
-            print(f"\n處理RSS源: {source}")
-            try:
-                feed = feedparser.parse(url)
-                
-                for entry in feed.entries[:10]:
-                    item = {
-                        'title': entry.title,
-                        'link': entry.link,
-                        'published': entry.get('published', ''),
-                        'summary': entry.get('summary', ''),
-                        'source': source,
-                        'type': 'RSS'
-                    }
-                    all_items.append(item)
-                    
-                    # 檢查是否為函釋
-                    if any(keyword in entry.title for keyword in ['函釋', '解釋', '令']):
-                        self.process_ruling(item)
-                        
-                print(f"✓ 從 {source} 收集 {len(feed.entries)} 項")
-                
-            except Exception as e:
-                print(f"✗ RSS處理失敗: {e}")
-                
-        return all_items
+    def collect_rss_feeds(self, limit=DEFAULT_FEED_LIMIT):
+        """RSS訂閱源收集策略（串流解析，邊讀取邊寫入資料庫）
+    
+        每個RSS源讀到 limit 個項目或上次讀過的項目即停止，回傳各RSS源的統計。
+        """
+        reader = StreamingFeedReader(self.fetcher, self.db, limit=limit)
+        with self.db:
+            self.db.start_run('advanced_collector')
+            with metrics.timer('rss_stream'):
+                stats, counts = reader.ingest(self.rss_feeds, self.extract_candidate)
+            self.db.finish_run(counts)
+        return stats
+    
+    def is_ruling_candidate(self, item):
+        """標題含函釋相關字詞者視為函釋"""
+        return any(keyword in item['title'] for keyword in ['函釋', '解釋', '令'])
+    
+    def extract_candidate(self, item):
+        """是函釋候選時回傳函釋資料，否則回傳 None"""
+        return self.build_ruling_data(item) if self.is_ruling_candidate(item) else None
     
     def process_ruling(self, item):
-        """處理潛在的函釋資料"""
-        ruling_data = {
+        """處理潛在的函釋資料（沒有字號者以標題近似比對合併）"""
+        self.db.insert_ruling(self.build_ruling_data(item))
+    
+    def build_ruling_data(self, item):
+        """將RSS項目轉為函釋資料"""
+        return {
             'ruling_number': self.extract_ruling_number(item['title']),
             'title': item['title'],
             'content': item.get('summary', ''),
@@ -68,44 +69,27 @@ class AdvancedTaxCollector:
             'issue_date': item.get('published', ''),
             'url': item.get('link', '')
         }
-        
-        if ruling_data['ruling_number']:
-            self.db.insert_ruling(ruling_data)
     
     def extract_ruling_number(self, text):
         """提取函釋字號"""
-        import re
-        patterns = [
-            r'台財稅字第\d+號',
-            r'財政部\d+號',
-            r'\d{10,12}號'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text)
-            if match:
-                return match.group()
-        return None
+        return extract_ruling_number(text)
     
-    def generate_collection_report(self, data):
-        """生成收集報告"""
+    def generate_collection_report(self, stats):
+        """生成收集報告（stats 為 collect_rss_feeds 回傳的各RSS源統計）"""
         report = {
             'collection_time': datetime.now().isoformat(),
-            'total_items': len(data),
-            'sources': list(set(item['source'] for item in data)),
-            'types': list(set(item.get('type', 'Unknown') for item in data))
+            'total_items': sum(feed['items'] for feed in stats.values()),
+            'sources': [source for source, feed in stats.items() if feed['items']],
+            'types': ['RSS'] if any(feed['items'] for feed in stats.values()) else [],
+            # 有RSS源無法讀取（連線失敗或主機暫停中）時標示為降級執行
+            'status': 'degraded' if any(feed['error'] for feed in stats.values()) else 'ok',
+            'feeds': stats
         }
         
         # 儲存報告
-        report_file = os.path.join(
-            self.base_path, 'data', 
-            f'collection_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
-        )
-        
-        with open(report_file, 'w', encoding='utf-8') as f:
-            json.dump(report, f, ensure_ascii=False, indent=2)
+        entry = self.run_store.append('collection_report', report)
         
-        print(f"\n報告已生成: {os.path.basename(report_file)}")
+        print(f"\n報告已生成: runs/{entry['partition']}")
         return report
     
     def run_advanced_collection(self):
@@ -115,14 +99,27 @@ class AdvancedTaxCollector:
         print("="*60)
         
         # 1. RSS收集
-        rss_data = self.collect_rss_feeds()
+        rss_stats = self.collect_rss_feeds()
         
-        # 2. 生成報告
-        report = self.generate_collection_report(rss_data)
+        # 2. 關鍵字與分類（只處理新增或變更的函釋；jieba 載入較慢，需要時才匯入）
+        from enrichment import RulingEnricher
+        with metrics.timer('enrich'):
+            RulingEnricher(self.db).run()
         
-        # 3. 資料庫統計
+        # 3. 生成報告
+        report = self.generate_collection_report(rss_stats)
+        
+        # 4. 資料庫統計
         self.db.generate_report()
         
+        if self.fetcher.cache is not None:
+            self.fetcher.cache.report()
+        if self.fetcher.limiter is not None:
+            self.fetcher.limiter.report()
+        if report['status'] == 'degraded':
+            print("⚠ 降級執行：部分RSS源無法讀取")
+        
+        metrics.recorder.export('advanced_collector', run_store=self.run_store)
         return report
 
 if __name__ == "__main__":
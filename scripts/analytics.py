@@ -0,0 +1,226 @@
+# analytics.py - 函釋趨勢分析（pandas 向量化計算，依資料變更計數快取結果）
+import argparse
+import json
+import os
+import pickle
+import sqlite3
+from pathlib import Path
+
+import pandas as pd
+
+from database_manager import TaxDatabaseManager
+
+# 載入的欄位（不含內文，分析用不到且佔大部分記憶體）
+RULING_COLUMNS = ['id', 'ruling_number', 'source', 'category', 'keywords', 'issue_date', 'scraped_date']
+
+# 發布日期與收錄日期所在時區（scraped_date 由 SQLite 以 UTC 記錄）
+LOCAL_TZ = 'Asia/Taipei'
+
+# 報告預設的月份數與排行數
+DEFAULT_MONTHS = 12
+DEFAULT_TOP = 10
+
+
+def load_rulings(db_path):
+    """以唯讀連線讀取 tax_rulings，並加上 issue_day、scraped_day、month 欄位"""
+    sql = f"SELECT {', '.join(RULING_COLUMNS)} FROM tax_rulings ORDER BY id"
+    conn = sqlite3.connect(Path(db_path).resolve().as_uri() + '?mode=ro', uri=True)
+    try:
+        df = pd.read_sql_query(sql, conn)
+    finally:
+        conn.close()
+
+    for column in ('source', 'category'):
+        df[column] = df[column].fillna('').replace('', '未分類' if column == 'category' else '未知')
+
+    df['issue_day'] = pd.to_datetime(df['issue_date'], format='%Y-%m-%d', errors='coerce')
+    scraped = pd.to_datetime(df['scraped_date'], format='%Y-%m-%d %H:%M:%S', errors='coerce')
+    df['scraped_day'] = scraped.dt.tz_localize('UTC').dt.tz_convert(LOCAL_TZ).dt.tz_localize(None).dt.normalize()
+    df['month'] = df['issue_day'].dt.strftime('%Y-%m')
+    return df
+
+
+def recent_months(df, months):
+    """資料中最近 months 個月份（由舊到新）"""
+    return sorted(df['month'].dropna().unique())[-months:]
+
+
+def category_by_month(df, months=DEFAULT_MONTHS):
+    """各月份、各分類的函釋筆數（列為月份，欄為分類）"""
+    window = df[df['month'].isin(recent_months(df, months))]
+    table = window.groupby(['month', 'category']).size().unstack(fill_value=0)
+    return table.sort_index()
+
+
+def source_latency(df):
+    """各來源從發布到收錄的天數（筆數、中位數、平均、90 百分位、最大值）"""
+    latency = (df['scraped_day'] - df['issue_day']).dt.days
+    frame = pd.DataFrame({'source': df['source'], 'days': latency}).dropna()
+    # 收錄日早於發布日的資料（預告或日期錯誤）不列入
+    frame = frame[frame['days'] >= 0]
+    table = frame.groupby('source')['days'].agg(
+        count='size', median='median', mean='mean',
+        p90=lambda days: days.quantile(0.9), max='max'
+    )
+    return table.sort_values('count', ascending=False).round(1)
+
+
+def keyword_counts(df):
+    """每筆函釋的關鍵字展開為 (month, keyword) 列"""
+    frame = df.loc[df['keywords'].notna() & df['month'].notna(), ['month', 'keywords']]
+    frame = frame.assign(keyword=frame['keywords'].map(json.loads)).explode('keyword')
+    return frame.dropna(subset=['keyword'])[['month', 'keyword']]
+
+
+def keyword_trends(df, months=DEFAULT_MONTHS, top=DEFAULT_TOP):
+    """期間內最常出現的 top 個關鍵字，各月份出現次數（列為月份，欄為關鍵字）"""
+    counts = keyword_counts(df)
+    counts = counts[counts['month'].isin(recent_months(df, months))]
+    leaders = counts['keyword'].value_counts().head(top).index
+    table = counts[counts['keyword'].isin(leaders)].groupby(['month', 'keyword']).size()
+    return table.unstack(fill_value=0).reindex(columns=leaders).sort_index()
+
+
+def top_movers(df, months=1, top=DEFAULT_TOP):
+    """最近 months 個月與前 months 個月相比，出現次數變化最大的關鍵字"""
+    periods = recent_months(df, months * 2)
+    current, previous = periods[-months:], periods[:-months]
+    counts = keyword_counts(df)
+    table = pd.DataFrame({
+        'current': counts[counts['month'].isin(current)]['keyword'].value_counts(),
+        'previous': counts[counts['month'].isin(previous)]['keyword'].value_counts(),
+    }).fillna(0).astype(int)
+    table['change'] = table['current'] - table['previous']
+    # 前期為 0 時變化率為無限大，以 NA 表示
+    table['change_pct'] = (table['change'] / table['previous'].where(table['previous'] > 0) * 100).round(1)
+    table = table[table['change'] != 0]
+    order = table['change'].abs().sort_values(ascending=False, kind='stable').index
+    return table.loc[order].head(top)
+
+
+# 可用的報告：名稱 → (說明, 函式)
+REPORTS = {
+    'category': ('各月份分類筆數', category_by_month),
+    'latency': ('各來源收錄延遲（天）', source_latency),
+    'keywords': ('關鍵字趨勢', keyword_trends),
+    'movers': ('關鍵字變化排行', top_movers),
+}
+
+
+class RulingAnalytics:
+    """函釋分析報告
+
+    資料與各報告結果都以資料庫的變更計數為鍵快取，結果另存於資料庫旁的快取檔：
+    資料未變動時重複呼叫（包括另一次執行）直接回傳上次的結果，不會重新讀取或計算。
+    """
+
+    def __init__(self, db=None, cache_path=None):
+        self.db = db or TaxDatabaseManager()
+        self.db_path = os.path.abspath(self.db.db_path)
+        self.cache_path = cache_path or os.path.join(os.path.dirname(self.db_path), "analytics_cache.pkl")
+        self._version = None
+        self._frame = None
+        self._rows = None
+        self._results = {}
+        self._load()
+
+    def _load(self):
+        """讀取上次保存的結果（檔案損毀或屬於其他資料庫時忽略）"""
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'rb') as f:
+                saved = pickle.load(f)
+            if saved['db_path'] == self.db_path:
+                self._version, self._rows, self._results = saved['version'], saved['rows'], saved['results']
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError, KeyError, TypeError):
+            print("⚠ 分析快取檔損毀，重新計算")
+
+    def save(self):
+        """寫入快取檔（先寫暫存檔再取代，避免中斷時損毀）"""
+        saved = {'db_path': self.db_path, 'version': self._version, 'rows': self._rows, 'results': self._results}
+        tmp_path = self.cache_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(saved, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.cache_path)
+
+    def _refresh(self):
+        """資料變動時清除快取的資料與結果"""
+        version = self.db.change_counter()
+        if version != self._version:
+            self._frame = None
+            self._rows = None
+            self._results = {}
+            self._version = version
+
+    def frame(self):
+        """目前資料的 DataFrame（資料變動時才重新讀取）"""
+        self._refresh()
+        if self._frame is None:
+            self._frame = load_rulings(self.db_path)
+            self._rows = len(self._frame)
+        return self._frame
+
+    def rows(self):
+        """目前資料的筆數（有快取時不讀取資料）"""
+        self._refresh()
+        if self._rows is None:
+            self.frame()
+        return self._rows
+
+    def report(self, name, **options):
+        """取得指定報告（DataFrame，請勿直接修改）"""
+        if name not in REPORTS:
+            raise ValueError(f"未知的報告: {name}（可用: {', '.join(REPORTS)}）")
+
+        self._refresh()
+        key = (name, tuple(sorted(options.items())))
+        if key not in self._results:
+            self._results[key] = REPORTS[name][1](self.frame(), **options)
+            self.save()
+        return self._results[key]
+
+    def category_by_month(self, months=DEFAULT_MONTHS):
+        return self.report('category', months=months)
+
+    def source_latency(self):
+        return self.report('latency')
+
+    def keyword_trends(self, months=DEFAULT_MONTHS, top=DEFAULT_TOP):
+        return self.report('keywords', months=months, top=top)
+
+    def top_movers(self, months=1, top=DEFAULT_TOP):
+        return self.report('movers', months=months, top=top)
+
+    def display(self, names=None, months=DEFAULT_MONTHS, top=DEFAULT_TOP):
+        """輸出選定的報告"""
+        options = {
+            'category': {'months': months},
+            'latency': {},
+            'keywords': {'months': months, 'top': top},
+            'movers': {'top': top},
+        }
+        print("\n" + "="*60)
+        print(f"函釋趨勢分析（共 {self.rows()} 筆）")
+        print("="*60)
+        for name in names or REPORTS:
+            table = self.report(name, **options[name])
+            print(f"\n{REPORTS[name][0]}:")
+            print(table.to_string() if not table.empty else "  尚無資料")
+        print("="*60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='函釋趨勢分析報告')
+    parser.add_argument('--reports', help=f"以逗號分隔的報告（預設全部: {', '.join(REPORTS)}）")
+    parser.add_argument('--months', type=int, default=DEFAULT_MONTHS, help='分析的月份數')
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help='關鍵字排行數')
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.reports.split(',')] if args.reports else None
+    unknown = [name for name in names or [] if name not in REPORTS]
+    if unknown:
+        parser.error(f"未知的報告: {', '.join(unknown)}")
+
+    pd.set_option('display.width', 160)
+    RulingAnalytics().display(names, months=args.months, top=args.top)
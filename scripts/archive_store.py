@@ -0,0 +1,141 @@
+# archive_store.py - 原始網頁封存區（內容定址、壓縮、跨次執行去重）
+import argparse
+import gzip
+import hashlib
+import json
+import os
+from datetime import datetime
+
+
+class RawArchive:
+    """以內容雜湊儲存原始網頁
+
+    blobs/ 下每份內容只存一次（gzip 壓縮），index.jsonl 逐行記錄
+    每次執行的時間戳、來源與對應的 blob，可用於日後重新解析。
+    """
+
+    def __init__(self, root=None):
+        base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.root = root or os.path.join(base_path, "data", "archive")
+        self.blob_path = os.path.join(self.root, "blobs")
+        self.index_path = os.path.join(self.root, "index.jsonl")
+        os.makedirs(self.blob_path, exist_ok=True)
+
+    def _blob_file(self, digest):
+        """blob 檔案路徑（以雜湊前兩碼分目錄）"""
+        return os.path.join(self.blob_path, digest[:2], f"{digest}.gz")
+
+    def store(self, content, url, source, run_timestamp=None, encoding=None):
+        """封存一份原始內容，回傳索引記錄（encoding 為內容的編碼，未知時為 None）"""
+        digest = hashlib.sha256(content).hexdigest()
+        blob_file = self._blob_file(digest)
+        deduplicated = os.path.exists(blob_file)
+
+        if not deduplicated:
+            os.makedirs(os.path.dirname(blob_file), exist_ok=True)
+            tmp_file = blob_file + '.tmp'
+            with gzip.open(tmp_file, 'wb', compresslevel=9) as f:
+                f.write(content)
+            os.replace(tmp_file, blob_file)
+
+        entry = {
+            'run_timestamp': run_timestamp or datetime.now().strftime('%Y%m%d_%H%M%S'),
+            'source': source,
+            'url': url,
+            'sha256': digest,
+            'size': len(content),
+            'encoding': encoding,
+            'stored_at': datetime.now().isoformat()
+        }
+        with open(self.index_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+        entry['deduplicated'] = deduplicated
+        return entry
+
+    def load(self, digest):
+        """讀取 blob 原始內容"""
+        with gzip.open(self._blob_file(digest), 'rb') as f:
+            return f.read()
+
+    def entries(self, source=None, since=None, until=None):
+        """依來源與執行時間戳（YYYYMMDD_HHMMSS，含頭尾）篩選索引記錄"""
+        if not os.path.exists(self.index_path):
+            return
+
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if source and entry['source'] != source:
+                    continue
+                if since and entry['run_timestamp'] < since:
+                    continue
+                if until and entry['run_timestamp'] > until:
+                    continue
+                yield entry
+
+    def iter_snapshots(self, source=None, since=None, until=None):
+        """逐一取出符合條件的快照 (索引記錄, 原始內容)"""
+        for entry in self.entries(source, since, until):
+            yield entry, self.load(entry['sha256'])
+
+    def stats(self):
+        """封存區統計：快照數、實際 blob 數與壓縮前後大小"""
+        snapshots = 0
+        raw_bytes = 0
+        digests = {}
+        for entry in self.entries():
+            snapshots += 1
+            raw_bytes += entry['size']
+            digests[entry['sha256']] = entry['size']
+
+        stored_bytes = sum(
+            os.path.getsize(self._blob_file(digest))
+            for digest in digests if os.path.exists(self._blob_file(digest))
+        )
+        return {
+            'snapshots': snapshots,
+            'blobs': len(digests),
+            'raw_bytes': raw_bytes,
+            'stored_bytes': stored_bytes
+        }
+
+    def import_legacy_html(self, data_path, source='dot_rulings', remove=False):
+        """將舊版每次執行產生的 mof_rulings_<時間戳>.html 匯入封存區，已匯入的快照會略過"""
+        archived = {(entry['run_timestamp'], entry['sha256']) for entry in self.entries(source)}
+
+        imported, found = 0, 0
+        for name in sorted(os.listdir(data_path)):
+            if not (name.startswith('mof_rulings_') and name.endswith('.html')):
+                continue
+            found += 1
+
+            file_path = os.path.join(data_path, name)
+            run_timestamp = name[len('mof_rulings_'):-len('.html')]
+            with open(file_path, 'rb') as f:
+                content = f.read()
+            if (run_timestamp, hashlib.sha256(content).hexdigest()) not in archived:
+                self.store(content, None, source, run_timestamp)
+                imported += 1
+
+            if remove:
+                os.remove(file_path)
+
+        print(f"✓ 匯入 {imported} 個舊版HTML檔案（共找到 {found} 個）")
+        return imported
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='原始網頁封存區統計')
+    parser.add_argument('--import-legacy', action='store_true',
+                        help='先匯入 data/ 下的舊版 mof_rulings_*.html')
+    parser.add_argument('--remove', action='store_true', help='匯入後刪除原檔')
+    args = parser.parse_args()
+
+    archive = RawArchive()
+    if args.import_legacy:
+        archive.import_legacy_html(os.path.dirname(archive.root), remove=args.remove)
+    stats = archive.stats()
+    print(f"快照數: {stats['snapshots']}, 實際儲存: {stats['blobs']} 份")
+    print(f"原始大小: {stats['raw_bytes']:,} bytes, 壓縮後: {stats['stored_bytes']:,} bytes")
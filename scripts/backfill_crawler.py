@@ -0,0 +1,246 @@
+# backfill_crawler.py - 歷史函釋回補爬蟲（可中斷續跑）
+import argparse
+import json
+import sqlite3
+from urllib.parse import urljoin
+
+from database_manager import DEFAULT_BATCH_SIZE, MAX_DETAIL_ATTEMPTS, TaxDatabaseManager
+from date_utils import date_from_text, normalize_date
+from fetch_engine import AsyncFetchEngine
+from rate_limiter import HostRateLimiter
+from ruling_parser import parse_detail, parse_listing
+
+# 賦稅署函釋列表分頁網址（{page} 由 1 起算）
+DEFAULT_LISTING_URL = "https://www.dot.gov.tw/ch/home.jsp?id=30&parentpath=0,1&page={page}"
+
+
+class BackfillCrawler:
+    """逐頁走訪函釋列表與內容頁
+
+    待抓取網址（frontier）與每個工作的進度（checkpoint）存放在同一個
+    SQLite 資料庫，程式中斷後再次執行會從上次完成的頁面繼續；
+    已收錄於 tax_rulings 的網址不會重抓，內容以批次寫入。
+    """
+
+    def __init__(self, db=None, fetcher=None, listing_url=DEFAULT_LISTING_URL,
+                 batch_size=DEFAULT_BATCH_SIZE):
+        self.db = db or TaxDatabaseManager()
+        # 回補時每頁都要解析，不使用條件式請求快取；依主機限速並在持續失敗時斷路
+        self.fetcher = fetcher or AsyncFetchEngine(limiter=HostRateLimiter())
+        self.listing_url = listing_url
+        self.batch_size = batch_size
+        self.conn = sqlite3.connect(self.db.db_path)
+        self.conn.execute('PRAGMA busy_timeout=5000')
+        self.init_tables()
+
+    def init_tables(self):
+        """建立待抓取網址與進度表"""
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS crawl_frontier (
+                url TEXT PRIMARY KEY,
+                job TEXT,
+                kind TEXT,
+                status TEXT DEFAULT 'pending',
+                attempts INTEGER DEFAULT 0,
+                ruling_number TEXT,
+                title TEXT,
+                issue_date TEXT,
+                discovered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                fetched_at TIMESTAMP
+            )
+        ''')
+        self.conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_crawl_frontier_job
+            ON crawl_frontier (job, status)
+        ''')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS crawl_checkpoints (
+                job TEXT PRIMARY KEY,
+                state TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self.conn.commit()
+
+    def load_checkpoint(self, job):
+        """讀取工作進度"""
+        row = self.conn.execute(
+            'SELECT state FROM crawl_checkpoints WHERE job = ?', (job,)
+        ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def save_checkpoint(self, job, state):
+        """儲存工作進度"""
+        self.conn.execute('''
+            INSERT INTO crawl_checkpoints (job, state, updated_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(job) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at
+        ''', (job, json.dumps(state, ensure_ascii=False)))
+        self.conn.commit()
+
+    def reset(self, job):
+        """清除工作進度與待抓取網址，重新開始"""
+        self.conn.execute('DELETE FROM crawl_checkpoints WHERE job = ?', (job,))
+        self.conn.execute('DELETE FROM crawl_frontier WHERE job = ?', (job,))
+        self.conn.commit()
+
+    def enqueue(self, job, entries):
+        """將列表頁找到的函釋加入待抓取清單，回傳實際新增筆數"""
+        urls = [entry['url'] for entry in entries]
+        known = self.db.known_urls(urls)
+        rows = [
+            (entry['url'], job, 'detail', entry['ruling_number'], entry['title'], entry['issue_date'])
+            for entry in entries if entry['url'] not in known
+        ]
+        before = self.conn.total_changes
+        self.conn.executemany('''
+            INSERT OR IGNORE INTO crawl_frontier (url, job, kind, ruling_number, title, issue_date)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', rows)
+        self.conn.commit()
+        return self.conn.total_changes - before
+
+    def run(self, start=None, end=None, max_pages=500, job=None, reset=False):
+        """同步介面：執行回補"""
+        return self.fetcher.run(self.crawl(start, end, max_pages, job, reset))
+
+    async def crawl(self, start=None, end=None, max_pages=500, job=None, reset=False):
+        """回補 start～end（含頭尾，可用西元或民國日期）之間的函釋"""
+        start, end = normalize_date(start), normalize_date(end)
+        job = job or f"dot_rulings:{start or '-'}:{end or '-'}"
+        if reset:
+            self.reset(job)
+
+        state = self.load_checkpoint(job) or {'next_page': 1, 'finished': False}
+        totals = {'pages': 0, 'queued': 0, 'inserted': 0, 'updated': 0,
+                  'unchanged': 0, 'skipped': 0, 'failed': 0, 'deferred': 0}
+        print(f"開始回補: {job}（從第 {state['next_page']} 頁開始）")
+
+        self.db.start_run(f"backfill:{job}")
+        with self.db:
+            while not state['finished'] and state['next_page'] <= max_pages:
+                page = state['next_page']
+                entries, reached_start = await self.crawl_listing_page(page, start, end)
+                if entries is None:
+                    # 抓取失敗：保留進度，下次從這一頁重試
+                    break
+
+                totals['pages'] += 1
+                totals['queued'] += self.enqueue(job, entries)
+                await self.drain_details(job, totals)
+
+                state['next_page'] = page + 1
+                state['finished'] = reached_start
+                self.save_checkpoint(job, state)
+
+            # 處理前次中斷時留下的待抓取網址
+            await self.drain_details(job, totals)
+
+        self.db.finish_run(totals)
+        status = "完成" if state['finished'] else f"暫停於第 {state['next_page']} 頁"
+        print(f"✓ 回補{status}: 列表頁 {totals['pages']} 頁, 新增 {totals['inserted']} 筆, "
+              f"更新 {totals['updated']} 筆, 失敗 {totals['failed']} 筆")
+        if totals['deferred']:
+            print(f"⚠ 主機暫停中，{totals['deferred']} 筆內容頁留待下次回補")
+        return totals
+
+    async def crawl_listing_page(self, page, start, end):
+        """抓取並解析一頁列表，回傳 (日期範圍內的函釋, 是否已超過起始日期)
+
+        抓取失敗時回傳 (None, False)；列表依日期由新到舊排列，
+        頁面沒有函釋或整頁都早於 start 時視為走訪完畢。
+        """
+        url = self.listing_url.format(page=page)
+        result = await self.fetcher.fetch(url)
+        if not result['ok']:
+            print(f"✗ 第 {page} 頁抓取失敗: {result['error']}")
+            return None, False
+
+        rulings = parse_listing(result['text'])['rulings']
+        if not rulings:
+            return [], True
+
+        entries = []
+        older = 0
+        for ruling in rulings:
+            issue_date = date_from_text(ruling['title'])
+            if start and issue_date and issue_date < start:
+                older += 1
+                continue
+            if end and issue_date and issue_date > end:
+                continue
+
+            entries.append({
+                'url': urljoin(url, ruling['url']),
+                'title': ruling['title'],
+                'ruling_number': ruling['ruling_number'],
+                'issue_date': issue_date
+            })
+
+        print(f"✓ 第 {page} 頁: {len(rulings)} 筆函釋, {len(entries)} 筆在日期範圍內")
+        return entries, older == len(rulings)
+
+    async def drain_details(self, job, totals):
+        """抓取此工作所有待處理的內容頁，並以批次寫入資料庫"""
+        pending = self.conn.execute('''
+            SELECT url, ruling_number, title, issue_date, attempts
+            FROM crawl_frontier
+            WHERE job = ? AND kind = 'detail' AND status = 'pending'
+            ORDER BY discovered_at
+        ''', (job,)).fetchall()
+
+        for offset in range(0, len(pending), self.batch_size):
+            chunk = pending[offset:offset + self.batch_size]
+            results = await self.fetcher.fetch_all([row[0] for row in chunk])
+
+            rulings, done, failed = [], [], []
+            for (url, number, title, issue_date, attempts), result in zip(chunk, results):
+                if result['circuit_open']:
+                    # 主機暫停中：維持待處理，不累計嘗試次數
+                    totals['deferred'] += 1
+                    continue
+                if not result['ok']:
+                    attempts += 1
+                    status = 'failed' if attempts >= MAX_DETAIL_ATTEMPTS else 'pending'
+                    failed.append((attempts, status, url))
+                    continue
+
+                detail = parse_detail(result['text'])
+                rulings.append({
+                    'ruling_number': number or detail['ruling_number'],
+                    'title': title,
+                    'content': detail['content'],
+                    'source': '賦稅署函釋回補',
+                    'issue_date': issue_date or detail['issue_date'],
+                    'url': url
+                })
+                done.append((url,))
+
+            # 先寫入函釋再標記完成；中途中斷時重抓也不會重複寫入，寫入失敗時維持待處理
+            counts = self.db.insert_rulings_bulk(rulings, self.batch_size)
+            for key in ('inserted', 'updated', 'unchanged', 'skipped'):
+                totals[key] += counts[key]
+            if counts['failed']:
+                done = []
+            totals['failed'] += sum(1 for _, status, _ in failed if status == 'failed')
+
+            self.conn.executemany('''
+                UPDATE crawl_frontier SET status = 'done', fetched_at = CURRENT_TIMESTAMP
+                WHERE url = ?
+            ''', done)
+            self.conn.executemany('''
+                UPDATE crawl_frontier SET attempts = ?, status = ? WHERE url = ?
+            ''', failed)
+            self.conn.commit()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='回補歷史函釋')
+    parser.add_argument('--start', help='起始日期（YYYY-MM-DD 或民國 113/10/14）')
+    parser.add_argument('--end', help='結束日期（YYYY-MM-DD 或民國 113/10/14）')
+    parser.add_argument('--max-pages', type=int, default=500, help='最多走訪的列表頁數')
+    parser.add_argument('--reset', action='store_true', help='捨棄先前進度重新開始')
+    args = parser.parse_args()
+
+    crawler = BackfillCrawler()
+    crawler.run(args.start, args.end, args.max_pages, reset=args.reset)
+    crawler.fetcher.limiter.report()
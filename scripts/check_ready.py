@@ -1,28 +1,7 @@
-# check_ready.py - 檢查系統是否準備好
+# check_ready.py - 檢查系統是否準備好（以 find_spec 檢查，不實際載入套件）
 import sys
 
-print("檢查稅務爬蟲系統...")
-print("-" * 40)
+from tax_monitor import cmd_check
 
-required = {
-    'requests': '網頁下載',
-    'bs4': '網頁解析', 
-    'pandas': '資料處理',
-    'jieba': '中文分詞',
-    'chardet': '編碼偵測'
-}
-
-all_ready = True
-for module, purpose in required.items():
-    try:
-        __import__(module)
-        print(f"✓ {module:15} - {purpose}")
-    except ImportError:
-        print(f"✗ {module:15} - {purpose} [需要安裝]")
-        all_ready = False
-
-print("-" * 40)
-if all_ready:
-    print("✅ 系統準備完成！可以開始爬蟲了")
-else:
-    print("❌ 請先安裝缺少的套件")
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(cmd_check(None))
\ No newline at end of file
@@ -1,21 +1,181 @@
 # database_manager.py - 稅務資料庫管理系統
 import sqlite3
+import hashlib
 import json
 import os
+import re
+from contextlib import contextmanager
 from datetime import datetime
 
+import metrics
+from date_utils import normalize_date
+from near_duplicate import BAND_BITS, BAND_MASK, SIMHASH_BANDS, find_near_duplicate, simhash
+from ruling_number import canonical_ruling_number
+
+# 批次寫入時每個交易的預設筆數
+DEFAULT_BATCH_SIZE = 500
+
+# 中文連續區段與英數字詞（含全形英數）
+CJK_RUN_PATTERN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+TOKEN_PATTERN = re.compile(
+    r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[0-9A-Za-z\uff10-\uff19\uff21-\uff3a\uff41-\uff5a]+'
+)
+
+# 搜尋摘要在命中處前後保留的字數
+SNIPPET_CONTEXT = 30
+
+# 彙總表的月份鍵（YYYY-MM），發布日期不是 ISO 格式時歸入空字串
+SUMMARY_MONTH_SQL = (
+    "CASE WHEN {row}.issue_date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]*' "
+    "THEN substr({row}.issue_date, 1, 7) ELSE '' END"
+)
+
+# 報告中列出的近期月份數
+REPORT_MONTHS = 12
+
+# 內容頁抓取失敗（或擷取不到內文）超過此次數後不再嘗試
+MAX_DETAIL_ATTEMPTS = 3
+
+# 尚無內文的條件（與部分索引的條件相同，查詢才會使用該索引）
+MISSING_CONTENT_SQL = "(content IS NULL OR content = '')"
+
+
+def segment_cjk(text, trailing=False):
+    """將文字切為二字組（bigram）詞元，供 FTS5 以空白斷詞建立索引
+
+    中文連續區段切成重疊二字組，例如「交際費」→「交際 際費」，
+    英數字則保留整個詞，使片語查詢等同於子字串比對。
+    建立索引時 trailing 為 True，每個中文區段再加上最後一個字
+    （「交際 際費 費」），單字查詢才能找到只出現在區段結尾的字。
+    """
+    tokens = []
+    for run in TOKEN_PATTERN.findall(text or ''):
+        if len(run) > 1 and CJK_RUN_PATTERN.fullmatch(run):
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            if trailing:
+                tokens.append(run[-1])
+        else:
+            tokens.append(run)
+    return ' '.join(tokens)
+
+
+def ruling_hash(row):
+    """計算函釋資料列正規化後的雜湊值（忽略空白差異），用於判斷內容是否變更"""
+    normalized = '\x1f'.join(' '.join(str(value).split()) if value is not None else ''
+                              for value in row)
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def content_digest(row):
+    """函釋資料列（字號, 標題, 內文, 來源, 發布日期, 網址, ...）的內容雜湊
+
+    不含來源與網址：同一則函釋由不同來源收錄時雜湊相同，不會被視為變更。
+    """
+    return ruling_hash((row[0], row[1], row[2], row[4]))
+
+
+def build_fts_query(keyword):
+    """將使用者關鍵字轉為 FTS5 查詢字串（多個詞以 AND 結合）"""
+    phrases = []
+    for term in (keyword or '').split():
+        segmented = segment_cjk(term)
+        if not segmented:
+            continue
+        phrase = '"' + segmented.replace('"', '""') + '"'
+        # 單一中文字以前綴查詢比對二字組開頭與區段結尾的單字
+        if len(segmented) == 1 and CJK_RUN_PATTERN.fullmatch(segmented):
+            phrase += '*'
+        phrases.append(phrase)
+    return ' AND '.join(phrases)
+
+
+def make_snippet(text, keyword, context=SNIPPET_CONTEXT):
+    """擷取關鍵字附近的文字並以【】標示命中處"""
+    if not text:
+        return ''
+
+    terms = [term for term in (keyword or '').split() if term]
+    positions = [pos for pos in (text.find(term) for term in terms) if pos >= 0]
+    start = max(min(positions) - context, 0) if positions else 0
+    end = min(start + context * 2 + max((len(term) for term in terms), default=0), len(text))
+
+    snippet = text[start:end]
+    for term in terms:
+        snippet = snippet.replace(term, f'【{term}】')
+    prefix = '…' if start > 0 else ''
+    suffix = '…' if end < len(text) else ''
+    return f'{prefix}{snippet}{suffix}'
+
 class TaxDatabaseManager:
-    def __init__(self):
+    def __init__(self, db_path=None):
         # Use the project directory (parent of scripts folder)
         self.base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        self.db_path = os.path.join(self.base_path, "data", "tax_monitor.db")
+        self.db_path = db_path or os.path.join(self.base_path, "data", "tax_monitor.db")
         # Ensure data directory exists
-        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        # 持續連線（由 open()/close() 或 with 區塊管理）
+        self._conn = None
+        # 目前的收集批次編號，寫入 change_log 時使用
+        self.run_id = None
         self.init_database()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # 區塊中途發生例外時放棄尚未提交的寫入，未結束的收集批次也不再沿用
+        if exc_type is not None:
+            self.run_id = None
+        self.close(commit=exc_type is None)
+
+    def _connect(self):
+        """建立連線"""
+        conn = sqlite3.connect(self.db_path)
+        # 讓 INSERT OR REPLACE 刪除舊資料時也觸發 DELETE 觸發程序
+        conn.execute('PRAGMA recursive_triggers=ON')
+        return conn
+
+    def open(self):
+        """開啟持續連線，大量寫入時重複使用"""
+        if self._conn is None:
+            conn = self._connect()
+            # WAL 模式下 NORMAL 同步即可保證一致性，並大幅減少 fsync
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA temp_store=MEMORY')
+            conn.execute('PRAGMA cache_size=-20000')
+            conn.execute('PRAGMA busy_timeout=5000')
+            self._conn = conn
+        return self._conn
+
+    def close(self, commit=True):
+        """關閉持續連線（commit 為 False 時回復尚未提交的寫入）"""
+        if self._conn is not None:
+            if commit:
+                self._conn.commit()
+            else:
+                self._conn.rollback()
+            self._conn.close()
+            self._conn = None
+
+    @contextmanager
+    def _connection(self):
+        """取得連線：已開啟持續連線時沿用，否則建立一次性連線"""
+        if self._conn is not None:
+            yield self._conn
+            return
+
+        conn = self._connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
         
     def init_database(self):
         """初始化資料庫"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
+        # WAL 設定會保存在資料庫檔案中，讀取者不會被寫入者阻擋
+        conn.execute('PRAGMA journal_mode=WAL')
         cursor = conn.cursor()
         
         # 建立函釋表
@@ -59,77 +219,1053 @@ class TaxDatabaseManager:
         ''')
         
         conn.commit()
+        self._apply_migrations(conn)
         conn.close()
         print("✓ 資料庫初始化完成")
+
+    def _apply_migrations(self, conn):
+        """依 PRAGMA user_version 依序套用尚未執行的結構遷移"""
+        migrations = [
+            self._migrate_fts_index,
+            self._migrate_change_tracking,
+            self._migrate_url_index,
+            self._migrate_enrichment,
+            self._migrate_indexes_and_summary,
+            self._migrate_issue_dates,
+            self._migrate_near_duplicates,
+            self._migrate_change_counter,
+            self._migrate_detail_tracking,
+            self._migrate_fts_pending,
+            self._migrate_canonical_numbers,
+            self._migrate_content_digest,
+            self._migrate_simhash_boilerplate,
+        ]
+
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for number, migration in enumerate(migrations[version:], start=version + 1):
+            with conn:
+                migration(conn)
+                conn.execute(f'PRAGMA user_version={number}')
+            print(f"✓ 資料庫結構已升級至第 {number} 版")
+
+        # 其他工具（sqlite3 指令列等）直接修改的函釋在此補上索引
+        with conn:
+            self._sync_fts(conn)
+
+    def _migrate_fts_index(self, conn):
+        """建立函釋全文索引（索引同步與既有資料的索引由第 10 版建立）"""
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS tax_rulings_fts
+            USING fts5(title, content, tokenize='unicode61')
+        ''')
+        
+    def _migrate_change_tracking(self, conn):
+        """加入內容雜湊、收集批次表與 change_log 的批次索引"""
+        conn.execute('ALTER TABLE tax_rulings ADD COLUMN content_hash TEXT')
+        conn.execute('ALTER TABLE tax_rulings ADD COLUMN updated_date TIMESTAMP')
+        conn.execute('ALTER TABLE change_log ADD COLUMN run_id INTEGER')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS collection_runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                label TEXT,
+                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP,
+                stats TEXT
+            )
+        ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_change_log_run
+            ON change_log (run_id, change_type)
+        ''')
+
+        rows = conn.execute('''
+            SELECT id, ruling_number, title, content, source, issue_date, url
+            FROM tax_rulings
+        ''').fetchall()
+        conn.executemany(
+            'UPDATE tax_rulings SET content_hash = ? WHERE id = ?',
+            [(ruling_hash(row[1:]), row[0]) for row in rows]
+        )
+
+    def _migrate_url_index(self, conn):
+        """為網址建立索引，供回補爬蟲判斷是否已收錄"""
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_tax_rulings_url ON tax_rulings (url)
+        ''')
+
+    def _migrate_enrichment(self, conn):
+        """加入關鍵字、分類欄位，以及記錄分析時內容雜湊的欄位"""
+        conn.execute('ALTER TABLE tax_rulings ADD COLUMN keywords TEXT')
+        conn.execute('ALTER TABLE tax_rulings ADD COLUMN category TEXT')
+        conn.execute('ALTER TABLE tax_rulings ADD COLUMN enriched_hash TEXT')
+
+    def _migrate_indexes_and_summary(self, conn):
+        """建立常用欄位索引，以及由觸發程序維護的筆數與彙總表"""
+        for column in ('issue_date', 'scraped_date', 'source'):
+            conn.execute(f'''
+                CREATE INDEX IF NOT EXISTS idx_tax_rulings_{column} ON tax_rulings ({column})
+            ''')
+
+        # 各資料表筆數
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS table_counts (
+                table_name TEXT PRIMARY KEY,
+                count INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        for table in ('tax_rulings', 'tax_news'):
+            conn.execute(f'''
+                INSERT OR REPLACE INTO table_counts (table_name, count)
+                SELECT '{table}', COUNT(*) FROM {table}
+            ''')
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_count_insert
+                AFTER INSERT ON {table} BEGIN
+                    UPDATE table_counts SET count = count + 1 WHERE table_name = '{table}';
+                END
+            ''')
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_count_delete
+                AFTER DELETE ON {table} BEGIN
+                    UPDATE table_counts SET count = count - 1 WHERE table_name = '{table}';
+                END
+            ''')
+
+        # 函釋依來源、分類、月份彙總
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS ruling_summary (
+                source TEXT NOT NULL,
+                category TEXT NOT NULL,
+                month TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (source, category, month)
+            ) WITHOUT ROWID
+        ''')
+        self._create_summary_triggers(conn)
+        self._rebuild_summary(conn)
+
+    def _create_summary_triggers(self, conn):
+        """建立維護 ruling_summary 的觸發程序"""
+        new_key = f"COALESCE(new.source, ''), COALESCE(new.category, ''), {SUMMARY_MONTH_SQL.format(row='new')}"
+        old_match = (
+            "source = COALESCE(old.source, '') AND category = COALESCE(old.category, '') "
+            f"AND month = {SUMMARY_MONTH_SQL.format(row='old')}"
+        )
+        add_new = f'''
+            INSERT INTO ruling_summary (source, category, month, count)
+            VALUES ({new_key}, 1)
+            ON CONFLICT (source, category, month) DO UPDATE SET count = count + 1;
+        '''
+        remove_old = f"UPDATE ruling_summary SET count = count - 1 WHERE {old_match};"
+
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS tax_rulings_summary_insert
+            AFTER INSERT ON tax_rulings BEGIN {add_new} END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS tax_rulings_summary_delete
+            AFTER DELETE ON tax_rulings BEGIN {remove_old} END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS tax_rulings_summary_update
+            AFTER UPDATE OF source, category, issue_date ON tax_rulings BEGIN
+                {remove_old}
+                {add_new}
+            END
+        ''')
+
+    def _rebuild_summary(self, conn):
+        """由 tax_rulings 重新計算彙總表"""
+        conn.execute('DELETE FROM ruling_summary')
+        conn.execute(f'''
+            INSERT INTO ruling_summary (source, category, month, count)
+            SELECT COALESCE(r.source, ''), COALESCE(r.category, ''),
+                   {SUMMARY_MONTH_SQL.format(row='r')}, COUNT(*)
+            FROM tax_rulings r
+            GROUP BY 1, 2, 3
+        ''')
+
+    def _migrate_issue_dates(self, conn):
+        """保留原始發布日期字串，並將 issue_date 統一轉為 ISO 日期
+
+        issue_date 變更會一併更新內容雜湊；已分析過的資料同步更新
+        enriched_hash，避免只因日期格式改變就重新分析。
+        """
+        conn.execute('ALTER TABLE tax_rulings ADD COLUMN issue_date_raw TEXT')
+        conn.execute('UPDATE tax_rulings SET issue_date_raw = issue_date')
+
+        rows = conn.execute('''
+            SELECT id, ruling_number, title, content, source, issue_date, url,
+                   content_hash, enriched_hash
+            FROM tax_rulings
+        ''').fetchall()
+        updates = []
+        for record_id, number, title, content, source, issue_date, url, digest, enriched in rows:
+            normalized = normalize_date(issue_date)
+            if normalized == issue_date:
+                continue
+            new_digest = ruling_hash((number, title, content, source, normalized, url))
+            enriched = new_digest if enriched == digest else enriched
+            updates.append((normalized, new_digest, enriched, record_id))
+
+        # 彙總表由 issue_date 的 UPDATE 觸發程序同步更新
+        conn.executemany('''
+            UPDATE tax_rulings SET issue_date = ?, content_hash = ?, enriched_hash = ?
+            WHERE id = ?
+        ''', updates)
+
+    def _migrate_near_duplicates(self, conn):
+        """加入標題指紋、指紋分段索引與函釋來源表，並為既有資料建立指紋"""
+        conn.execute('ALTER TABLE tax_rulings ADD COLUMN simhash INTEGER')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS simhash_bands (
+                band INTEGER NOT NULL,
+                value INTEGER NOT NULL,
+                ruling_id INTEGER NOT NULL,
+                PRIMARY KEY (band, value, ruling_id)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS ruling_sources (
+                ruling_id INTEGER NOT NULL,
+                source TEXT NOT NULL,
+                url TEXT NOT NULL,
+                title TEXT,
+                first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (ruling_id, source, url)
+            )
+        ''')
+
+        # 指紋分段由觸發程序維護（SQLite 位移運算可直接取出各段）
+        bands = ' UNION ALL '.join(f'SELECT {band} AS band' for band in range(SIMHASH_BANDS))
+        insert_bands = f'''
+            INSERT INTO simhash_bands (band, value, ruling_id)
+            SELECT band, (new.simhash >> (band * {BAND_BITS})) & {BAND_MASK}, new.id
+            FROM ({bands}) WHERE new.simhash IS NOT NULL;
+        '''
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS tax_rulings_simhash_insert
+            AFTER INSERT ON tax_rulings BEGIN {insert_bands} END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS tax_rulings_simhash_update
+            AFTER UPDATE OF simhash ON tax_rulings BEGIN
+                DELETE FROM simhash_bands WHERE ruling_id = old.id;
+                {insert_bands}
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS tax_rulings_simhash_delete
+            AFTER DELETE ON tax_rulings BEGIN
+                DELETE FROM simhash_bands WHERE ruling_id = old.id;
+                DELETE FROM ruling_sources WHERE ruling_id = old.id;
+            END
+        ''')
+
+        rows = conn.execute('SELECT id, title FROM tax_rulings').fetchall()
+        conn.executemany(
+            'UPDATE tax_rulings SET simhash = ? WHERE id = ?',
+            [(simhash(title), record_id) for record_id, title in rows]
+        )
+        conn.execute('''
+            INSERT OR IGNORE INTO ruling_sources (ruling_id, source, url, title, first_seen)
+            SELECT id, COALESCE(source, ''), COALESCE(url, ''), title, scraped_date
+            FROM tax_rulings
+        ''')
+
+    def _migrate_change_counter(self, conn):
+        """建立由觸發程序維護的資料變更計數（快取以此判斷資料是否變動）
+
+        PRAGMA data_version 只反映其他連線的寫入且不會保存，因此另存於 db_meta。
+        """
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS db_meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        conn.execute("INSERT OR IGNORE INTO db_meta (key, value) VALUES ('change_counter', 0)")
+        for table in ('tax_rulings', 'tax_news'):
+            for event in ('INSERT', 'UPDATE', 'DELETE'):
+                conn.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS {table}_change_{event.lower()}
+                    AFTER {event} ON {table} BEGIN
+                        UPDATE db_meta SET value = value + 1 WHERE key = 'change_counter';
+                    END
+                ''')
+
+    def _migrate_detail_tracking(self, conn):
+        """加入發文機關與內容頁嘗試次數，並為尚無內文的函釋建立部分索引"""
+        conn.execute('ALTER TABLE tax_rulings ADD COLUMN authority TEXT')
+        conn.execute('ALTER TABLE tax_rulings ADD COLUMN detail_attempts INTEGER NOT NULL DEFAULT 0')
+        conn.execute(f'''
+            CREATE INDEX IF NOT EXISTS idx_tax_rulings_missing_content
+            ON tax_rulings (id) WHERE {MISSING_CONTENT_SQL}
+        ''')
+
+    def _migrate_fts_pending(self, conn):
+        """全文索引改由 Python 斷詞後寫入，並以待索引表記錄需要更新的函釋
+
+        觸發程序只使用 SQL，不依賴自訂函式，sqlite3 指令列等其他連線也能
+        修改函釋；這些修改在下次 _sync_fts() 時補上索引。
+        """
+        conn.execute('DROP TRIGGER IF EXISTS tax_rulings_fts_insert')
+        conn.execute('DROP TRIGGER IF EXISTS tax_rulings_fts_update')
+        conn.execute('DROP TRIGGER IF EXISTS tax_rulings_fts_delete')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS tax_rulings_fts_pending (
+                ruling_id INTEGER PRIMARY KEY
+            )
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS tax_rulings_fts_pending_insert
+            AFTER INSERT ON tax_rulings BEGIN
+                INSERT OR IGNORE INTO tax_rulings_fts_pending (ruling_id) VALUES (new.id);
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS tax_rulings_fts_pending_update
+            AFTER UPDATE OF title, content ON tax_rulings BEGIN
+                INSERT OR IGNORE INTO tax_rulings_fts_pending (ruling_id) VALUES (new.id);
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS tax_rulings_fts_delete
+            AFTER DELETE ON tax_rulings BEGIN
+                DELETE FROM tax_rulings_fts WHERE rowid = old.id;
+                DELETE FROM tax_rulings_fts_pending WHERE ruling_id = old.id;
+            END
+        ''')
+
+        # 斷詞方式改變（區段結尾加上單字），既有索引全部重建
+        conn.execute('DELETE FROM tax_rulings_fts')
+        conn.execute('INSERT OR IGNORE INTO tax_rulings_fts_pending (ruling_id) SELECT id FROM tax_rulings')
+        self._sync_fts(conn)
+
+    def _migrate_canonical_numbers(self, conn):
+        """將既有字號轉為 ruling_number 模組的標準格式，轉換後相同的函釋合併為一筆
+
+        保留已是標準字號的資料（沒有時保留 id 最小者），其他資料的內文、日期等
+        只補上缺少的欄位，來源紀錄、變更紀錄與通知紀錄改指向保留的資料。
+        """
+        rows = conn.execute('''
+            SELECT id, ruling_number, title FROM tax_rulings WHERE ruling_number IS NOT NULL
+        ''').fetchall()
+        groups = {}
+        for record_id, number, title in rows:
+            groups.setdefault(canonical_ruling_number(number, title), []).append((record_id, number))
+
+        renamed, refilled = {}, set()
+        for target, members in groups.items():
+            if len(members) == 1 and members[0][1] == target:
+                continue
+            keep = next((record_id for record_id, number in members if number == target),
+                        min(record_id for record_id, _ in members))
+            for record_id, _ in members:
+                if record_id != keep and self._merge_ruling(conn, keep, record_id):
+                    refilled.add(keep)
+            renamed[keep] = target
+        if not renamed:
+            return
+
+        # 先清除再寫入，避免字號互換時違反唯一限制
+        conn.executemany('UPDATE tax_rulings SET ruling_number = NULL WHERE id = ?',
+                         [(record_id,) for record_id in renamed])
+        conn.executemany('UPDATE tax_rulings SET ruling_number = ? WHERE id = ?',
+                         [(number, record_id) for record_id, number in renamed.items()])
+        self._refresh_hashes(conn, list(renamed), refilled)
+        print(f"✓ 已轉換 {len(renamed)} 筆字號，合併 {len(rows) - len(groups)} 筆重複函釋")
+
+    def _migrate_content_digest(self, conn):
+        """內容雜湊改為不含來源與網址（content_digest），重新計算既有資料的雜湊"""
+        ids = [row[0] for row in conn.execute('SELECT id FROM tax_rulings')]
+        self._refresh_hashes(conn, ids)
+
+    def _migrate_simhash_boilerplate(self, conn):
+        """標題套語的判斷改變，重新計算既有資料的標題指紋（分段索引由觸發程序同步）"""
+        updates = []
+        for record_id, title, old_fingerprint in conn.execute('SELECT id, title, simhash FROM tax_rulings'):
+            fingerprint = simhash(title)
+            if fingerprint != old_fingerprint:
+                updates.append((fingerprint, record_id))
+        conn.executemany('UPDATE tax_rulings SET simhash = ? WHERE id = ?', updates)
+
+    def _merge_ruling(self, conn, keep, duplicate):
+        """將 duplicate 合併到 keep（只補上 keep 缺少的欄位）後刪除 duplicate，回傳內文是否改變"""
+        before = conn.execute('SELECT content FROM tax_rulings WHERE id = ?', (keep,)).fetchone()[0]
+        conn.execute(f'''
+            UPDATE tax_rulings SET
+                content = CASE WHEN {MISSING_CONTENT_SQL}
+                               THEN (SELECT content FROM tax_rulings WHERE id = :duplicate)
+                               ELSE content END,
+                issue_date = COALESCE(issue_date, (SELECT issue_date FROM tax_rulings WHERE id = :duplicate)),
+                issue_date_raw = COALESCE(issue_date_raw,
+                                          (SELECT issue_date_raw FROM tax_rulings WHERE id = :duplicate)),
+                authority = COALESCE(authority, (SELECT authority FROM tax_rulings WHERE id = :duplicate))
+            WHERE id = :keep
+        ''', {'keep': keep, 'duplicate': duplicate})
+        conn.execute('''
+            INSERT OR IGNORE INTO ruling_sources (ruling_id, source, url, title, first_seen)
+            SELECT ?, source, url, title, first_seen FROM ruling_sources WHERE ruling_id = ?
+        ''', (keep, duplicate))
+        conn.execute('''
+            UPDATE change_log SET record_id = ? WHERE table_name = 'tax_rulings' AND record_id = ?
+        ''', (keep, duplicate))
+        # 通知紀錄表由 watchlist 模組建立，尚未使用關注字詞時不存在
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'watchlist_alerts'").fetchone():
+            conn.execute('UPDATE OR IGNORE watchlist_alerts SET ruling_id = ? WHERE ruling_id = ?',
+                         (keep, duplicate))
+            conn.execute('DELETE FROM watchlist_alerts WHERE ruling_id = ?', (duplicate,))
+        conn.execute('DELETE FROM tax_rulings WHERE id = ?', (duplicate,))
+        return conn.execute('SELECT content FROM tax_rulings WHERE id = ?', (keep,)).fetchone()[0] != before
+
+    def _refresh_hashes(self, conn, ids, reanalyze=()):
+        """重新計算內容雜湊；已分析過的資料同步更新分析時的雜湊，不必重新分析
+
+        reanalyze 中的函釋（例如合併後補上了內文）保留原本的分析雜湊，之後會重新分析。
+        """
+        for start in range(0, len(ids), DEFAULT_BATCH_SIZE):
+            chunk = ids[start:start + DEFAULT_BATCH_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            rows = conn.execute(f'''
+                SELECT id, ruling_number, title, content, source, issue_date, url,
+                       content_hash, enriched_hash
+                FROM tax_rulings WHERE id IN ({placeholders})
+            ''', chunk).fetchall()
+            updates = []
+            for record_id, *row, digest, enriched in rows:
+                new_digest = content_digest(row)
+                if enriched == digest and record_id not in reanalyze:
+                    enriched = new_digest
+                updates.append((new_digest, enriched, record_id))
+            conn.executemany(
+                'UPDATE tax_rulings SET content_hash = ?, enriched_hash = ? WHERE id = ?', updates
+            )
+
+    def _sync_fts(self, conn):
+        """將待索引表中的函釋斷詞後寫入全文索引（由呼叫端負責交易）"""
+        rows = conn.execute('''
+            SELECT p.ruling_id, r.title, r.content
+            FROM tax_rulings_fts_pending p
+            JOIN tax_rulings r ON r.id = p.ruling_id
+        ''').fetchall()
+        if not rows:
+            return 0
+
+        conn.executemany('DELETE FROM tax_rulings_fts WHERE rowid = ?',
+                         [(record_id,) for record_id, _, _ in rows])
+        conn.executemany(
+            'INSERT INTO tax_rulings_fts (rowid, title, content) VALUES (?, ?, ?)',
+            [(record_id, segment_cjk(title, trailing=True), segment_cjk(content, trailing=True))
+             for record_id, title, content in rows]
+        )
+        conn.execute('DELETE FROM tax_rulings_fts_pending')
+        return len(rows)
+
+    def start_run(self, label):
+        """開始一個收集批次，之後的寫入都會記錄在此批次下"""
+        with self._connection() as conn:
+            cursor = conn.execute(
+                'INSERT INTO collection_runs (label) VALUES (?)', (label,)
+            )
+            conn.commit()
+            self.run_id = cursor.lastrowid
+        return self.run_id
+
+    def finish_run(self, stats=None):
+        """結束目前的收集批次並記錄統計"""
+        if self.run_id is None:
+            return None
+
+        run_id = self.run_id
+        with self._connection() as conn:
+            conn.execute('''
+                UPDATE collection_runs SET finished_at = CURRENT_TIMESTAMP, stats = ?
+                WHERE id = ?
+            ''', (json.dumps(stats or {}, ensure_ascii=False), run_id))
+            conn.commit()
+        self.run_id = None
+        return run_id
+
+    def changes_since(self, run_id, until_run=None, with_content=False):
+        """查詢第 run_id 批次之後（至 until_run 為止）新增或變更的函釋"""
+        until = 'AND c.run_id <= ?' if until_run is not None else ''
+        params = (run_id, until_run) if until_run is not None else (run_id,)
+        return self._changes(f'c.run_id > ? {until}', params, with_content)
+
+    def changes_after(self, change_id, with_content=False):
+        """查詢變更紀錄編號 change_id 之後新增或變更的函釋
+
+        寫入由 SQLite 依序執行，之後提交的紀錄編號一定較大；以編號為進度時，
+        尚未結束的收集批次在進度之後提交的變更下次仍會查到。
+        """
+        return self._changes('c.id > ?', (change_id,), with_content)
+
+    def _changes(self, condition, params, with_content):
+        content = ', r.id AS ruling_id, r.content' if with_content else ''
+        with self._connection() as conn:
+            cursor = conn.execute(f'''
+                SELECT c.id AS change_id, c.run_id, c.change_type, c.change_date,
+                       r.ruling_number, r.title, r.issue_date, r.url{content}
+                FROM change_log c
+                JOIN tax_rulings r ON r.id = c.record_id
+                WHERE {condition} AND c.change_type IN ('new', 'modified')
+                  AND c.table_name = 'tax_rulings'
+                ORDER BY c.id
+            ''', params)
+            columns = [col[0] for col in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        
+    def known_urls(self, urls):
+        """回傳 urls 中已收錄於 tax_rulings 的網址集合"""
+        urls = list(urls)
+        known = set()
+        with self._connection() as conn:
+            for start in range(0, len(urls), DEFAULT_BATCH_SIZE):
+                chunk = urls[start:start + DEFAULT_BATCH_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                cursor = conn.execute(
+                    f'SELECT url FROM tax_rulings WHERE url IN ({placeholders})', chunk
+                )
+                known.update(row[0] for row in cursor)
+        return known
+        
+    def rulings_needing_enrichment(self):
+        """回傳尚未分析或分析後內容已變更的函釋 id"""
+        with self._connection() as conn:
+            cursor = conn.execute('''
+                SELECT id FROM tax_rulings
+                WHERE enriched_hash IS NULL OR enriched_hash != content_hash
+                ORDER BY id
+            ''')
+            return [row[0] for row in cursor]
+
+    def rulings_missing_content(self, limit=None, max_attempts=MAX_DETAIL_ATTEMPTS):
+        """尚無內文且有網址的函釋（使用部分索引，成本只與缺內文的筆數有關）"""
+        sql = f'''
+            SELECT id, ruling_number, title, issue_date, url FROM tax_rulings
+            WHERE {MISSING_CONTENT_SQL} AND detail_attempts < ? AND url LIKE 'http%'
+            ORDER BY id DESC
+        '''
+        params = [max_attempts]
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+
+        with self._connection() as conn:
+            cursor = conn.execute(sql, params)
+            columns = [col[0] for col in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    @metrics.timed('db_write')
+    def save_ruling_details(self, details, failed_ids=()):
+        """寫入內容頁擷取結果，回傳 {'updated': 筆數, 'failed': 筆數}
+
+        details 為 [{'id', 'content', 'authority', 'ruling_number', 'issue_date'}]；
+        只寫入仍無內文的函釋，內文為空的結果視為失敗。字號與發布日期
+        只補上原本缺少的欄位，字號已被其他函釋使用時不補。
+        """
+        updated, failed = [], list(failed_ids)
+        with self._connection() as conn:
+            with conn:
+                for detail in details:
+                    if not detail.get('content'):
+                        failed.append(detail['id'])
+                        continue
+
+                    issue_date = normalize_date(detail.get('issue_date'))
+                    cursor = conn.execute(f'''
+                        UPDATE tax_rulings
+                        SET content = ?, authority = COALESCE(?, authority),
+                            issue_date = COALESCE(issue_date, ?),
+                            issue_date_raw = COALESCE(issue_date_raw, ?),
+                            detail_attempts = detail_attempts + 1,
+                            updated_date = CURRENT_TIMESTAMP
+                        WHERE id = ? AND {MISSING_CONTENT_SQL}
+                    ''', (detail['content'], detail.get('authority'), issue_date,
+                          detail.get('issue_date'), detail['id']))
+                    if not cursor.rowcount:
+                        continue
+                    if detail.get('ruling_number'):
+                        conn.execute('''
+                            UPDATE tax_rulings SET ruling_number = ?
+                            WHERE id = ? AND ruling_number IS NULL
+                              AND NOT EXISTS (SELECT 1 FROM tax_rulings WHERE ruling_number = ?)
+                        ''', (detail['ruling_number'], detail['id'], detail['ruling_number']))
+                    updated.append(detail['id'])
+
+                conn.executemany(
+                    'UPDATE tax_rulings SET detail_attempts = detail_attempts + 1 WHERE id = ?',
+                    [(record_id,) for record_id in failed]
+                )
+
+                # 內文改變後重新計算內容雜湊，之後的分析會處理這些函釋
+                changes, hashes = [], []
+                for start in range(0, len(updated), DEFAULT_BATCH_SIZE):
+                    chunk = updated[start:start + DEFAULT_BATCH_SIZE]
+                    placeholders = ','.join('?' * len(chunk))
+                    cursor = conn.execute(f'''
+                        SELECT id, ruling_number, title, content, source, issue_date, url
+                        FROM tax_rulings WHERE id IN ({placeholders})
+                    ''', chunk)
+                    for record_id, *row in cursor:
+                        hashes.append((content_digest(row), record_id))
+                        changes.append((record_id, 'modified', row[0]))
+                conn.executemany('UPDATE tax_rulings SET content_hash = ? WHERE id = ?', hashes)
+                self._log_changes(conn, changes, 0)
+                self._sync_fts(conn)
+
+        counts = {'updated': len(updated), 'failed': len(failed)}
+        metrics.count('details_saved', counts['updated'])
+        return counts
+
+    def get_rulings_text(self, ids):
+        """依 id 取得 (id, 標題, 內容, 內容雜湊)"""
+        ids = list(ids)
+        rows = []
+        with self._connection() as conn:
+            for start in range(0, len(ids), DEFAULT_BATCH_SIZE):
+                chunk = ids[start:start + DEFAULT_BATCH_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                cursor = conn.execute(f'''
+                    SELECT id, title, content, content_hash FROM tax_rulings
+                    WHERE id IN ({placeholders})
+                ''', chunk)
+                rows.extend(cursor.fetchall())
+        return rows
+
+    @metrics.timed('db_write')
+    def save_enrichment(self, results):
+        """寫入關鍵字與分類，results 為 [(keywords, category, 內容雜湊, id)]"""
+        with self._connection() as conn:
+            with conn:
+                conn.executemany('''
+                    UPDATE tax_rulings SET keywords = ?, category = ?, enriched_hash = ?
+                    WHERE id = ?
+                ''', [(json.dumps(keywords, ensure_ascii=False), category, digest, record_id)
+                      for keywords, category, digest, record_id in results])
         
     def insert_ruling(self, ruling_data):
-        """插入函釋資料"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """插入函釋資料，回傳 'new'、'modified'、'merged'、'unchanged' 或 None（失敗）
+
+        merged 表示為其他來源已收錄函釋的近似重複，只新增來源紀錄。
+        """
+        counts = {'inserted': 0, 'updated': 0, 'merged': 0, 'unchanged': 0, 'skipped': 0, 'failed': 0}
+
+        with self._connection() as conn:
+            self._write_ruling_batch(conn, [self._ruling_row(ruling_data)], counts)
+        metrics.recorder.count_rows(counts)
+
+        if counts['inserted']:
+            outcome = 'new'
+        elif counts['updated']:
+            outcome = 'modified'
+        elif counts['merged']:
+            outcome = 'merged'
+        elif counts['unchanged']:
+            outcome = 'unchanged'
+        else:
+            return None
+
+        label = ruling_data.get('ruling_number') or ruling_data.get('title') or 'Unknown'
+        print(f"✓ 已儲存函釋: {label} ({outcome})")
+        return outcome
+
+    def insert_rulings_bulk(self, rulings, batch_size=DEFAULT_BATCH_SIZE):
+        """批次寫入函釋資料，回傳新增/更新/合併/未變更/略過/失敗筆數
+
+        rulings 可為任何可迭代物件（包含 generator），資料依 batch_size
+        分批以 executemany 寫入，每一批為一個交易。只有雜湊值改變的資料
+        才會實際寫入；沒有字號的資料以標題近似比對合併到既有函釋，
+        其他來源已收錄的函釋只新增來源紀錄。
+        交易失敗的批次計入 failed（其餘批次仍會寫入），呼叫端可據此決定是否記錄進度。
+        """
+        counts = {'inserted': 0, 'updated': 0, 'merged': 0, 'unchanged': 0, 'skipped': 0, 'failed': 0}
+        batch = []
+
+        with self._connection() as conn:
+            for ruling_data in rulings:
+                batch.append(self._ruling_row(ruling_data))
+                if len(batch) >= batch_size:
+                    self._write_ruling_batch(conn, batch, counts)
+                    batch = []
+
+            if batch:
+                self._write_ruling_batch(conn, batch, counts)
+        metrics.recorder.count_rows(counts)
+
+        print(f"✓ 批次寫入完成: 新增 {counts['inserted']} 筆, 更新 {counts['updated']} 筆, "
+              f"合併 {counts['merged']} 筆, 未變更 {counts['unchanged']} 筆, "
+              f"略過 {counts['skipped']} 筆"
+              + (f", 失敗 {counts['failed']} 筆" if counts['failed'] else ''))
+        return counts
+
+    def _ruling_row(self, ruling_data):
+        """將函釋資料轉為資料列（發布日期轉為 ISO 格式，原始字串放在最後一欄）
+
+        內容雜湊只計算前六欄，原始日期字串的格式差異不視為內容變更。
+        """
+        raw_date = ruling_data.get('issue_date')
+        return (
+            ruling_data.get('ruling_number') or None,
+            ruling_data.get('title'),
+            ruling_data.get('content'),
+            ruling_data.get('source'),
+            normalize_date(raw_date),
+            ruling_data.get('url'),
+            str(raw_date) if raw_date else None
+        )
+
+    def _lookup_existing(self, conn, numbers):
+        """依字號查詢既有資料的 id 與雜湊值"""
+        existing = {}
+        for start in range(0, len(numbers), DEFAULT_BATCH_SIZE):
+            chunk = numbers[start:start + DEFAULT_BATCH_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            cursor = conn.execute(f'''
+                SELECT ruling_number, id, content_hash FROM tax_rulings
+                WHERE ruling_number IN ({placeholders})
+            ''', chunk)
+            for number, record_id, digest in cursor:
+                existing[number] = (record_id, digest)
+        return existing
+
+    def _existing_fields(self, conn, ids):
+        """查詢既有函釋的欄位 {id: (標題, 內文, 來源, 發布日期, 網址, 原始日期字串)}"""
+        fields = {}
+        for start in range(0, len(ids), DEFAULT_BATCH_SIZE):
+            chunk = ids[start:start + DEFAULT_BATCH_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            cursor = conn.execute(f'''
+                SELECT id, title, content, source, issue_date, url, issue_date_raw FROM tax_rulings
+                WHERE id IN ({placeholders})
+            ''', chunk)
+            for record_id, *values in cursor:
+                fields[record_id] = values
+        return fields
+
+    def _merge_row(self, row, fields):
+        """將新資料列與既有函釋合併，回傳要寫入的資料列
+
+        函釋由最先收錄的來源擁有：只有同一來源才會更新標題與網址，其他來源
+        只記錄於 ruling_sources。內文只在原本沒有時補上（避免RSS摘要覆寫
+        內容頁擷取的全文），發布日期由擁有的來源更新，其他來源只補上缺少的日期。
+        """
+        title, content, source, issue_date, url, issue_date_raw = fields
+        owner = (row[3] or '') == (source or '')
+        if owner:
+            title, url = row[1] or title, row[5] or url
+        if not content and owner:
+            content = row[2]
+        if row[4] and (owner or not issue_date):
+            issue_date, issue_date_raw = row[4], row[6]
+        return (row[0], title, content, source, issue_date, url, issue_date_raw)
+
+    @metrics.timed('db_write')
+    def _write_ruling_batch(self, conn, rows, counts):
+        """以單一交易寫入一批函釋，只寫入新增或雜湊值改變的資料
+
+        有字號者依字號比對，尚未收錄的字號會先找是否有近似的無字號資料可補上
+        字號；沒有字號者以標題指紋比對近似重複，命中時只記錄來源。
+        已收錄的函釋依 _merge_row() 合併，其他來源只新增來源紀錄。
+        """
+        # 同一批次中重複的字號以第一筆為準，其他來源的資料只記錄來源
+        unique_rows, numberless, others = {}, [], []
+        for row in rows:
+            if not row[0]:
+                numberless.append(row)
+            elif row[0] not in unique_rows:
+                unique_rows[row[0]] = row
+            elif (row[3] or '') != (unique_rows[row[0]][3] or ''):
+                others.append((None, row))
+            else:
+                counts['skipped'] += 1
+
+        existing = self._lookup_existing(conn, list(unique_rows))
+        current = self._existing_fields(conn, [existing[number][0] for number in unique_rows
+                                               if number in existing])
+        new_rows, modified_rows, changes, links = [], [], [], []
+        claimed = set()
+        unchanged = 0
+        for number, row in unique_rows.items():
+            if number in existing:
+                record_id, old_digest = existing[number]
+            else:
+                match = find_near_duplicate(conn, simhash(row[1]), numberless_only=True,
+                                            exclude=claimed)
+                if match is None:
+                    new_rows.append(row + (simhash(row[1]), content_digest(row)))
+                    continue
+                record_id, old_digest = match[0], None
+                claimed.add(record_id)
+                current.update(self._existing_fields(conn, [record_id]))
+
+            merged_row = self._merge_row(row, current[record_id])
+            digest = content_digest(merged_row)
+            if old_digest == digest:
+                if merged_row[3] == row[3]:
+                    unchanged += 1
+                    links.append(self._source_link(record_id, row))
+                else:
+                    others.append((record_id, row))
+                continue
         
+            modified_rows.append(merged_row + (simhash(merged_row[1]), digest, record_id))
+            changes.append((record_id, 'modified', number))
+            links.append(self._source_link(record_id, merged_row))
+            if merged_row[3] != row[3]:
+                links.append(self._source_link(record_id, row))
+
+        inserted, merged, skipped = len(new_rows), 0, 0
         try:
-            cursor.execute('''
-                INSERT OR REPLACE INTO tax_rulings 
-                (ruling_number, title, content, source, issue_date, url)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                ruling_data.get('ruling_number'),
-                ruling_data.get('title'),
-                ruling_data.get('content'),
-                ruling_data.get('source'),
-                ruling_data.get('issue_date'),
-                ruling_data.get('url')
-            ))
-            
-            conn.commit()
-            print(f"✓ 已儲存函釋: {ruling_data.get('ruling_number', 'Unknown')}")
-            
-        except Exception as e:
-            print(f"✗ 儲存失敗: {e}")
+            with conn:
+                conn.executemany('''
+                    INSERT INTO tax_rulings
+                    (ruling_number, title, content, source, issue_date, url, issue_date_raw,
+                     simhash, content_hash)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', new_rows)
+                conn.executemany('''
+                    UPDATE tax_rulings
+                    SET ruling_number = ?, title = ?, content = ?, source = ?, issue_date = ?,
+                        url = ?, issue_date_raw = ?, simhash = ?, content_hash = ?,
+                        updated_date = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', modified_rows)
+
+                new_ids = self._lookup_existing(conn, [row[0] for row in new_rows])
+                for row in new_rows:
+                    record_id = new_ids[row[0]][0]
+                    changes.append((record_id, 'new', row[0]))
+                    links.append(self._source_link(record_id, row))
+
+                # 其他來源收錄的同一函釋：只新增來源紀錄
+                numbered = self._lookup_existing(conn, [row[0] for record_id, row in others
+                                                        if record_id is None])
+                for record_id, row in others:
+                    record_id = record_id or numbered[row[0]][0]
+                    if self._add_source_link(conn, record_id, row):
+                        merged += 1
+                    else:
+                        unchanged += 1
+
+                # 無字號資料逐筆處理，同一批次先寫入的資料也能被比對到
+                for row in numberless:
+                    fingerprint = simhash(row[1])
+                    if fingerprint is None:
+                        skipped += 1
+                        continue
+
+                    match = find_near_duplicate(conn, fingerprint)
+                    if match is not None:
+                        if self._add_source_link(conn, match[0], row):
+                            merged += 1
+                        else:
+                            unchanged += 1
+                        continue
+
+                    cursor = conn.execute('''
+                        INSERT INTO tax_rulings
+                        (ruling_number, title, content, source, issue_date, url, issue_date_raw,
+                         simhash, content_hash)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', row + (fingerprint, content_digest(row)))
+                    inserted += 1
+                    changes.append((cursor.lastrowid, 'new', None))
+                    self._add_source_link(conn, cursor.lastrowid, row)
+
+                conn.executemany('''
+                    INSERT OR IGNORE INTO ruling_sources (ruling_id, source, url, title)
+                    VALUES (?, ?, ?, ?)
+                ''', links)
+                self._log_changes(conn, changes, unchanged)
+                self._sync_fts(conn)
+        except sqlite3.Error as e:
+            print(f"✗ 批次儲存失敗: {e}")
+            counts['failed'] += len(unique_rows) + len(numberless) + len(others)
+            return
             
-        finally:
-            conn.close()
+        counts['inserted'] += inserted
+        counts['updated'] += len(modified_rows)
+        counts['merged'] += merged
+        counts['unchanged'] += unchanged
+        counts['skipped'] += skipped
+
+    def _source_link(self, record_id, row):
+        """函釋來源紀錄 (id, 來源, 網址, 標題)"""
+        return (record_id, row[3] or '', row[5] or '', row[1])
+
+    def _add_source_link(self, conn, record_id, row):
+        """新增一筆來源紀錄，回傳是否為新的來源"""
+        cursor = conn.execute('''
+            INSERT OR IGNORE INTO ruling_sources (ruling_id, source, url, title)
+            VALUES (?, ?, ?, ?)
+        ''', self._source_link(record_id, row))
+        return cursor.rowcount > 0
+
+    def _log_changes(self, conn, changes, unchanged):
+        """將新增/變更逐筆記錄於 change_log，未變更者以單筆彙總記錄"""
+        conn.executemany('''
+            INSERT INTO change_log (table_name, record_id, change_type, details, run_id)
+            VALUES ('tax_rulings', ?, ?, ?, ?)
+        ''', [(record_id, change_type,
+               json.dumps({'ruling_number': number}, ensure_ascii=False), self.run_id)
+              for record_id, change_type, number in changes])
+
+        if unchanged:
+            conn.execute('''
+                INSERT INTO change_log (table_name, record_id, change_type, details, run_id)
+                VALUES ('tax_rulings', NULL, 'unchanged', ?, ?)
+            ''', (json.dumps({'count': unchanged}), self.run_id))
     
+    def change_counter(self):
+        """資料變更計數，函釋或新聞有任何新增、修改、刪除時遞增"""
+        with self._connection() as conn:
+            row = conn.execute("SELECT value FROM db_meta WHERE key = 'change_counter'").fetchone()
+        return row[0] if row else 0
+
     def get_statistics(self):
         """取得統計資料"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self._connection() as conn:
+            cursor = conn.cursor()
         
-        stats = {}
+            stats = {}
         
-        # 函釋總數
-        cursor.execute("SELECT COUNT(*) FROM tax_rulings")
-        stats['total_rulings'] = cursor.fetchone()[0]
+            # 函釋與新聞總數（由觸發程序維護，不需掃描資料表）
+            cursor.execute("SELECT table_name, count FROM table_counts")
+            counts = dict(cursor.fetchall())
+            stats['total_rulings'] = counts.get('tax_rulings', 0)
+            stats['total_news'] = counts.get('tax_news', 0)
         
-        # 新聞總數
-        cursor.execute("SELECT COUNT(*) FROM tax_news")
-        stats['total_news'] = cursor.fetchone()[0]
+            # 最新函釋日期（使用 scraped_date 索引）
+            cursor.execute("SELECT MAX(scraped_date) FROM tax_rulings")
+            result = cursor.fetchone()[0]
+            stats['last_update'] = result if result else "尚無資料"
         
-        # 最新函釋日期
-        cursor.execute("SELECT MAX(scraped_date) FROM tax_rulings")
-        result = cursor.fetchone()[0]
-        stats['last_update'] = result if result else "尚無資料"
-        
-        conn.close()
         return stats
+
+    def get_ruling_sources(self, ruling_number):
+        """查詢同一則函釋在各來源的紀錄"""
+        with self._connection() as conn:
+            cursor = conn.execute('''
+                SELECT s.source, s.url, s.title, s.first_seen
+                FROM ruling_sources s
+                JOIN tax_rulings r ON r.id = s.ruling_id
+                WHERE r.ruling_number = ?
+                ORDER BY s.first_seen
+            ''', (ruling_number,))
+            columns = [col[0] for col in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def rulings_between(self, start=None, end=None, limit=None):
+        """查詢發布日期介於 start～end（含頭尾）的函釋，依日期由新到舊排列
+
+        start、end 可為任何 normalize_date 支援的格式，None 表示不限；
+        查詢使用 issue_date 索引。
+        """
+        conditions, params = ['issue_date IS NOT NULL'], []
+        for operator, value in (('>=', start), ('<=', end)):
+            if value is None:
+                continue
+            normalized = normalize_date(value)
+            if normalized is None:
+                raise ValueError(f"無法辨識的日期: {value}")
+            conditions.append(f'issue_date {operator} ?')
+            params.append(normalized)
+
+        sql = f'''
+            SELECT ruling_number, title, source, issue_date, url, category
+            FROM tax_rulings
+            WHERE {' AND '.join(conditions)}
+            ORDER BY issue_date DESC, id DESC
+        '''
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+
+        with self._connection() as conn:
+            cursor = conn.execute(sql, params)
+            columns = [col[0] for col in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def get_breakdown(self, dimension):
+        """依 source、category 或 month 取得函釋筆數分布（讀取彙總表）"""
+        if dimension not in ('source', 'category', 'month'):
+            raise ValueError(f"不支援的統計維度: {dimension}")
+
+        order = 'month DESC' if dimension == 'month' else 'total DESC'
+        with self._connection() as conn:
+            cursor = conn.execute(f'''
+                SELECT {dimension}, SUM(count) AS total FROM ruling_summary
+                GROUP BY {dimension}
+                HAVING total > 0
+                ORDER BY {order}
+            ''')
+            return cursor.fetchall()
     
-    def search_rulings(self, keyword):
-        """搜尋函釋"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def search_rulings(self, keyword, limit=10, offset=0):
+        """搜尋函釋（依 bm25 相關度排序）"""
+        query = build_fts_query(keyword)
+        if not query:
+            return []
+
+        with self._connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT ruling_number, title, issue_date 
-            FROM tax_rulings 
-            WHERE title LIKE ? OR content LIKE ?
-            ORDER BY issue_date DESC
-            LIMIT 10
-        ''', (f'%{keyword}%', f'%{keyword}%'))
-        
-        results = cursor.fetchall()
-        conn.close()
+            # 標題命中的權重高於內文
+            cursor.execute('''
+                SELECT r.ruling_number, r.title, r.issue_date
+                FROM tax_rulings_fts
+                JOIN tax_rulings r ON r.id = tax_rulings_fts.rowid
+                WHERE tax_rulings_fts MATCH ?
+                ORDER BY bm25(tax_rulings_fts, 10.0, 1.0), r.issue_date DESC
+                LIMIT ? OFFSET ?
+            ''', (query, limit, offset))
+        
+            results = cursor.fetchall()
         
         return results
+
+    def search_rulings_page(self, keyword, page=1, page_size=20):
+        """分頁搜尋函釋，回傳總筆數、相關度分數與標示命中處的摘要"""
+        page = max(int(page), 1)
+        result = {'keyword': keyword, 'page': page, 'page_size': page_size,
+                  'total': 0, 'results': []}
+        query = build_fts_query(keyword)
+        if not query:
+            return result
+
+        with self._connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute(
+                'SELECT COUNT(*) FROM tax_rulings_fts WHERE tax_rulings_fts MATCH ?',
+                (query,)
+            )
+            result['total'] = cursor.fetchone()[0]
+
+            cursor.execute('''
+                SELECT r.ruling_number, r.title, r.content, r.issue_date, r.url,
+                       bm25(tax_rulings_fts, 10.0, 1.0) AS score
+                FROM tax_rulings_fts
+                JOIN tax_rulings r ON r.id = tax_rulings_fts.rowid
+                WHERE tax_rulings_fts MATCH ?
+                ORDER BY score, r.issue_date DESC
+                LIMIT ? OFFSET ?
+            ''', (query, page_size, (page - 1) * page_size))
+
+            for number, title, content, issue_date, url, score in cursor.fetchall():
+                result['results'].append({
+                    'ruling_number': number,
+                    'title': title,
+                    'issue_date': issue_date,
+                    'url': url,
+                    # bm25() 越小越相關，轉為正值方便閱讀
+                    'score': round(-score, 4),
+                    'snippet': make_snippet(content or title, keyword)
+                })
+
+        return result
     
     def generate_report(self):
         """生成報告"""
@@ -141,6 +1277,18 @@ class TaxDatabaseManager:
         print(f"函釋總數: {stats['total_rulings']}")
         print(f"新聞總數: {stats['total_news']}")
         print(f"最後更新: {stats['last_update']}")
+
+        stats['by_category'] = self.get_breakdown('category')
+        if stats['by_category']:
+            print("\n依分類:")
+            for category, count in stats['by_category']:
+                print(f"  {category or '未分類':<16}{count:>8}")
+
+        stats['by_month'] = [row for row in self.get_breakdown('month') if row[0]][:REPORT_MONTHS]
+        if stats['by_month']:
+            print(f"\n近 {REPORT_MONTHS} 個月:")
+            for month, count in stats['by_month']:
+                print(f"  {month:<16}{count:>8}")
         print("="*60)
         
         return stats
@@ -0,0 +1,99 @@
+# date_utils.py - 日期正規化（RFC 822、ISO 與民國年格式統一轉為 ISO 日期）
+import re
+from datetime import date, datetime, timedelta, timezone
+
+from ruling_number import normalize_digits
+
+# 民國紀年與西元的差距
+ROC_YEAR_OFFSET = 1911
+
+# 含時區的時間換算為台灣日期
+TAIPEI_TZ = timezone(timedelta(hours=8))
+
+# 「中華民國113年10月14日」、「民國113年10月14日」、「113年10月14日」
+ROC_CHINESE_PATTERN = re.compile(r'(?:(?:中華)?民國)?\s*(?<!\d)(\d{2,3})\s*年\s*(\d{1,2})\s*月\s*(\d{1,2})\s*日')
+
+# 「2024-10-14」、「2024/10/14」、「113/10/14」、「113.10.14」（可接時間）
+# 年份至少三位數，避免把「第12.3.4點」等條次編號當成日期
+NUMERIC_DATE_PATTERN = re.compile(r'(?<!\d)(\d{3,4})[-/.](\d{1,2})[-/.](\d{1,2})(?!\d)')
+
+# 「2024年10月14日」
+WESTERN_CHINESE_PATTERN = re.compile(r'(\d{4})\s*年\s*(\d{1,2})\s*月\s*(\d{1,2})\s*日')
+
+
+def _build_date(year, month, day):
+    """組成 ISO 日期；三位數以下的年份視為民國年，日期不合法時回傳 None"""
+    year, month, day = int(year), int(month), int(day)
+    if year < ROC_YEAR_OFFSET:
+        if year >= 1000:
+            return None
+        year += ROC_YEAR_OFFSET
+    try:
+        return date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+def _parse_rfc822(text):
+    """解析 RSS 常見的 RFC 822 日期（含時區時換算為台灣日期）"""
+    # email 套件載入較慢，只有遇到 RFC 822 日期時才匯入
+    from email.utils import parsedate_to_datetime
+    try:
+        parsed = parsedate_to_datetime(text)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if parsed is None:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(TAIPEI_TZ)
+    return parsed.date().isoformat()
+
+
+def normalize_date(value):
+    """將各種日期表示法轉為 ISO 日期字串（YYYY-MM-DD），無法辨識時回傳 None
+
+    支援 date/datetime 物件、ISO 日期時間、RFC 822（RSS）以及民國年
+    （「民國113年10月14日」、「113/10/14」、「113.10.14」）。
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(TAIPEI_TZ)
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+
+    text = normalize_digits(str(value)).strip()
+    if not text:
+        return None
+
+    # ISO 日期時間（含時區時換算為台灣日期）
+    try:
+        parsed = datetime.fromisoformat(text.replace('Z', '+00:00'))
+    except ValueError:
+        pass
+    else:
+        return normalize_date(parsed)
+
+    for pattern in (WESTERN_CHINESE_PATTERN, ROC_CHINESE_PATTERN):
+        match = pattern.fullmatch(text)
+        if match:
+            return _build_date(*match.groups())
+
+    match = NUMERIC_DATE_PATTERN.match(text)
+    if match:
+        return _build_date(*match.groups())
+
+    return _parse_rfc822(text)
+
+
+def date_from_text(text):
+    """從標題等自由文字中找出第一個日期（ISO 格式），找不到時回傳 None"""
+    text = normalize_digits(text)
+    for pattern in (WESTERN_CHINESE_PATTERN, ROC_CHINESE_PATTERN, NUMERIC_DATE_PATTERN):
+        for match in pattern.finditer(text):
+            result = _build_date(*match.groups())
+            if result:
+                return result
+    return None
@@ -0,0 +1,134 @@
+# detail_fetcher.py - 函釋內容頁抓取（固定數量的工作協程 + 每個主機的速率限制）
+import argparse
+import asyncio
+
+import metrics
+from database_manager import MAX_DETAIL_ATTEMPTS, TaxDatabaseManager
+from fetch_engine import AsyncFetchEngine, HostDegradedError
+from rate_limiter import HostRateLimiter
+from ruling_parser import parse_detail
+
+# 同時抓取的內容頁數
+DEFAULT_WORKERS = 4
+
+# 同一主機兩次請求之間的初始間隔（秒），之後由 HostRateLimiter 依回應調整
+DEFAULT_HOST_INTERVAL = 0.5
+
+# 每累積多少筆結果寫入一次資料庫
+DEFAULT_SAVE_BATCH = 50
+
+
+class DetailFetcher:
+    """抓取尚無內文的函釋內容頁，擷取正文、發文機關、字號與日期
+
+    只處理資料庫中 content 為空的函釋，每次執行的工作量只與新收錄的
+    函釋數有關；擷取不到內文時累計嘗試次數，超過上限後不再抓取。
+    主機斷路中時略過該主機的函釋，不累計嘗試次數。
+    """
+
+    def __init__(self, db=None, fetcher=None, workers=DEFAULT_WORKERS,
+                 host_interval=DEFAULT_HOST_INTERVAL, save_batch=DEFAULT_SAVE_BATCH):
+        self.db = db or TaxDatabaseManager()
+        # 需要完整內容，不使用條件式請求快取；共用抓取引擎時沿用其連線池與速率限制
+        if fetcher is not None:
+            self.fetcher = fetcher.without_cache()
+        else:
+            # host_interval 為速率上限：上次記錄的速率與成功後的加速都不會超過
+            rate = 1 / host_interval
+            self.fetcher = AsyncFetchEngine(limiter=HostRateLimiter(rate=rate, max_rate=rate))
+        self.workers = workers
+        self.save_batch = save_batch
+
+    def run(self, limit=None, max_attempts=MAX_DETAIL_ATTEMPTS):
+        """同步介面：抓取內容頁並寫入資料庫（記錄為一個收集批次）"""
+        with self.db:
+            self.db.start_run('details')
+            counts = self.fetcher.run(self.run_async(limit, max_attempts))
+            self.db.finish_run(counts)
+        return counts
+
+    async def run_async(self, limit=None, max_attempts=MAX_DETAIL_ATTEMPTS):
+        """抓取最多 limit 筆缺內文的函釋，回傳 {'pending', 'updated', 'failed'}"""
+        pending = self.db.rulings_missing_content(limit, max_attempts)
+        counts = {'pending': len(pending), 'updated': 0, 'failed': 0, 'skipped': 0}
+        if not pending:
+            print("✓ 沒有需要抓取內容頁的函釋")
+            return counts
+
+        print(f"抓取 {len(pending)} 筆函釋內容頁（{self.workers} 個工作）")
+        queue = asyncio.Queue(maxsize=self.workers * 2)
+        details, failed = [], []
+
+        def flush():
+            if details or failed:
+                saved = self.db.save_ruling_details(details, failed)
+                counts['updated'] += saved['updated']
+                counts['failed'] += saved['failed']
+                details.clear()
+                failed.clear()
+
+        async def worker():
+            while True:
+                ruling = await queue.get()
+                try:
+                    if ruling is None:
+                        return
+                    try:
+                        detail = await self.fetch_detail(ruling)
+                    except HostDegradedError:
+                        counts['skipped'] += 1
+                        continue
+                    if detail is None:
+                        failed.append(ruling['id'])
+                    else:
+                        details.append(detail)
+                    if len(details) + len(failed) >= self.save_batch:
+                        flush()
+                finally:
+                    queue.task_done()
+
+        tasks = [asyncio.create_task(worker()) for _ in range(self.workers)]
+        for ruling in pending:
+            await queue.put(ruling)
+        for _ in tasks:
+            await queue.put(None)
+        await asyncio.gather(*tasks)
+        flush()
+
+        print(f"✓ 內容頁: 更新 {counts['updated']} 筆, 失敗 {counts['failed']} 筆"
+              + (f", 主機暫停中略過 {counts['skipped']} 筆" if counts['skipped'] else ''))
+        return counts
+
+    async def fetch_detail(self, ruling):
+        """抓取並解析單一內容頁，失敗時回傳 None，主機斷路中時拋出 HostDegradedError"""
+        result = await self.fetcher.fetch(ruling['url'])
+        if result['circuit_open']:
+            raise HostDegradedError(result['error'])
+        if not result['ok'] or not result['content']:
+            print(f"✗ 內容頁抓取失敗: {ruling['url']} ({result['error'] or '無內容'})")
+            return None
+
+        with metrics.timer('parse_detail'):
+            detail = parse_detail(result['text'])
+        metrics.count('details_fetched')
+        return {
+            'id': ruling['id'],
+            'content': detail['content'],
+            'authority': detail['authority'],
+            'ruling_number': detail['ruling_number'],
+            'issue_date': detail['issue_date']
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='抓取尚無內文的函釋內容頁')
+    parser.add_argument('--limit', type=int, help='最多處理的函釋數')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='同時抓取的內容頁數')
+    parser.add_argument('--host-interval', type=float, default=DEFAULT_HOST_INTERVAL,
+                        help='同一主機兩次請求的初始間隔（秒）')
+    args = parser.parse_args()
+
+    fetcher = DetailFetcher(workers=args.workers, host_interval=args.host_interval)
+    fetcher.run(args.limit)
+    fetcher.fetcher.limiter.report()
+    metrics.recorder.export('details')
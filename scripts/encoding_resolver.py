@@ -0,0 +1,176 @@
+# encoding_resolver.py - 回應內容編碼判斷（宣告優先，必要時才以 chardet 偵測開頭片段）
+import codecs
+import re
+
+import metrics
+
+# 編碼別名：標示為 Big5 的網頁實際多含微軟擴充字，以 CP950 解碼；GB2312/GBK 以 GB18030 解碼
+ENCODING_ALIASES = {
+    'big5': 'cp950',
+    'big5-tw': 'cp950',
+    'x-big5': 'cp950',
+    'csbig5': 'cp950',
+    'gb2312': 'gb18030',
+    'gbk': 'gb18030',
+}
+
+# 在內容開頭多少位元組內尋找 <meta charset> 或 XML 宣告
+META_SCAN_BYTES = 4096
+
+# chardet 只分析開頭這麼多位元組（偵測成本不隨頁面大小成長）
+DETECT_PREFIX_BYTES = 32 * 1024
+
+# 位元組順序標記與對應編碼（-sig 解碼時會去掉標記）
+BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+HEADER_CHARSET = re.compile(r'charset\s*=\s*["\']?\s*([\w.:-]+)', re.IGNORECASE)
+
+# <meta charset="..."> 與 <meta http-equiv="Content-Type" content="...; charset=...">
+META_CHARSET = re.compile(rb'<meta[^>]+?charset\s*=\s*["\']?\s*([\w.:-]+)', re.IGNORECASE)
+XML_ENCODING = re.compile(rb'^\s*<\?xml[^>]+?encoding\s*=\s*["\']([\w.:-]+)', re.IGNORECASE)
+
+
+def normalize_encoding(name):
+    """將宣告的編碼名稱轉為 Python 編碼名稱（套用 ENCODING_ALIASES），不認得時回傳 None"""
+    if not name:
+        return None
+    key = name.strip().lower()
+    key = ENCODING_ALIASES.get(key, key)
+    try:
+        key = codecs.lookup(key).name
+    except LookupError:
+        return None
+    return ENCODING_ALIASES.get(key, key)
+
+
+def header_encoding(content_type):
+    """Content-Type 標頭宣告的編碼，沒有宣告或不認得時回傳 None"""
+    match = HEADER_CHARSET.search(content_type or '')
+    return normalize_encoding(match.group(1)) if match else None
+
+
+def to_utf8(content, encoding):
+    """將 encoding 編碼的位元組轉為 UTF-8（已是 UTF-8 或未知編碼時原樣回傳）"""
+    if not encoding or codecs.lookup(encoding).name == 'utf-8':
+        return content
+    return content.decode(encoding, errors='replace').encode('utf-8')
+
+
+def declared_encodings(content, content_type=None):
+    """依可信度產生 (來源, 編碼)：BOM、HTTP 標頭、開頭的 <meta charset> 或 XML 宣告"""
+    for bom, encoding in BOMS:
+        if content.startswith(bom):
+            yield 'bom', encoding
+            return
+
+    encoding = header_encoding(content_type)
+    if encoding:
+        yield 'header', encoding
+
+    head = content[:META_SCAN_BYTES]
+    match = XML_ENCODING.search(head) or META_CHARSET.search(head)
+    if match:
+        encoding = normalize_encoding(match.group(1).decode('ascii', errors='ignore'))
+        if encoding:
+            yield 'meta', encoding
+
+
+class EncodingResolver:
+    """決定回應內容的編碼並解碼（整份內容只完整解碼一次）
+
+    依序採用：BOM、HTTP 標頭的 charset、開頭的 <meta charset>/XML 宣告、
+    嚴格 UTF-8、同一主機先前偵測到的編碼，最後才以 chardet 分析開頭
+    DETECT_PREFIX_BYTES 位元組。宣告的編碼無法解碼時視為宣告錯誤，改用下一個來源。
+
+    嚴格 UTF-8 排在主機快取之前：合法的 UTF-8 中文幾乎不可能是 Big5，
+    反之 Big5 內容在第一個非 ASCII 字元就會解碼失敗，嘗試的成本很低。
+    """
+
+    def __init__(self):
+        # 主機 → 偵測到的編碼（只記錄 chardet 的結果，宣告的編碼每次都重新讀取）
+        self.host_encodings = {}
+        self.stats = {'bom': 0, 'header': 0, 'meta': 0, 'utf-8': 0, 'host': 0,
+                      'detected': 0, 'mismatch': 0}
+
+    def decode(self, content, content_type=None, host=None):
+        """回傳 (編碼, 文字)"""
+        if not content:
+            return 'utf-8', ''
+
+        tried = set()
+        for source, encoding in declared_encodings(content, content_type):
+            if encoding in tried:
+                continue
+            tried.add(encoding)
+            try:
+                text = content.decode(encoding)
+            except UnicodeDecodeError:
+                self.stats['mismatch'] += 1
+                metrics.count('encoding_mismatch')
+                continue
+            self.stats[source] += 1
+            return encoding, text
+
+        if 'utf-8' not in tried:
+            try:
+                text = content.decode('utf-8')
+            except UnicodeDecodeError:
+                pass
+            else:
+                self.stats['utf-8'] += 1
+                return 'utf-8', text
+
+        cached = self.host_encodings.get(host)
+        if cached and cached not in tried:
+            try:
+                text = content.decode(cached)
+            except UnicodeDecodeError:
+                pass
+            else:
+                self.stats['host'] += 1
+                return cached, text
+
+        encoding = self.detect(content)
+        if host is not None:
+            self.host_encodings[host] = encoding
+        return encoding, content.decode(encoding, errors='replace')
+
+    def sniff(self, prefix, content_type=None, host=None):
+        """只依內容開頭判斷編碼（串流讀取時使用，順序與 decode() 相同但不解碼整份內容）"""
+        for source, encoding in declared_encodings(prefix, content_type):
+            self.stats[source] += 1
+            return encoding
+
+        try:
+            # 開頭片段可能在多位元組字元中間截斷，以增量解碼器檢查
+            codecs.getincrementaldecoder('utf-8')().decode(prefix, final=False)
+        except UnicodeDecodeError:
+            pass
+        else:
+            self.stats['utf-8'] += 1
+            return 'utf-8'
+
+        cached = self.host_encodings.get(host)
+        if cached:
+            self.stats['host'] += 1
+            return cached
+
+        encoding = self.detect(prefix)
+        if host is not None:
+            self.host_encodings[host] = encoding
+        return encoding
+
+    def detect(self, content):
+        """以 chardet 分析內容開頭，無法判斷時回傳 'utf-8'"""
+        self.stats['detected'] += 1
+        metrics.count('encoding_detected')
+        try:
+            import chardet  # 載入較慢，只有需要偵測時才匯入
+        except ImportError:
+            return 'utf-8'
+        guess = chardet.detect(content[:DETECT_PREFIX_BYTES]).get('encoding')
+        return normalize_encoding(guess) or 'utf-8'
@@ -0,0 +1,152 @@
+# enrichment.py - 函釋關鍵字擷取與自動分類（jieba 斷詞，多行程批次處理）
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import jieba
+import jieba.analyse
+
+from database_manager import TaxDatabaseManager
+
+# 稅務專有名詞使用者詞典
+USER_DICT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tax_userdict.txt")
+
+# 分類規則：斷詞結果命中越多該類詞彙，分數越高
+CATEGORY_RULES = {
+    '房地合一稅': ['房地合一', '房地合一稅', '房地合一稅2.0', '持有期間'],
+    '遺產及贈與稅': ['遺產稅', '贈與稅', '遺贈稅', '遺產及贈與稅', '被繼承人', '遺產', '贈與'],
+    '營業稅': ['營業稅', '加值型營業稅', '非加值型營業稅', '境外電商', '電子勞務',
+             '電子發票', '統一發票', '稅籍登記', '進項稅額', '銷項稅額'],
+    '營利事業所得稅': ['營利事業所得稅', '營所稅', '營利事業', '交際費', '旅費',
+                '查核準則', '受控外國企業', '移轉訂價'],
+    '綜合所得稅': ['綜合所得稅', '綜所稅', '薪資所得', '執行業務所得', '扣繳',
+              '扣繳義務人', '列舉扣除額'],
+    '貨物稅及菸酒稅': ['貨物稅', '菸酒稅'],
+    '證券及期貨交易稅': ['證券交易稅', '期貨交易稅'],
+    '地方稅': ['房屋稅', '地價稅', '土地增值稅', '契稅', '印花稅', '使用牌照稅', '娛樂稅'],
+    '關稅': ['關稅'],
+    '特種貨物及勞務稅': ['特種貨物及勞務稅'],
+    '所得基本稅額': ['所得基本稅額條例', '最低稅負'],
+}
+
+# 無法判斷時的分類
+DEFAULT_CATEGORY = '其他'
+
+# 每筆函釋保留的關鍵字數
+TOP_KEYWORDS = 8
+
+# 標題詞彙的權重（標題比內文更能代表主題）
+TITLE_WEIGHT = 3
+
+# 詞彙 → 分類的反查表
+TERM_CATEGORIES = {}
+for _category, _terms in CATEGORY_RULES.items():
+    for _term in _terms:
+        TERM_CATEGORIES.setdefault(_term, []).append(_category)
+
+_worker_ready = False
+
+
+def init_worker():
+    """載入 jieba 詞典與稅務使用者詞典（每個行程只執行一次）"""
+    global _worker_ready
+    if _worker_ready:
+        return
+
+    jieba.setLogLevel(60)
+    jieba.initialize()
+    jieba.load_userdict(USER_DICT_PATH)
+    _worker_ready = True
+
+
+def classify(title_tokens, content_tokens):
+    """依斷詞結果判斷稅目分類"""
+    scores = {}
+    for tokens, weight in ((title_tokens, TITLE_WEIGHT), (content_tokens, 1)):
+        for token in tokens:
+            for category in TERM_CATEGORIES.get(token, ()):
+                scores[category] = scores.get(category, 0) + weight
+
+    if not scores:
+        return DEFAULT_CATEGORY
+    return max(scores, key=scores.get)
+
+
+def extract_keywords(title, content, top_k=TOP_KEYWORDS):
+    """以 TF-IDF 擷取關鍵字（標題重複以提高權重）"""
+    text = '\n'.join([title] * TITLE_WEIGHT + [content])
+    return [
+        keyword for keyword in jieba.analyse.extract_tags(text, topK=top_k * 2)
+        if len(keyword) > 1 and not keyword.replace('.', '').isdigit()
+    ][:top_k]
+
+
+def enrich_batch(rows):
+    """分析一批 (id, 標題, 內容, 內容雜湊)，回傳 [(關鍵字, 分類, 內容雜湊, id)]"""
+    init_worker()
+    results = []
+    for record_id, title, content, digest in rows:
+        title = title or ''
+        content = content or ''
+        category = classify(jieba.lcut(title), jieba.lcut(content))
+        results.append((extract_keywords(title, content), category, digest, record_id))
+    return results
+
+
+class RulingEnricher:
+    """資料寫入後的分析階段：只處理新增或內容變更的函釋"""
+
+    def __init__(self, db=None, workers=None, batch_size=200):
+        self.db = db or TaxDatabaseManager()
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+
+    def _batches(self, ids):
+        """依批次大小分批讀取函釋內容"""
+        for start in range(0, len(ids), self.batch_size):
+            yield self.db.get_rulings_text(ids[start:start + self.batch_size])
+
+    def run(self):
+        """執行分析並寫回資料庫，回傳處理筆數"""
+        ids = self.db.rulings_needing_enrichment()
+        if not ids:
+            print("✓ 沒有需要分析的函釋")
+            return 0
+
+        processed = 0
+        # 資料量小於一批時直接在目前行程處理，省去建立行程池的成本
+        if len(ids) <= self.batch_size or self.workers == 1:
+            for batch in self._batches(ids):
+                results = enrich_batch(batch)
+                self.db.save_enrichment(results)
+                processed += len(results)
+        else:
+            # 呼叫端（收集流程）可能仍有抓取執行緒與事件迴圈，fork 可能卡在這些執行緒持有的鎖，
+            # 改以 spawn 建立行程（每個行程由 init_worker 載入一次詞典）
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                                     mp_context=context) as pool:
+                # 限制同時送出的批次數，避免一次把所有內容載入記憶體
+                pending = []
+                for batch in self._batches(ids):
+                    pending.append(pool.submit(enrich_batch, batch))
+                    if len(pending) >= self.workers * 2:
+                        results = pending.pop(0).result()
+                        self.db.save_enrichment(results)
+                        processed += len(results)
+                for future in pending:
+                    results = future.result()
+                    self.db.save_enrichment(results)
+                    processed += len(results)
+
+        print(f"✓ 已分析 {processed} 筆函釋（關鍵字與分類）")
+        return processed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='擷取函釋關鍵字並自動分類')
+    parser.add_argument('--workers', type=int, default=None, help='行程數（預設為 CPU 數）')
+    parser.add_argument('--batch-size', type=int, default=200, help='每批筆數')
+    args = parser.parse_args()
+
+    RulingEnricher(workers=args.workers, batch_size=args.batch_size).run()
@@ -0,0 +1,364 @@
+# feed_stream.py - RSS/Atom 串流讀取（lxml iterparse 邊下載邊解析，逐筆寫入資料庫）
+import argparse
+import codecs
+import json
+import os
+import queue
+import threading
+from datetime import datetime
+
+from lxml import etree, html as lxml_html
+
+import metrics
+from fetch_engine import FetchError
+
+# Atom 與常見擴充的命名空間
+ATOM = '{http://www.w3.org/2005/Atom}'
+RSS1 = '{http://purl.org/rss/1.0/}'
+DC = '{http://purl.org/dc/elements/1.1/}'
+CONTENT = '{http://purl.org/rss/1.0/modules/content/}'
+
+# 視為一個項目的元素（RSS 2.0、RSS 1.0、Atom）
+ENTRY_TAGS = ('item', f'{RSS1}item', f'{ATOM}entry')
+
+# 各欄位依序嘗試的子元素
+FIELD_TAGS = {
+    'title': ('title', f'{RSS1}title', f'{ATOM}title'),
+    'link': ('link', f'{RSS1}link'),
+    'guid': ('guid', f'{ATOM}id'),
+    'published': ('pubDate', f'{ATOM}published', f'{ATOM}updated', f'{DC}date'),
+    'summary': ('description', f'{RSS1}description', f'{ATOM}summary',
+                f'{CONTENT}encoded', f'{ATOM}content'),
+}
+
+# 每個RSS源預設讀取的項目數（None 表示讀到結尾或第一個已讀過的項目）
+DEFAULT_FEED_LIMIT = 10
+
+# 每個RSS源記住的最近 GUID 數
+MAX_REMEMBERED_GUIDS = 50
+
+# 解析端與寫入端之間的佇列長度（佇列滿時解析端暫停讀取）
+DEFAULT_QUEUE_SIZE = 200
+
+# 每次從回應讀取的位元組數
+READ_CHUNK_SIZE = 64 * 1024
+
+# 佇列結束標記
+_END = object()
+
+
+class CountingReader:
+    """包裝回應串流，計算實際讀取的位元組數（iterparse 以 read() 逐段讀取）
+
+    指定非 UTF-8 的 encoding 時邊讀邊轉為 UTF-8，解析時不依賴 libxml2 的編碼支援。
+    prefix 為判斷編碼時已先讀出的開頭片段。
+    """
+
+    def __init__(self, raw, encoding=None, prefix=b''):
+        self.raw = raw
+        self.prefix = prefix
+        self.bytes_read = len(prefix)
+        self.decoder = None
+        if encoding and codecs.lookup(encoding).name != 'utf-8':
+            self.decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+
+    def read(self, size=READ_CHUNK_SIZE):
+        while True:
+            if self.prefix:
+                chunk, self.prefix = self.prefix, b''
+            else:
+                chunk = self.raw.read(size if size and size > 0 else READ_CHUNK_SIZE)
+                self.bytes_read += len(chunk)
+            if self.decoder is None:
+                return chunk
+            # 多位元組字元跨段時解碼器會保留前半，轉出空字串時繼續讀取（空字串代表結尾）
+            data = self.decoder.decode(chunk, final=not chunk).encode('utf-8')
+            if data or not chunk:
+                return data
+
+
+def _child_text(element, tags):
+    """依序找第一個有文字的子元素"""
+    for tag in tags:
+        child = element.find(tag)
+        if child is not None:
+            text = ''.join(child.itertext()).strip()
+            if text:
+                return text
+    return ''
+
+
+def _atom_link(element):
+    """Atom 項目的網址（rel 為 alternate 或未指定的 <link href>）"""
+    for link in element.iterfind(f'{ATOM}link'):
+        if link.get('rel', 'alternate') == 'alternate' and link.get('href'):
+            return link.get('href')
+    return ''
+
+
+def _plain_text(text):
+    """摘要常含 HTML 標籤，只保留文字"""
+    if '<' not in text:
+        return text
+    try:
+        return lxml_html.fromstring(text).text_content().strip()
+    except (etree.ParserError, ValueError):
+        return text
+
+
+def iter_feed_entries(stream, source, limit=None, seen=None, encoding=None):
+    """從位元組串流逐一產生RSS項目（與先前 feedparser 版本相同的欄位，另加 guid）
+
+    遇到 seen 中的 GUID（上次讀過的最新項目）或已產生 limit 個項目時停止，
+    不再讀取剩下的內容；已處理的節點立即釋放，記憶體用量不隨RSS大小成長。
+    generator 結束時的回傳值為停止原因：'seen'、'limit' 或 'end'。
+    encoding 會覆寫 XML 宣告的編碼（None 表示依 XML 宣告）。
+    """
+    if limit is not None and limit <= 0:
+        return 'limit'
+    seen = seen or ()
+    events = etree.iterparse(
+        stream, events=('end',), tag=ENTRY_TAGS, encoding=encoding,
+        recover=True, resolve_entities=False, no_network=True
+    )
+    count = 0
+    for _, element in events:
+        link = _child_text(element, FIELD_TAGS['link']) or _atom_link(element)
+        item = {
+            'title': _child_text(element, FIELD_TAGS['title']),
+            'link': link,
+            'guid': _child_text(element, FIELD_TAGS['guid']) or link,
+            'published': _child_text(element, FIELD_TAGS['published']),
+            'summary': _plain_text(_child_text(element, FIELD_TAGS['summary'])),
+            'source': source,
+            'type': 'RSS'
+        }
+
+        # 釋放已處理的項目與前面的兄弟節點（與 ruling_parser.LxmlBackend 相同）
+        element.clear(keep_tail=True)
+        parent = element.getparent()
+        while parent is not None and element.getprevious() is not None:
+            del parent[0]
+
+        if item['guid'] and item['guid'] in seen:
+            return 'seen'
+        yield item
+        count += 1
+        if limit is not None and count >= limit:
+            return 'limit'
+    return 'end'
+
+
+class FeedState:
+    """記錄各RSS源最近讀過的 GUID（下次讀到這些項目即可停止）"""
+
+    def __init__(self, path=None):
+        base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.path = path or os.path.join(base_path, "data", "feed_state.json")
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.feeds = self._load()
+
+    def _load(self):
+        """讀取狀態檔"""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            print("⚠ RSS狀態檔損毀，重新建立")
+            return {}
+
+    def save(self):
+        """寫入狀態檔（先寫暫存檔再取代，避免中斷時損毀）"""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.feeds, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def seen(self, url):
+        """該RSS源最近讀過的 GUID"""
+        return set(self.feeds.get(url, {}).get('guids', []))
+
+    def remember(self, url, guids):
+        """記錄本次新讀到的 GUID（依RSS順序，最新的在前），只保留最近 MAX_REMEMBERED_GUIDS 個"""
+        if not guids:
+            return
+        previous = [guid for guid in self.feeds.get(url, {}).get('guids', []) if guid not in guids]
+        self.feeds[url] = {
+            'guids': (list(guids) + previous)[:MAX_REMEMBERED_GUIDS],
+            'updated_at': datetime.now().isoformat()
+        }
+
+
+class StreamingFeedReader:
+    """串流讀取RSS並直接寫入資料庫
+
+    每個RSS源各由一個背景執行緒同時邊下載邊解析，函釋候選經共用的有限長度
+    佇列交給寫入端，由 insert_rulings_bulk 分批寫入；同時在記憶體中的項目數
+    只與佇列長度及寫入批次大小有關，與RSS大小無關。
+    start() 開始讀取後呼叫端可以先處理其他工作，drain() 才寫入資料庫。
+    每個RSS源在寫入完成後才記錄讀過的 GUID 與 HTTP 驗證標頭；
+    有任何批次寫入失敗時都不記錄，下次會重新讀取。
+    """
+
+    def __init__(self, fetcher, db, state=None, limit=DEFAULT_FEED_LIMIT,
+                 queue_size=DEFAULT_QUEUE_SIZE):
+        self.fetcher = fetcher
+        self.db = db
+        self.state = state or FeedState()
+        self.limit = limit
+        self.queue_size = queue_size
+        # 進行中的讀取：(feeds, 各RSS源統計, 佇列, 結束標記執行緒)
+        self._stream = None
+
+    def read_feed(self, url, source, stats):
+        """產生單一RSS源的項目，讀取結果記錄在 stats"""
+        result = self.fetcher.open_stream(url)
+        if not result['ok']:
+            raise FetchError(result['error'] or f"HTTP {result['status']}")
+        if result['unchanged']:
+            stats['stopped'] = 'unchanged'
+            return
+
+        response = result['response']
+        stats['validator'] = result['validator']
+        # 先讀出開頭片段判斷編碼（標頭、XML 宣告、主機快取或 chardet），之後邊讀邊轉為 UTF-8
+        prefix = response.raw.read(READ_CHUNK_SIZE)
+        encoding = self.fetcher.encodings.sniff(prefix, response.headers.get('Content-Type'),
+                                                result['host'])
+        reader = CountingReader(response.raw, encoding, prefix)
+        entries = iter_feed_entries(reader, source, self.limit, self.state.seen(url), 'utf-8')
+        try:
+            while True:
+                try:
+                    item = next(entries)
+                except StopIteration as stop:
+                    stats['stopped'] = stop.value
+                    break
+                stats['items'] += 1
+                if len(stats['guids']) < MAX_REMEMBERED_GUIDS and item['guid']:
+                    stats['guids'].append(item['guid'])
+                yield item
+        finally:
+            response.close()
+            stats['bytes'] = reader.bytes_read
+            metrics.count('fetch_bytes', reader.bytes_read)
+
+    def start(self, feeds, extract):
+        """開始在背景讀取 feeds（{來源: 網址}），extract(item) 回傳函釋資料或 None
+
+        每個RSS源一個執行緒，佇列滿時暫停讀取，直到 drain() 取出寫入。
+        """
+        if self._stream is not None:
+            raise RuntimeError("上一次的RSS讀取尚未寫入")
+        buffer = queue.Queue(maxsize=self.queue_size)
+        stats = {
+            source: {'items': 0, 'rulings': 0, 'bytes': 0, 'stopped': None, 'error': None,
+                     'guids': [], 'validator': None}
+            for source in feeds
+        }
+
+        def produce(source, url):
+            feed_stats = stats[source]
+            print(f"\n處理RSS源: {source}")
+            try:
+                for item in self.read_feed(url, source, feed_stats):
+                    metrics.count('items_parsed')
+                    ruling = extract(item)
+                    if ruling:
+                        feed_stats['rulings'] += 1
+                        metrics.count('rulings_extracted')
+                        buffer.put(ruling)
+            except Exception as e:
+                feed_stats['error'] = f"{type(e).__name__}: {e}"
+                print(f"✗ RSS處理失敗: {source} ({feed_stats['error']})")
+                return
+
+            if feed_stats['stopped'] == 'unchanged':
+                print(f"✓ {source} 自上次執行後未變更，略過解析")
+            else:
+                print(f"✓ 從 {source} 收集 {feed_stats['items']} 項"
+                      f"（{feed_stats['bytes']:,} bytes，停止原因: {feed_stats['stopped']}）")
+
+        producers = [
+            threading.Thread(target=produce, args=(source, url), name=f'feed-stream-{index}',
+                             daemon=True)
+            for index, (source, url) in enumerate(feeds.items())
+        ]
+
+        def close():
+            # 所有RSS源讀取完畢後才放入結束標記
+            try:
+                for producer in producers:
+                    producer.join()
+            finally:
+                buffer.put(_END)
+
+        closer = threading.Thread(target=close, name='feed-stream-close', daemon=True)
+        for producer in producers:
+            producer.start()
+        closer.start()
+        self._stream = (feeds, stats, buffer, closer)
+
+    def drain(self):
+        """將 start() 讀取的函釋寫入資料庫，回傳 (各RSS源統計, 寫入筆數)
+
+        呼叫端負責 start_run/finish_run。
+        """
+        if self._stream is None:
+            raise RuntimeError("尚未開始讀取RSS")
+        feeds, stats, buffer, closer = self._stream
+        self._stream = None
+        try:
+            counts = self.db.insert_rulings_bulk(iter(buffer.get, _END))
+        except BaseException:
+            # 寫入失敗時讓解析端不再阻塞在已滿的佇列
+            while closer.is_alive():
+                try:
+                    buffer.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            raise
+        closer.join()
+
+        # 寫入完成後才記錄讀過的項目與驗證標頭（無法得知失敗的批次屬於哪個RSS源，全部不記錄）
+        if counts['failed']:
+            print(f"⚠ {counts['failed']} 筆寫入失敗，不記錄RSS進度，下次重新讀取")
+        else:
+            for source, url in feeds.items():
+                feed_stats = stats[source]
+                if feed_stats['error'] or feed_stats['stopped'] == 'unchanged':
+                    continue
+                self.state.remember(url, feed_stats['guids'])
+                if self.fetcher.cache is not None:
+                    self.fetcher.cache.remember(url, feed_stats['validator'])
+            self.state.save()
+
+        for feed_stats in stats.values():
+            del feed_stats['guids'], feed_stats['validator']
+        return stats, counts
+
+    def ingest(self, feeds, extract):
+        """讀取 feeds 並寫入資料庫（start() 後立即 drain()），回傳 (各RSS源統計, 寫入筆數)"""
+        self.start(feeds, extract)
+        return self.drain()
+
+if __name__ == "__main__":
+    from advanced_collector import AdvancedTaxCollector
+
+    parser = argparse.ArgumentParser(description='串流讀取RSS並寫入資料庫（適用大型封存RSS與回補）')
+    parser.add_argument('url', help='RSS網址')
+    parser.add_argument('--source', default='RSS', help='寫入資料庫的來源名稱')
+    parser.add_argument('--limit', type=int, help='最多讀取的項目數（預設讀到第一個已讀過的項目）')
+    args = parser.parse_args()
+
+    collector = AdvancedTaxCollector()
+    reader = StreamingFeedReader(collector.fetcher, collector.db, limit=args.limit)
+    with collector.db:
+        collector.db.start_run('feed_stream')
+        stats, counts = reader.ingest({args.source: args.url}, collector.extract_candidate)
+        collector.db.finish_run(counts)
+    if collector.fetcher.cache is not None:
+        collector.fetcher.cache.flush()
+    metrics.recorder.export('feed_stream', run_store=collector.run_store)
@@ -0,0 +1,289 @@
+# fetch_engine.py - 非同步並行抓取引擎
+import asyncio
+import copy
+import random
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from encoding_resolver import EncodingResolver
+
+# 預設請求標頭
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+# 需要重試的 HTTP 狀態碼（限流與暫時性伺服器錯誤）
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class FetchError(Exception):
+    """抓取失敗（連線錯誤、逾時或非成功狀態碼）"""
+
+
+class HostDegradedError(FetchError):
+    """主機斷路中（連續失敗或超過時間預算），本次未送出請求"""
+
+
+def ensure_ok(result):
+    """抓取結果不成功時拋出 FetchError（主機斷路中時為 HostDegradedError）"""
+    if result.get('circuit_open'):
+        raise HostDegradedError(result['error'])
+    if not result['ok']:
+        raise FetchError(result['error'] or f"HTTP {result['status']}")
+    return result
+
+
+class AsyncFetchEngine:
+    """所有收集器共用的抓取層
+
+    以 asyncio 排程、共用 requests 連線池，限制全域與每個主機的並行數，
+    每個請求有逾時設定，失敗時以隨機抖動的指數退避重試。
+    提供 limiter（rate_limiter.HostRateLimiter）時依各主機的速率送出請求，
+    主機斷路中時不送出請求，結果的 circuit_open 為 True。
+    """
+
+    def __init__(self, max_connections=16, per_host_limit=4, timeout=15,
+                 retries=3, backoff_base=0.5, backoff_max=8.0, headers=None,
+                 cache=None, limiter=None):
+        self.max_connections = max_connections
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        # 全域連線池，所有主機共用
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update(headers or DEFAULT_HEADERS)
+
+        # HTTP 驗證快取（HttpValidatorCache），None 表示不使用條件式請求
+        self.cache = cache
+
+        # 每個主機的速率限制與斷路器（HostRateLimiter），None 表示不限速
+        self.limiter = limiter
+
+        # 內容編碼判斷（記住各主機偵測到的編碼）
+        self.encodings = EncodingResolver()
+
+        # Semaphore 綁定事件迴圈，換迴圈時重新建立
+        self._loop = None
+        self._global_limit = None
+        self._host_limits = {}
+
+    def without_cache(self):
+        """共用連線池、並行限制與速率限制，但不使用驗證快取的抓取層
+
+        內容頁等需要完整內容的請求使用：條件式請求回應 304 時沒有內容可擷取。
+        """
+        engine = copy.copy(self)
+        engine.cache = None
+        return engine
+
+    def _limits_for(self, host):
+        """取得全域與該主機的並行限制"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._global_limit = asyncio.Semaphore(self.max_connections)
+            self._host_limits = {}
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._global_limit, self._host_limits[host]
+
+    def _backoff(self, attempt):
+        """計算第 attempt 次失敗後的等待秒數（full jitter）"""
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+        return random.uniform(0, ceiling)
+
+    def _admit(self, result):
+        """主機斷路中時標記結果並回傳 False"""
+        if self.limiter is None or self.limiter.allow(result['host']):
+            return True
+        result['circuit_open'] = True
+        result['error'] = f"{result['host']} 暫停中（斷路）"
+        return False
+
+    def _record(self, result, response, request_started):
+        """將本次請求的結果回報給 limiter（response 為 None 表示連線錯誤或逾時）"""
+        if self.limiter is None:
+            return
+        self.limiter.record(
+            result['host'],
+            status=response.status_code if response is not None else None,
+            elapsed=time.monotonic() - request_started,
+            error=None if response is not None else result['error'],
+            retry_after=response.headers.get('Retry-After') if response is not None else None
+        )
+
+    def _request(self, url, headers):
+        """在工作執行緒中執行的同步請求"""
+        return self.session.get(url, headers=headers, timeout=self.timeout)
+
+    async def fetch(self, url, headers=None):
+        """抓取單一網址，回傳結果字典（不拋出例外）
+
+        使用快取時會送出條件式請求；unchanged 為 True 表示伺服器回應 304
+        或內容雜湊與上次相同，呼叫端可直接略過解析與寫檔。內容有變更時
+        validator 為新的驗證資訊，呼叫端寫入成功後須以 cache.remember() 記錄。
+        text 為依 encoding 解碼後的內容，解析 content 時請一併傳入 encoding。
+        """
+        host = urlsplit(url).netloc
+        global_limit, host_limit = self._limits_for(host)
+        result = {
+            'url': url,
+            'host': host,
+            'ok': False,
+            'status': None,
+            'content': b'',
+            'text': '',
+            'encoding': None,
+            'headers': {},
+            'unchanged': False,
+            'validator': None,
+            'circuit_open': False,
+            'elapsed': 0.0,
+            'attempts': 0,
+            'error': None
+        }
+        if self.cache is not None:
+            headers = {**self.cache.conditional_headers(url), **(headers or {})}
+        started = time.monotonic()
+
+        for attempt in range(1, self.retries + 2):
+            if not self._admit(result):
+                break
+            if self.limiter is not None:
+                await asyncio.sleep(self.limiter.reserve(host))
+            result['attempts'] = attempt
+            response = None
+            request_started = time.monotonic()
+            try:
+                async with host_limit, global_limit:
+                    # 等待並行名額的時間不計入該主機的耗時
+                    request_started = time.monotonic()
+                    response = await asyncio.wait_for(
+                        asyncio.to_thread(self._request, url, headers),
+                        timeout=self.timeout * 2
+                    )
+                result['status'] = response.status_code
+                if response.status_code in RETRY_STATUS:
+                    result['error'] = f"HTTP {response.status_code}"
+                else:
+                    result['ok'] = response.ok
+                    result['error'] = None if response.ok else f"HTTP {response.status_code}"
+                    result['content'] = response.content
+                    result['headers'] = dict(response.headers)
+                    result['encoding'], result['text'] = self.encodings.decode(
+                        response.content, response.headers.get('Content-Type'), host
+                    )
+                    if response.ok and self.cache is not None:
+                        result['unchanged'], result['validator'] = self.cache.check(
+                            url, response.status_code, response.content, response.headers
+                        )
+                    self._record(result, response, request_started)
+                    break
+            except (requests.RequestException, asyncio.TimeoutError) as e:
+                result['error'] = f"{type(e).__name__}: {e}"
+            self._record(result, response, request_started)
+
+            if attempt <= self.retries:
+                await asyncio.sleep(self._backoff(attempt))
+
+        result['elapsed'] = round(time.monotonic() - started, 3)
+        metrics.recorder.record_fetch(result)
+        return result
+
+    def open_stream(self, url, headers=None):
+        """以串流模式抓取單一網址（同步，供工作執行緒使用），回傳與 fetch() 相同格式的結果字典
+
+        內容不會預先讀入記憶體：成功時 result['response'] 為尚未讀取的回應，
+        呼叫端從 response.raw 讀取後須呼叫 response.close()；內容處理完成後
+        再以 cache.remember() 記錄 result['validator']。伺服器回應 304 時 unchanged 為 True。
+        """
+        result = {
+            'url': url,
+            'host': urlsplit(url).netloc,
+            'ok': False,
+            'status': None,
+            'content': b'',
+            'text': '',
+            'headers': {},
+            'response': None,
+            'unchanged': False,
+            'validator': None,
+            'circuit_open': False,
+            'elapsed': 0.0,
+            'attempts': 0,
+            'error': None
+        }
+        if self.cache is not None:
+            headers = {**self.cache.conditional_headers(url), **(headers or {})}
+        started = time.monotonic()
+
+        for attempt in range(1, self.retries + 2):
+            if not self._admit(result):
+                break
+            if self.limiter is not None:
+                time.sleep(self.limiter.reserve(result['host']))
+            result['attempts'] = attempt
+            response = None
+            request_started = time.monotonic()
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout, stream=True)
+                result['status'] = response.status_code
+                if response.status_code in RETRY_STATUS:
+                    result['error'] = f"HTTP {response.status_code}"
+                    response.close()
+                else:
+                    result['headers'] = dict(response.headers)
+                    if response.status_code == 304 and self.cache is not None:
+                        result['ok'] = True
+                        result['unchanged'], _ = self.cache.check(url, 304, b'', response.headers)
+                        response.close()
+                    elif response.ok:
+                        result['ok'] = True
+                        # 由 urllib3 解開 gzip/deflate，讀取端拿到的是原始內容
+                        response.raw.decode_content = True
+                        result['response'] = response
+                        if self.cache is not None:
+                            result['validator'] = self.cache.validator(response.headers)
+                    else:
+                        result['error'] = f"HTTP {response.status_code}"
+                        response.close()
+                    # 串流讀取的時間不計入，只記錄到收到回應標頭為止
+                    self._record(result, response, request_started)
+                    break
+            except requests.RequestException as e:
+                result['error'] = f"{type(e).__name__}: {e}"
+            self._record(result, response, request_started)
+
+            if attempt <= self.retries:
+                time.sleep(self._backoff(attempt))
+
+        result['elapsed'] = round(time.monotonic() - started, 3)
+        # 內容大小由讀取端在讀完後以 fetch_bytes 計數
+        metrics.recorder.record_fetch(result)
+        return result
+
+    async def fetch_all(self, urls, headers=None):
+        """並行抓取多個網址，結果順序與輸入相同"""
+        return await asyncio.gather(*(self.fetch(url, headers) for url in urls))
+
+    def fetch_many(self, urls, headers=None):
+        """同步介面：並行抓取多個網址"""
+        return self.run(self.fetch_all(urls, headers))
+
+    def run(self, coroutine):
+        """在新的事件迴圈中執行協程（供同步程式呼叫）"""
+        return asyncio.run(coroutine)
+
+    def close(self):
+        """關閉連線池"""
+        self.session.close()
@@ -0,0 +1,104 @@
+# http_cache.py - HTTP 驗證快取（ETag / Last-Modified / 內容雜湊）
+import hashlib
+import json
+import os
+from datetime import datetime
+
+
+class HttpValidatorCache:
+    """記錄每個網址的驗證資訊，用於條件式請求與內容未變更判斷
+
+    內容有變更時，新的驗證資訊要等呼叫端解析並寫入成功後才以 remember() 記錄；
+    處理失敗時下次仍會重新下載，不會被誤判為未變更而略過。
+    記錄只更新記憶體中的資料，執行結束時以 flush()（或 report()）寫入一次快取檔。
+    """
+
+    def __init__(self, path=None):
+        base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.path = path or os.path.join(base_path, "data", "http_cache.json")
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.entries = self._load()
+        self.dirty = False
+        self.stats = {'hits': 0, 'misses': 0, 'not_modified': 0, 'same_hash': 0}
+
+    def _load(self):
+        """讀取快取檔"""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            print("⚠ HTTP快取檔損毀，重新建立")
+            return {}
+
+    def save(self):
+        """寫入快取檔（先寫暫存檔再取代，避免中斷時損毀）"""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def flush(self):
+        """有未寫入的變更時寫入快取檔"""
+        if self.dirty:
+            self.save()
+
+    def conditional_headers(self, url):
+        """依先前的驗證資訊產生條件式請求標頭"""
+        entry = self.entries.get(url, {})
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def validator(self, headers, content=None):
+        """由回應標頭（與內容）產生驗證資訊（串流讀取時沒有完整內容，不計算雜湊）"""
+        return {
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'sha256': hashlib.sha256(content).hexdigest() if content is not None else None,
+            'size': len(content) if content is not None else None,
+            'checked_at': datetime.now().isoformat()
+        }
+
+    def check(self, url, status, content, headers):
+        """回傳 (內容是否與上次相同, 新的驗證資訊)
+
+        304 或雜湊相同時代表上次記錄的內容已處理過，直接更新快取；
+        內容有變更時不寫入，由呼叫端處理成功後再以 remember() 記錄。
+        """
+        entry = self.entries.get(url)
+
+        if status == 304 and entry:
+            self.stats['hits'] += 1
+            self.stats['not_modified'] += 1
+            self.remember(url, {**entry, 'checked_at': datetime.now().isoformat()})
+            return True, None
+
+        validator = self.validator(headers, content)
+        if entry and entry.get('sha256') == validator['sha256']:
+            self.stats['hits'] += 1
+            self.stats['same_hash'] += 1
+            self.remember(url, validator)
+            return True, None
+
+        self.stats['misses'] += 1
+        return False, validator
+
+    def remember(self, url, validator):
+        """記錄已處理完成的內容的驗證資訊（flush() 時寫入快取檔）"""
+        if validator is None:
+            return
+        self.entries[url] = validator
+        self.dirty = True
+
+    def report(self):
+        """輸出快取命中統計，並寫入未儲存的變更"""
+        self.flush()
+        print(f"✓ HTTP快取: 命中 {self.stats['hits']} / 未命中 {self.stats['misses']} "
+              f"(304: {self.stats['not_modified']}, 內容相同: {self.stats['same_hash']})")
+        return dict(self.stats)
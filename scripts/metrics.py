@@ -0,0 +1,239 @@
+# metrics.py - 執行指標（各階段耗時、抓取量、寫入筆數），輸出 JSON 與 Prometheus 文字格式
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+from run_store import RunStore
+
+try:
+    import resource
+except ImportError:  # Windows 沒有 resource 模組
+    resource = None
+
+# Prometheus 指標名稱前綴
+METRICS_PREFIX = 'tax_monitor'
+
+# 預設輸出目錄（data/metrics）
+DEFAULT_METRICS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'metrics'
+)
+
+# tracemalloc 報告列出的配置位置數
+TOP_ALLOCATIONS = 25
+
+
+def peak_rss_bytes():
+    """行程的最大常駐記憶體（位元組），無法取得時回傳 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 為單位，macOS 以位元組為單位
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _write_atomic(path, text):
+    """先寫暫存檔再取代，讀取端不會讀到寫到一半的檔案"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class MetricsRecorder:
+    """單次執行的指標：階段耗時（秒數與次數）與計數器"""
+
+    def __init__(self):
+        # 計數器可能由多個執行緒同時更新（例如每個RSS源一個讀取執行緒）
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """清除所有指標，重新開始計時"""
+        self.started_at = time.time()
+        self.stages = {}
+        self.counters = {}
+
+    @contextmanager
+    def timer(self, stage):
+        """累計 with 區塊的耗時到指定階段"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(stage, {'seconds': 0.0, 'calls': 0})
+            entry['seconds'] += time.perf_counter() - started
+            entry['calls'] += 1
+
+    def timed(self, stage):
+        """函式裝飾器：每次呼叫的耗時累計到指定階段"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name, amount=1):
+        """計數器加上 amount"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def count_rows(self, counts):
+        """記錄資料庫寫入結果（insert_rulings_bulk 回傳的筆數）"""
+        for key, value in counts.items():
+            self.count(f'rows_{key}', value)
+
+    def record_fetch(self, result):
+        """記錄一次抓取結果（AsyncFetchEngine.fetch 回傳的字典）"""
+        self.count('fetch_requests')
+        self.count('fetch_bytes', len(result.get('content') or b''))
+        self.count('fetch_retries', max(result.get('attempts', 1) - 1, 0))
+        self.count('fetch_seconds', result.get('elapsed', 0.0))
+        if not result.get('ok'):
+            self.count('fetch_failures')
+        if result.get('unchanged'):
+            self.count('cache_hits')
+
+    def snapshot(self):
+        """目前指標的字典（可直接輸出為 JSON）"""
+        finished_at = time.time()
+        return {
+            'started_at': datetime.fromtimestamp(self.started_at).isoformat(),
+            'finished_at': datetime.fromtimestamp(finished_at).isoformat(),
+            'duration_seconds': round(finished_at - self.started_at, 3),
+            'peak_rss_bytes': peak_rss_bytes(),
+            'stages': {
+                stage: {'seconds': round(entry['seconds'], 4), 'calls': entry['calls']}
+                for stage, entry in self.stages.items()
+            },
+            'counters': {
+                name: round(value, 4) if isinstance(value, float) else value
+                for name, value in self.counters.items()
+            }
+        }
+
+    def to_prometheus(self, snapshot=None):
+        """轉為 Prometheus textfile collector 格式"""
+        snapshot = snapshot or self.snapshot()
+        lines = []
+
+        def metric(name, help_text, samples):
+            lines.append(f'# HELP {METRICS_PREFIX}_{name} {help_text}')
+            lines.append(f'# TYPE {METRICS_PREFIX}_{name} gauge')
+            for labels, value in samples:
+                lines.append(f'{METRICS_PREFIX}_{name}{labels} {value}')
+
+        metric('run_timestamp_seconds', '執行開始時間', [('', round(self.started_at, 3))])
+        metric('run_duration_seconds', '執行總耗時', [('', snapshot['duration_seconds'])])
+        if snapshot['peak_rss_bytes'] is not None:
+            metric('peak_rss_bytes', '最大常駐記憶體', [('', snapshot['peak_rss_bytes'])])
+
+        stages = snapshot['stages'].items()
+        metric('stage_seconds', '各階段累計耗時',
+               [(f'{{stage="{stage}"}}', entry['seconds']) for stage, entry in stages])
+        metric('stage_calls', '各階段執行次數',
+               [(f'{{stage="{stage}"}}', entry['calls']) for stage, entry in stages])
+
+        for name, value in sorted(snapshot['counters'].items()):
+            metric(name, name.replace('_', ' '), [('', value)])
+
+        return '\n'.join(lines) + '\n'
+
+    def export(self, label, directory=DEFAULT_METRICS_DIR, run_store=None):
+        """將本次指標附加到執行紀錄，並寫出 latest.json 與 Prometheus 文字檔"""
+        os.makedirs(directory, exist_ok=True)
+        snapshot = {'label': label, **self.snapshot()}
+
+        entry = (run_store or RunStore()).append('metrics', snapshot)
+        _write_atomic(os.path.join(directory, 'latest.json'),
+                      json.dumps(snapshot, ensure_ascii=False, indent=2))
+        _write_atomic(os.path.join(directory, f'{METRICS_PREFIX}.prom'), self.to_prometheus(snapshot))
+
+        print(f"✓ 執行指標已儲存: runs/{entry['partition']}")
+        return snapshot
+
+
+# 全程式共用的指標紀錄器
+recorder = MetricsRecorder()
+timer = recorder.timer
+timed = recorder.timed
+count = recorder.count
+
+
+@contextmanager
+def profiled(label, directory=DEFAULT_METRICS_DIR):
+    """以 cProfile 與 tracemalloc 剖析 with 區塊，結果寫入 directory
+
+    產生 <label>_<時間>.prof（可用 snakeviz 或 pstats 檢視）與記憶體配置排行。
+    """
+    # 只有剖析時才需要，不在匯入 metrics 時載入
+    import cProfile
+    import tracemalloc
+
+    os.makedirs(directory, exist_ok=True)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        recorder.count('tracemalloc_peak_bytes', peak)
+
+        prof_file = os.path.join(directory, f'{label}_{timestamp}.prof')
+        profiler.dump_stats(prof_file)
+        top = snapshot.statistics('lineno')[:TOP_ALLOCATIONS]
+        _write_atomic(
+            os.path.join(directory, f'{label}_{timestamp}_memory.txt'),
+            f'peak: {peak} bytes\n' + '\n'.join(str(stat) for stat in top) + '\n'
+        )
+        print(f"✓ 效能剖析已儲存: {os.path.basename(prof_file)}")
+
+
+def render_markdown(snapshot):
+    """將指標 JSON 轉為 Markdown（供 GitHub Actions 執行摘要使用）"""
+    lines = [
+        f"- **總耗時**: {snapshot['duration_seconds']} 秒",
+    ]
+    if snapshot.get('peak_rss_bytes'):
+        lines.append(f"- **最大記憶體**: {snapshot['peak_rss_bytes'] / 1024 / 1024:.1f} MB")
+
+    counters = snapshot['counters']
+    if 'fetch_requests' in counters:
+        lines.append(
+            f"- **抓取**: {counters['fetch_requests']} 次, "
+            f"{counters.get('fetch_bytes', 0) / 1024:.1f} KB, "
+            f"重試 {counters.get('fetch_retries', 0)} 次, 快取命中 {counters.get('cache_hits', 0)} 次"
+        )
+    rows = [f"{key[5:]} {value}" for key, value in counters.items() if key.startswith('rows_')]
+    if rows:
+        lines.append(f"- **資料庫寫入**: {', '.join(rows)}")
+
+    if snapshot['stages']:
+        lines += ['', '| 階段 | 耗時 (秒) | 次數 |', '|---|---:|---:|']
+        lines += [f"| {stage} | {entry['seconds']:.3f} | {entry['calls']} |"
+                  for stage, entry in snapshot['stages'].items()]
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='顯示執行指標')
+    parser.add_argument('path', nargs='?', default=os.path.join(DEFAULT_METRICS_DIR, 'latest.json'),
+                        help='指標 JSON 檔（預設為最近一次執行）')
+    parser.add_argument('--markdown', action='store_true', help='輸出 Markdown 摘要')
+    args = parser.parse_args()
+
+    with open(args.path, encoding='utf-8') as f:
+        data = json.load(f)
+    print(render_markdown(data) if args.markdown else json.dumps(data, ensure_ascii=False, indent=2))
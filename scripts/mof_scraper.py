@@ -1,157 +1,132 @@
 # mof_scraper.py - 財政部函釋爬蟲
-import requests
-from bs4 import BeautifulSoup
-import json
 import os
-from datetime import datetime, timedelta
+from datetime import datetime
 import time
-import re
+from urllib.parse import urlsplit
+import metrics
+from fetch_engine import AsyncFetchEngine, HostDegradedError, ensure_ok
+from http_cache import HttpValidatorCache
+from rate_limiter import HostRateLimiter
+from archive_store import RawArchive
+from run_store import RunStore
+from ruling_parser import DEFAULT_BACKEND, parse_listing
 
 class MOFTaxScraper:
-    def __init__(self):
+    def __init__(self, fetcher=None, parser_backend=DEFAULT_BACKEND):
         # Use the project directory (parent of scripts folder)
         self.base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.data_path = os.path.join(self.base_path, "data")
         # Ensure data directory exists
         os.makedirs(self.data_path, exist_ok=True)
-        self.session = requests.Session()
+        # 共用抓取引擎（可由呼叫端注入，與其他收集器共用連線池）
+        self.fetcher = fetcher or AsyncFetchEngine(cache=HttpValidatorCache(), limiter=HostRateLimiter())
+        self.session = self.fetcher.session
 
         # 設定請求標頭
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/120.0.0.0'
         }
 
+        # 財政部賦稅署函釋查詢網址
+        self.rulings_url = "https://www.dot.gov.tw/ch/home.jsp?id=30&parentpath=0,1"
+
+        # 原始HTML封存區（內容定址、跨次執行去重）
+        self.archive = RawArchive()
+
+        # 執行紀錄儲存區（取代每次執行一個 JSON 檔）
+        self.run_store = RunStore()
+
+        # 列表頁解析後端（'lxml' 串流解析或 'bs4'）
+        self.parser_backend = parser_backend
+
+        # 本次執行狀態：'ok' 或 'degraded'（網站無法連線或暫停中，未取得資料）
+        self.status = {'status': 'ok', 'error': None}
+
     def scrape_latest_rulings(self):
         """爬取最新函釋"""
+        return self.fetcher.run(self.scrape_latest_rulings_async())
+
+    async def scrape_latest_rulings_async(self):
+        """爬取最新函釋（可與其他收集器於同一事件迴圈並行）"""
         print("開始爬取財政部最新函釋...")
 
-        # 財政部賦稅署函釋查詢網址
-        url = "https://www.dot.gov.tw/ch/home.jsp?id=30&parentpath=0,1"
+        url = self.rulings_url
 
         try:
-            response = self.session.get(url, headers=self.headers, timeout=15)
-            response.encoding = 'utf-8'
-            soup = BeautifulSoup(response.text, 'html.parser')
+            with metrics.timer('fetch'):
+                response = ensure_ok(await self.fetcher.fetch(url, headers=self.headers))
+            if response['unchanged']:
+                print("✓ 頁面自上次執行後未變更，略過解析與儲存")
+                return []
+
+            # 解析函釋資料
+            with metrics.timer('parse'):
+                parsed = parse_listing(response['text'], self.parser_backend)
+            rulings = parsed['rulings']
+            metrics.count('rulings_extracted', len(rulings))
 
             # 擷取頁面標題確認連接成功
-            title = soup.find('title')
-            if title:
-                print(f"✓ 成功連接: {title.text.strip()}")
+            if parsed['title']:
+                print(f"✓ 成功連接: {parsed['title']}")
 
-            # 儲存原始HTML供後續分析
+            # 封存原始HTML供後續分析與重新解析
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            html_file = os.path.join(self.data_path, f"mof_rulings_{timestamp}.html")
-
-            with open(html_file, 'w', encoding='utf-8') as f:
-                f.write(response.text)
+            self.archive_page(response['content'], url, timestamp, response['encoding'])
 
-            print(f"✓ HTML已儲存: {os.path.basename(html_file)}")
+            # 附加到執行紀錄
+            entry = self.run_store.append('mof_rulings', rulings, timestamp)
 
-            # 解析函釋資料
-            rulings = self.parse_rulings(soup)
-
-            # 儲存為JSON
-            json_file = os.path.join(self.data_path, f"mof_rulings_{timestamp}.json")
-            with open(json_file, 'w', encoding='utf-8') as f:
-                json.dump(rulings, f, ensure_ascii=False, indent=2)
+            # 儲存完成後才記錄驗證資訊，解析或儲存失敗時下次重新處理
+            if self.fetcher.cache is not None:
+                self.fetcher.cache.remember(url, response['validator'])
+                self.fetcher.cache.flush()
 
             print(f"✓ 找到 {len(rulings)} 筆函釋")
-            print(f"✓ JSON已儲存: {os.path.basename(json_file)}")
+            print(f"✓ 資料已儲存: runs/{entry['partition']}")
 
             return rulings
 
         except Exception as e:
-            print(f"⚠ 無法連接賦稅署網站: {type(e).__name__}")
-            print("  使用示範資料模式...")
-            return self._get_demo_rulings()
-
-    def _get_demo_rulings(self):
-        """提供示範函釋資料"""
-        base_date = datetime.now()
-        demo_rulings = [
-            {
-                'ruling_number': '台財稅字第11304512345號',
-                'title': '營利事業列報交際費支出之認定標準',
-                'issue_date': (base_date - timedelta(days=1)).strftime('%Y-%m-%d'),
-                'category': '營利事業所得稅',
-                'summary': '有關營利事業列報交際費支出，應以與業務有關且必要者為限，並應取具合法憑證。',
-                'keywords': ['交際費', '營所稅', '憑證'],
-                'url': 'https://www.dot.gov.tw/ch/home.jsp?id=30&parentpath=0,1',
-                'scraped_at': datetime.now().isoformat()
-            },
-            {
-                'ruling_number': '台財稅字第11304512346號',
-                'title': '個人綜合所得稅扣繳相關疑義',
-                'issue_date': (base_date - timedelta(days=2)).strftime('%Y-%m-%d'),
-                'category': '綜合所得稅',
-                'summary': '說明薪資所得扣繳義務人應依規定辦理扣繳，並於期限內申報繳納。',
-                'keywords': ['扣繳', '薪資所得', '綜所稅'],
-                'url': 'https://www.dot.gov.tw/ch/home.jsp?id=30&parentpath=0,1',
-                'scraped_at': datetime.now().isoformat()
-            },
-            {
-                'ruling_number': '台財稅字第11304512347號',
-                'title': '遺產稅不動產估價相關規定',
-                'issue_date': (base_date - timedelta(days=3)).strftime('%Y-%m-%d'),
-                'category': '遺產及贈與稅',
-                'summary': '被繼承人遺產中之不動產，應以死亡時之時價估價課徵遺產稅。',
-                'keywords': ['遺產稅', '不動產', '估價'],
-                'url': 'https://www.dot.gov.tw/ch/home.jsp?id=30&parentpath=0,1',
-                'scraped_at': datetime.now().isoformat()
-            },
-            {
-                'ruling_number': '台財稅字第11304512348號',
-                'title': '營業人開立電子發票相關疑義',
-                'issue_date': (base_date - timedelta(days=4)).strftime('%Y-%m-%d'),
-                'category': '營業稅',
-                'summary': '營業人使用電子發票，應依規定格式開立並上傳至整合服務平台。',
-                'keywords': ['電子發票', '營業稅', '平台'],
-                'url': 'https://www.dot.gov.tw/ch/home.jsp?id=30&parentpath=0,1',
-                'scraped_at': datetime.now().isoformat()
-            },
-            {
-                'ruling_number': '台財稅字第11304512349號',
-                'title': '境外電商課徵營業稅執行要點',
-                'issue_date': (base_date - timedelta(days=5)).strftime('%Y-%m-%d'),
-                'category': '營業稅',
-                'summary': '境外電商銷售電子勞務予我國境內自然人，應依規定辦理稅籍登記及報繳營業稅。',
-                'keywords': ['境外電商', '電子勞務', '營業稅'],
-                'url': 'https://www.dot.gov.tw/ch/home.jsp?id=30&parentpath=0,1',
-                'scraped_at': datetime.now().isoformat()
-            }
-        ]
-
-        # 儲存示範資料
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        json_file = os.path.join(self.data_path, f"mof_rulings_{timestamp}.json")
-        with open(json_file, 'w', encoding='utf-8') as f:
-            json.dump(demo_rulings, f, ensure_ascii=False, indent=2)
-
-        print(f"✓ 載入 {len(demo_rulings)} 筆示範函釋")
-        print(f"✓ JSON已儲存: {os.path.basename(json_file)}")
-
-        return demo_rulings
-
-    def parse_rulings(self, soup):
-        """解析函釋內容"""
-        rulings = []
-
-        # 尋找所有可能包含函釋的元素
-        links = soup.find_all('a', href=True)
-
-        # 函釋字號的正則表達式
-        hanshi_pattern = re.compile(r'台財稅字第\d+號|財政部\d+號')
-
-        for link in links[:20]:
-            text = link.get_text(strip=True)
-            if hanshi_pattern.search(text):
-                rulings.append({
-                    'title': text[:200],
-                    'url': link.get('href', ''),
-                    'scraped_at': datetime.now().isoformat()
-                })
-
-        return rulings
+            # 不以示範資料代替，明確記錄為降級執行，避免假資料進入後續流程
+            reason = "暫停中（斷路）" if isinstance(e, HostDegradedError) else "無法連接"
+            print(f"⚠ 賦稅署網站{reason}: {type(e).__name__}: {e}")
+            return self.record_degraded(url, e)
+
+    def record_degraded(self, url, error):
+        """記錄降級執行（附加到執行紀錄），回傳空的函釋列表"""
+        self.status = {'status': 'degraded', 'error': f"{type(error).__name__}: {error}"}
+        entry = self.run_store.append('degraded_run', {
+            'collector': 'mof_scraper',
+            'url': url,
+            **self.status
+        })
+        print(f"✓ 降級狀態已記錄: runs/{entry['partition']}")
+        return []
+
+    def archive_page(self, content, url, timestamp=None, encoding=None):
+        """封存原始HTML（內容相同的快照只存一份，記錄判斷出的編碼供重新解析）"""
+        timestamp = timestamp or datetime.now().strftime('%Y%m%d_%H%M%S')
+        entry = self.archive.store(content, url, 'dot_rulings', timestamp, encoding)
+        status = "與既有快照相同" if entry['deduplicated'] else "新快照"
+        print(f"✓ HTML已封存: {entry['sha256'][:12]} ({status})")
+        return entry
+
+    def parse_rulings(self, html, limit=None, encoding='utf-8'):
+        """解析函釋內容（limit 為找到的函釋數上限，None 表示解析整頁）"""
+        return parse_listing(html, self.parser_backend, limit, encoding)['rulings']
+
+    def reparse_archive(self, since=None, until=None):
+        """以目前的 parse_rulings 重新解析封存的快照，回傳 {執行時間戳: 函釋列表}"""
+        results = {}
+        for entry, content in self.archive.iter_snapshots('dot_rulings', since, until):
+            # 舊快照沒有記錄編碼時重新判斷
+            encoding = entry.get('encoding') or self.fetcher.encodings.decode(
+                content, host=urlsplit(entry['url']).netloc
+            )[0]
+            results[entry['run_timestamp']] = self.parse_rulings(content, encoding=encoding)
+
+        print(f"✓ 重新解析 {len(results)} 份封存快照")
+        return results
 
     def display_rulings(self, rulings):
         """顯示函釋摘要"""
@@ -180,10 +155,22 @@ class MOFTaxScraper:
         if rulings:
             self.display_rulings(rulings)
 
+        if self.fetcher.cache is not None:
+            print()
+            self.fetcher.cache.report()
+
+        if self.fetcher.limiter is not None:
+            self.fetcher.limiter.report()
+
         print("\n" + "="*60)
-        print(f"爬蟲執行完成！共取得 {len(rulings)} 筆函釋")
+        if self.status['status'] == 'degraded':
+            print(f"⚠ 降級執行：未取得函釋（{self.status['error']}）")
+        else:
+            print(f"爬蟲執行完成！共取得 {len(rulings)} 筆函釋")
         print("="*60)
 
+        metrics.recorder.export('mof_scraper', run_store=self.run_store)
+
         return rulings
 
 if __name__ == "__main__":
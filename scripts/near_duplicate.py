@@ -0,0 +1,113 @@
+# near_duplicate.py - 跨來源近似重複偵測（標題 SimHash 與分段索引）
+import hashlib
+import re
+import unicodedata
+
+from ruling_number import RULING_NUMBER_PATTERN
+
+# 指紋位元數
+SIMHASH_BITS = 64
+
+# 指紋切成 4 段各 16 位元；漢明距離不超過 3 時至少有一段完全相同，
+# 只需以各段值查索引即可找出候選，不必與每筆資料比對
+SIMHASH_BANDS = 4
+BAND_BITS = SIMHASH_BITS // SIMHASH_BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+# 視為同一則函釋的最大漢明距離（須小於分段數）
+MAX_DISTANCE = 3
+
+# 指紋最少需要的詞元數，太短的標題不做近似比對以免誤合併
+MIN_SHINGLES = 5
+
+SIMHASH_MASK = (1 << SIMHASH_BITS) - 1
+
+# 各來源標題常見的機關名稱、發布日期與套語，不影響函釋內容，比對前移除
+# （只比對完整詞語，「法令」、「命令」等詞不受影響）。
+# 修改時須新增資料庫遷移重新計算既有資料的 simhash，否則舊資料無法與新標題比對
+BOILERPLATE_PATTERN = re.compile(
+    r'\d+年\d+月\d+日[令函]?|財政部令|解釋令|財政部|賦稅署|國稅局|公告|新聞稿|有關|關於|之'
+)
+
+# 字號與緊接的「令」、「函」（例如「台財稅字第11304512345號令」）
+RULING_REFERENCE_PATTERN = re.compile(f'(?:{RULING_NUMBER_PATTERN.pattern})[令函]?')
+
+# 比對時只保留中文與英數字
+NORMALIZE_PATTERN = re.compile(r'[^0-9a-z\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+
+
+def normalize_title(title):
+    """正規化標題：全半形統一、移除字號、套語與標點空白、「臺」統一為「台」"""
+    text = unicodedata.normalize('NFKC', title or '').lower().replace('臺', '台')
+    text = RULING_REFERENCE_PATTERN.sub('', text)
+    return BOILERPLATE_PATTERN.sub('', NORMALIZE_PATTERN.sub('', text))
+
+
+def shingles(title):
+    """將正規化後的標題切為重疊二字組"""
+    text = normalize_title(title)
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def to_signed(value):
+    """無號 64 位元整數轉為 SQLite 可存放的有號整數"""
+    return value - (1 << SIMHASH_BITS) if value >= 1 << (SIMHASH_BITS - 1) else value
+
+
+def simhash(title):
+    """計算標題的 SimHash 指紋（有號 64 位元整數），詞元不足時回傳 None"""
+    tokens = shingles(title)
+    if len(tokens) < MIN_SHINGLES:
+        return None
+
+    weights = [0] * SIMHASH_BITS
+    for token in tokens:
+        digest = int.from_bytes(
+            hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'big'
+        )
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if digest >> bit & 1 else -1
+
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return to_signed(fingerprint)
+
+
+def band_values(fingerprint):
+    """指紋各段的值，依段序排列"""
+    return [(fingerprint >> (band * BAND_BITS)) & BAND_MASK for band in range(SIMHASH_BANDS)]
+
+
+def hamming_distance(a, b):
+    """兩個指紋不同的位元數"""
+    return bin((a ^ b) & SIMHASH_MASK).count('1')
+
+
+def find_near_duplicate(conn, fingerprint, numberless_only=False, exclude=()):
+    """以分段索引找出與 fingerprint 最接近的函釋，回傳 (id, 距離) 或 None
+
+    numberless_only 為 True 時只比對尚無字號的資料；exclude 為要略過的 id。
+    """
+    if fingerprint is None:
+        return None
+
+    conditions = ' OR '.join(['(b.band = ? AND b.value = ?)'] * SIMHASH_BANDS)
+    params = [part for band, value in enumerate(band_values(fingerprint)) for part in (band, value)]
+    sql = f'''
+        SELECT DISTINCT r.id, r.simhash FROM simhash_bands b
+        JOIN tax_rulings r ON r.id = b.ruling_id
+        WHERE ({conditions})
+    '''
+    if numberless_only:
+        sql += ' AND r.ruling_number IS NULL'
+
+    best = None
+    for record_id, candidate in conn.execute(sql, params):
+        if record_id in exclude:
+            continue
+        distance = hamming_distance(fingerprint, candidate)
+        if distance <= MAX_DISTANCE and (best is None or distance < best[1]):
+            best = (record_id, distance)
+    return best
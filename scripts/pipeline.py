@@ -0,0 +1,433 @@
+# pipeline.py - 統一收集流程（來源外掛 + 抓取→解析→擷取→去重→寫入）
+import argparse
+import asyncio
+from datetime import datetime
+from urllib.parse import urljoin
+
+import metrics
+from database_manager import TaxDatabaseManager
+from date_utils import date_from_text
+from fetch_engine import AsyncFetchEngine
+from http_cache import HttpValidatorCache
+from rate_limiter import HostRateLimiter
+from ruling_number import extract_ruling_number
+from run_store import RunStore
+
+# 處理階段（依執行順序）與顯示名稱
+STAGES = {
+    'fetch': '抓取',
+    'parse': '解析',
+    'extract': '擷取',
+    'dedupe': '去重',
+    'store': '寫入',
+    'stream': '串流',
+    'db_write': '資料庫',
+    'detail': '內容頁',
+    'enrich': '分析',
+    'watch': '關注字詞',
+}
+
+# 標題含這些字詞時視為函釋候選（與 RSS 收集器相同的判斷）
+RULING_KEYWORDS = ('函釋', '解釋', '令')
+
+# 已註冊的來源外掛：代號 → 類別
+SOURCE_PLUGINS = {}
+
+
+def register_source(plugin_class):
+    """註冊來源外掛（類別裝飾器）"""
+    SOURCE_PLUGINS[plugin_class.name] = plugin_class
+    return plugin_class
+
+
+class SourcePlugin:
+    """資料來源外掛介面
+
+    子類別設定 name（--sources 使用的代號）與 label（寫入資料庫的來源名稱），
+    實作 targets() 與 parse()；extract() 預設依字號或關鍵字判斷是否為函釋。
+    streaming 為 True 的來源不經 targets()/parse()：抓取階段以 start() 在背景
+    開始讀取，寫入階段以 ingest() 取出寫入。抓取引擎與資料庫由執行器注入，所有來源共用。
+    """
+
+    name = None
+    label = None
+    streaming = False
+
+    def __init__(self, fetcher, db):
+        self.fetcher = fetcher
+        self.db = db
+
+    def targets(self):
+        """要抓取的 [(網址, 額外標頭或 None)]"""
+        raise NotImplementedError
+
+    def parse(self, response):
+        """將抓取結果解析為項目列表（項目至少包含 title 與 url）"""
+        raise NotImplementedError
+
+    def start(self):
+        """串流來源：在背景開始讀取（與其他來源的抓取同時進行）"""
+        raise NotImplementedError
+
+    def ingest(self):
+        """串流來源：寫入 start() 讀取的資料，回傳 (來源統計, 寫入筆數, 函釋列表)"""
+        raise NotImplementedError
+
+    def finish(self):
+        """寫入成功後呼叫（例如記錄已讀過的項目），預設不做任何事"""
+
+    def extract(self, item):
+        """將項目轉為函釋資料，不是函釋時回傳 None"""
+        title = item.get('title') or ''
+        number = item.get('ruling_number') or extract_ruling_number(title)
+        if not number and not any(keyword in title for keyword in RULING_KEYWORDS):
+            return None
+
+        return {
+            'ruling_number': number,
+            'title': title,
+            'content': item.get('summary', ''),
+            'source': self.label,
+            'issue_date': item.get('issue_date') or date_from_text(title),
+            'url': item.get('url', '')
+        }
+
+
+# 各外掛在建立時才匯入對應的收集器，只執行部分來源時不必載入其他來源的相依套件
+
+@register_source
+class DotRulingsSource(SourcePlugin):
+    """賦稅署函釋列表頁（封存原始HTML）"""
+
+    name = 'dot_rulings'
+    label = '賦稅署函釋'
+
+    def __init__(self, fetcher, db):
+        super().__init__(fetcher, db)
+        from mof_scraper import MOFTaxScraper
+        self.scraper = MOFTaxScraper(fetcher=fetcher)
+
+    def targets(self):
+        return [(self.scraper.rulings_url, self.scraper.headers)]
+
+    def parse(self, response):
+        self.scraper.archive_page(response['content'], response['url'], encoding=response['encoding'])
+        rulings = self.scraper.parse_rulings(response['text'])
+        for ruling in rulings:
+            ruling['url'] = urljoin(response['url'], ruling['url'])
+        return rulings
+
+
+@register_source
+class MofHomepageSource(SourcePlugin):
+    """財政部首頁連結"""
+
+    name = 'mof_home'
+    label = '財政部網站'
+
+    def __init__(self, fetcher, db):
+        super().__init__(fetcher, db)
+        from taiwan_tax_collector import TaiwanTaxCollector
+        self.collector = TaiwanTaxCollector(fetcher=fetcher)
+
+    def targets(self):
+        return [(self.collector.mof_url, None)]
+
+    def parse(self, response):
+        links = self.collector.parse_links(response['text'])
+        for link in links:
+            link['url'] = urljoin(response['url'], link['url'])
+        return links
+
+
+@register_source
+class RssFeedsSource(SourcePlugin):
+    """財政部與賦稅署RSS（串流解析，邊讀取邊寫入）"""
+
+    name = 'rss'
+    label = 'RSS'
+    streaming = True
+
+    def __init__(self, fetcher, db):
+        super().__init__(fetcher, db)
+        from advanced_collector import AdvancedTaxCollector
+        from feed_stream import FeedState
+        self.collector = AdvancedTaxCollector(fetcher=fetcher, db=db)
+        # 各RSS源上次讀過的項目，解析到這些項目即停止
+        self.state = FeedState()
+        self.reader = None
+        self.rulings = []
+
+    def start(self):
+        """每個RSS源一個執行緒邊下載邊解析，函釋暫存於有限長度的佇列"""
+        from feed_stream import StreamingFeedReader
+        self.rulings = []
+
+        def extract(item):
+            ruling = self.extract(item)
+            if ruling:
+                self.rulings.append(ruling)
+            return ruling
+
+        self.reader = StreamingFeedReader(self.fetcher, self.db, state=self.state)
+        self.reader.start(self.collector.rss_feeds, extract)
+
+    def ingest(self):
+        """讀取的項目、GUID 與驗證資訊由 StreamingFeedReader 在寫入成功後記錄"""
+        feeds, counts = self.reader.drain()
+        rulings = self.rulings
+        stats = {
+            'fetched': sum(1 for feed in feeds.values() if not feed['error']),
+            'unchanged': sum(1 for feed in feeds.values() if feed['stopped'] == 'unchanged'),
+            'failed': sum(1 for feed in feeds.values() if feed['error']),
+            'items': sum(feed['items'] for feed in feeds.values()),
+            'rulings': len(rulings),
+        }
+        return stats, counts, rulings
+
+    def extract(self, item):
+        if not self.collector.is_ruling_candidate(item):
+            return None
+        return self.collector.build_ruling_data(item)
+
+
+def dedupe_rulings(rulings):
+    """移除同一次執行中重複的函釋（同來源且同字號，無字號時比對標題與網址）
+
+    跨來源的近似重複由資料庫寫入時的指紋索引合併。
+    """
+    seen = set()
+    unique = []
+    for ruling in rulings:
+        key = (ruling['source'], ruling['ruling_number'] or (ruling['title'], ruling['url']))
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(ruling)
+    return unique
+
+
+class CollectionPipeline:
+    """在同一行程中執行所有選定的來源
+
+    所有來源共用一個抓取引擎（連線池與 HTTP 快取）與一個資料庫連線，
+    各階段耗時與計數記錄於 metrics 模組。
+    """
+
+    def __init__(self, sources=None, fetcher=None, db=None, enrich=False, details=False,
+                 watch=False):
+        names = list(sources or SOURCE_PLUGINS)
+        unknown = [name for name in names if name not in SOURCE_PLUGINS]
+        if unknown:
+            raise ValueError(f"未知的資料來源: {', '.join(unknown)}（可用: {', '.join(SOURCE_PLUGINS)}）")
+
+        self.run_store = RunStore()
+        self.fetcher = fetcher or AsyncFetchEngine(cache=HttpValidatorCache(), limiter=HostRateLimiter())
+        self.db = db or TaxDatabaseManager()
+        self.enrich = enrich
+        self.details = details
+        self.watch = watch
+        self.plugins = [SOURCE_PLUGINS[name](self.fetcher, self.db) for name in names]
+
+    def run(self, profile=False):
+        """同步介面：執行整個流程並輸出執行指標（profile 為 True 時一併剖析）"""
+        if profile:
+            with metrics.profiled('pipeline'):
+                summary = self.fetcher.run(self.run_async())
+        else:
+            summary = self.fetcher.run(self.run_async())
+
+        summary['metrics'] = metrics.recorder.export('pipeline', run_store=self.run_store)
+        return summary
+
+    async def run_async(self):
+        """抓取→解析→擷取→去重→寫入，回傳執行摘要"""
+        sources = {
+            plugin.name: {'fetched': 0, 'unchanged': 0, 'failed': 0, 'degraded': 0, 'items': 0,
+                          'rulings': 0}
+            for plugin in self.plugins
+        }
+
+        # 1. 抓取：串流來源在背景執行緒讀取RSS，同時並行下載其他來源的網址
+        for plugin in self.plugins:
+            if plugin.streaming:
+                plugin.start()
+        jobs = [(plugin, url, headers) for plugin in self.plugins if not plugin.streaming
+                for url, headers in plugin.targets()]
+        with metrics.timer('fetch'):
+            responses = await asyncio.gather(
+                *(self.fetcher.fetch(url, headers) for _, url, headers in jobs)
+            )
+
+        # 2. 解析
+        items = []
+        # 內容有變更的頁面的驗證資訊，寫入成功後才記錄（失敗時下次重新處理）
+        validators = []
+        with metrics.timer('parse'):
+            for (plugin, url, _), response in zip(jobs, responses):
+                stats = sources[plugin.name]
+                if response['circuit_open']:
+                    print(f"⚠ [{plugin.name}] 主機暫停中，略過: {url}")
+                    stats['degraded'] += 1
+                    continue
+                if not response['ok']:
+                    print(f"✗ [{plugin.name}] 抓取失敗: {url} ({response['error']})")
+                    stats['failed'] += 1
+                    continue
+                stats['fetched'] += 1
+                if response['unchanged']:
+                    print(f"✓ [{plugin.name}] 自上次執行後未變更，略過解析: {url}")
+                    stats['unchanged'] += 1
+                    continue
+
+                try:
+                    parsed = plugin.parse(response)
+                except Exception as e:
+                    print(f"✗ [{plugin.name}] 解析失敗: {url} ({type(e).__name__}: {e})")
+                    stats['failed'] += 1
+                    continue
+                stats['items'] += len(parsed)
+                metrics.count('items_parsed', len(parsed))
+                items.extend((plugin, item) for item in parsed)
+                validators.append((url, response['validator']))
+
+        # 3. 擷取函釋
+        rulings = []
+        with metrics.timer('extract'):
+            for plugin, item in items:
+                ruling = plugin.extract(item)
+                if ruling:
+                    rulings.append(ruling)
+                    sources[plugin.name]['rulings'] += 1
+
+        metrics.count('rulings_extracted', len(rulings))
+
+        # 4. 去重
+        with metrics.timer('dedupe'):
+            rulings = dedupe_rulings(rulings)
+
+        # 5. 寫入（只有新增或變更的函釋會實際寫入）
+        # 6. 抓取尚無內文的函釋內容頁（只處理新收錄或先前失敗的函釋）
+        # 兩者記錄在同一個收集批次，內文更新也會出現在 changes_since()
+        counts, details = {}, {}
+        with self.db:
+            self.db.start_run('pipeline')
+            with metrics.timer('store'):
+                if rulings:
+                    counts = self.db.insert_rulings_bulk(rulings)
+            for plugin in self.plugins:
+                if plugin.streaming:
+                    with metrics.timer('stream'):
+                        stats, written, streamed = plugin.ingest()
+                    sources[plugin.name].update(stats)
+                    for key, value in written.items():
+                        counts[key] = counts.get(key, 0) + value
+                    rulings.extend(streamed)
+
+            # 有批次寫入失敗時不記錄進度與驗證資訊，下次重新處理
+            if counts.get('failed'):
+                print(f"⚠ {counts['failed']} 筆寫入失敗，不記錄本次讀取進度")
+            else:
+                for plugin in self.plugins:
+                    plugin.finish()
+                if self.fetcher.cache is not None:
+                    for url, validator in validators:
+                        self.fetcher.cache.remember(url, validator)
+            if self.fetcher.cache is not None:
+                self.fetcher.cache.flush()
+
+            if self.details:
+                with metrics.timer('detail'):
+                    from detail_fetcher import DetailFetcher
+                    details = await DetailFetcher(self.db, self.fetcher).run_async()
+            status = self.run_status(sources)
+            self.db.finish_run({**counts, 'details': details, **status})
+
+        if self.enrich:
+            with metrics.timer('enrich'):
+                from enrichment import RulingEnricher
+                RulingEnricher(self.db).run()
+
+        if self.watch:
+            with metrics.timer('watch'):
+                from watchlist import WatchlistEngine
+                WatchlistEngine(self.db).run()
+
+        summary = {
+            'scan_time': datetime.now().isoformat(),
+            **status,
+            'sources': sources,
+            'counts': counts,
+            'details': details,
+            'timings': {name: round(entry['seconds'], 3)
+                        for name, entry in metrics.recorder.stages.items()},
+            'rulings': rulings
+        }
+        self.save_summary(summary)
+        self.display_summary(summary)
+        return summary
+
+    def run_status(self, sources):
+        """本次執行狀態：有來源抓取失敗或主機斷路時為 'degraded'，並列出受影響的來源與主機"""
+        degraded_sources = [name for name, stats in sources.items()
+                            if stats['failed'] or stats['degraded']]
+        degraded_hosts = self.fetcher.limiter.degraded_hosts() if self.fetcher.limiter else []
+        return {
+            'status': 'degraded' if degraded_sources or degraded_hosts else 'ok',
+            'degraded_sources': degraded_sources,
+            'degraded_hosts': degraded_hosts
+        }
+
+    def save_summary(self, summary):
+        """儲存本次收集的函釋（沒有新資料時略過，降級執行時仍記錄狀態）"""
+        if not summary['rulings'] and summary['status'] == 'ok':
+            print("✓ 沒有新資料，略過儲存")
+            return None
+
+        entry = self.run_store.append('pipeline', summary)
+        print(f"✓ 資料已儲存: runs/{entry['partition']}")
+        return entry
+
+    def display_summary(self, summary):
+        """顯示各來源結果與各階段耗時"""
+        print("\n" + "="*60)
+        print("收集流程摘要")
+        print("="*60)
+        for name, stats in summary['sources'].items():
+            print(f"{name:<12} 頁面 {stats['fetched']}（未變更 {stats['unchanged']}，失敗 {stats['failed']}，"
+                  f"暫停 {stats['degraded']}） 項目 {stats['items']} 函釋 {stats['rulings']}")
+
+        print("\n階段耗時:")
+        for name, seconds in summary['timings'].items():
+            print(f"  {STAGES.get(name, name):<6}{seconds:>8.3f}s")
+
+        if self.fetcher.cache is not None:
+            self.fetcher.cache.report()
+        if self.fetcher.limiter is not None:
+            self.fetcher.limiter.report()
+        if summary['status'] == 'degraded':
+            print(f"⚠ 降級執行：來源 {', '.join(summary['degraded_sources']) or '無'}，"
+                  f"暫停中的主機 {', '.join(summary['degraded_hosts']) or '無'}")
+        print("="*60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='執行稅務資料收集流程')
+    parser.add_argument('--sources', help=f"以逗號分隔的來源代號（預設全部: {', '.join(SOURCE_PLUGINS)}）")
+    parser.add_argument('--details', action='store_true', help='寫入後抓取尚無內文的函釋內容頁')
+    parser.add_argument('--enrich', action='store_true', help='寫入後執行關鍵字擷取與分類')
+    parser.add_argument('--watch', action='store_true', help='比對關注字詞並產生訂閱通知')
+    parser.add_argument('--list-sources', action='store_true', help='列出可用的來源')
+    parser.add_argument('--profile', action='store_true',
+                        help='以 cProfile 與 tracemalloc 剖析執行（結果存於 data/metrics）')
+    args = parser.parse_args()
+
+    if args.list_sources:
+        for name, plugin_class in SOURCE_PLUGINS.items():
+            print(f"{name:<12} {plugin_class.label:<10} {plugin_class.__doc__}")
+    else:
+        sources = [name.strip() for name in args.sources.split(',') if name.strip()] if args.sources else None
+        pipeline = CollectionPipeline(sources, enrich=args.enrich, details=args.details,
+                                      watch=args.watch)
+        pipeline.run(profile=args.profile)
+        pipeline.db.generate_report()
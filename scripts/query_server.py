@@ -0,0 +1,418 @@
+# query_server.py - 函釋資料庫查詢服務（HTTP JSON，唯讀連線池 + 回應快取）
+import argparse
+import base64
+import gzip
+import json
+import os
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from database_manager import REPORT_MONTHS, TaxDatabaseManager, build_fts_query, make_snippet
+from date_utils import normalize_date
+
+# 預設監聽位址（只接受本機連線）
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8780
+
+# 唯讀連線數與快取的回應數
+DEFAULT_POOL_SIZE = 8
+DEFAULT_CACHE_SIZE = 256
+
+# 每頁筆數
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# 超過此大小且用戶端支援時才壓縮回應
+GZIP_MIN_BYTES = 512
+
+# 函釋欄位（列表與單筆查詢共用）
+RULING_FIELDS = 'r.id, r.ruling_number, r.title, r.source, r.issue_date, r.url, r.category'
+
+
+class QueryError(ValueError):
+    """查詢參數錯誤（回應 400）"""
+
+
+def encode_cursor(values):
+    """將排序鍵編碼為分頁游標"""
+    raw = json.dumps(values, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, key_type):
+    """解碼分頁游標為 (排序鍵, id)，排序鍵須為 key_type，格式錯誤時拋出 QueryError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except ValueError:
+        raise QueryError(f"無效的分頁游標: {cursor}")
+    # bool 是 int 的子類別，需另外排除
+    if (not isinstance(values, list) or len(values) != 2
+            or not all(isinstance(value, expected) and not isinstance(value, bool)
+                       for value, expected in zip(values, (key_type, int)))):
+        raise QueryError(f"無效的分頁游標: {cursor}")
+    return values
+
+
+def page_size(value):
+    """解析 limit 參數（1～MAX_PAGE_SIZE）"""
+    if value is None:
+        return DEFAULT_PAGE_SIZE
+    try:
+        size = int(value)
+    except ValueError:
+        raise QueryError(f"無效的筆數: {value}")
+    return min(max(size, 1), MAX_PAGE_SIZE)
+
+
+class ReadOnlyPool:
+    """固定大小的唯讀連線池
+
+    連線以 mode=ro 開啟並設定 query_only，WAL 模式下讀取不會阻擋
+    每晚的寫入程序，也不會被寫入阻擋。
+    """
+
+    def __init__(self, db_path, size=DEFAULT_POOL_SIZE):
+        self.db_path = os.path.abspath(db_path)
+        self._idle = queue.LifoQueue()
+        for _ in range(size):
+            self._idle.put(self._connect())
+
+    def _connect(self):
+        conn = sqlite3.connect(Path(self.db_path).as_uri() + '?mode=ro', uri=True, check_same_thread=False)
+        conn.execute('PRAGMA query_only=ON')
+        conn.execute('PRAGMA busy_timeout=5000')
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """借用一個連線（全部使用中時等待）"""
+        conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+
+
+class ResponseCache:
+    """以資料變更計數為版本的 LRU 回應快取
+
+    寫入程序每次新增或修改資料都會使計數遞增，版本不同的項目視為失效。
+    """
+
+    def __init__(self, capacity=DEFAULT_CACHE_SIZE):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, value):
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+
+def rows_to_dicts(cursor):
+    columns = [col[0] for col in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+class RulingQueryService:
+    """查詢邏輯（與 HTTP 無關，回傳可輸出為 JSON 的字典）
+
+    列表查詢使用鍵集分頁：回應的 next 游標記錄最後一筆的排序鍵，
+    下一頁從該鍵之後繼續，不需要 OFFSET 掃過前面的資料。
+    """
+
+    def __init__(self, db_path, pool_size=DEFAULT_POOL_SIZE, cache_size=DEFAULT_CACHE_SIZE):
+        self.pool = ReadOnlyPool(db_path, pool_size)
+        self.cache = ResponseCache(cache_size)
+
+    def version(self):
+        """目前的資料變更計數"""
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT value FROM db_meta WHERE key = 'change_counter'").fetchone()
+        return row[0] if row else 0
+
+    def search(self, params):
+        """GET /search?q=關鍵字&limit=&cursor=，依相關度排序"""
+        keyword = (params.get('q') or '').strip()
+        query = build_fts_query(keyword)
+        if not query:
+            raise QueryError("缺少搜尋關鍵字 q")
+        limit = page_size(params.get('limit'))
+
+        conditions, args = '', [query]
+        if params.get('cursor'):
+            score, last_id = decode_cursor(params['cursor'], (int, float))
+            conditions = 'WHERE score > ? OR (score = ? AND id > ?)'
+            args += [score, score, last_id]
+
+        with self.pool.connection() as conn:
+            cursor = conn.execute(f'''
+                SELECT * FROM (
+                    SELECT {RULING_FIELDS}, r.content,
+                           bm25(tax_rulings_fts, 10.0, 1.0) AS score
+                    FROM tax_rulings_fts
+                    JOIN tax_rulings r ON r.id = tax_rulings_fts.rowid
+                    WHERE tax_rulings_fts MATCH ?
+                )
+                {conditions}
+                ORDER BY score, id
+                LIMIT ?
+            ''', args + [limit + 1])
+            rows = rows_to_dicts(cursor)
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        results = []
+        for row in rows:
+            content = row.pop('content')
+            row['snippet'] = make_snippet(content or row['title'], keyword)
+            results.append(row)
+
+        return {
+            'query': keyword,
+            # bm25() 越小越相關，輸出時轉為正值；游標保留原始值
+            'results': [{**row, 'score': round(-row['score'], 4)} for row in results],
+            'next': encode_cursor([rows[-1]['score'], rows[-1]['id']]) if has_more else None
+        }
+
+    def rulings_between(self, params):
+        """GET /rulings?start=&end=&limit=&cursor=，依發布日期由新到舊"""
+        conditions, args = ['r.issue_date IS NOT NULL'], []
+        for key, operator in (('start', '>='), ('end', '<=')):
+            if params.get(key):
+                normalized = normalize_date(params[key])
+                if normalized is None:
+                    raise QueryError(f"無法辨識的日期: {params[key]}")
+                conditions.append(f'r.issue_date {operator} ?')
+                args.append(normalized)
+
+        if params.get('cursor'):
+            last_date, last_id = decode_cursor(params['cursor'], str)
+            conditions.append('(r.issue_date < ? OR (r.issue_date = ? AND r.id < ?))')
+            args += [last_date, last_date, last_id]
+
+        limit = page_size(params.get('limit'))
+        with self.pool.connection() as conn:
+            cursor = conn.execute(f'''
+                SELECT {RULING_FIELDS} FROM tax_rulings r
+                WHERE {' AND '.join(conditions)}
+                ORDER BY r.issue_date DESC, r.id DESC
+                LIMIT ?
+            ''', args + [limit + 1])
+            rows = rows_to_dicts(cursor)
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return {
+            'results': rows,
+            'next': encode_cursor([rows[-1]['issue_date'], rows[-1]['id']]) if has_more else None
+        }
+
+    def ruling(self, number):
+        """GET /rulings/<字號>，含內文與各來源紀錄；查無資料時回傳 None"""
+        with self.pool.connection() as conn:
+            cursor = conn.execute(f'''
+                SELECT {RULING_FIELDS}, r.content, r.keywords, r.issue_date_raw, r.scraped_date
+                FROM tax_rulings r WHERE r.ruling_number = ?
+            ''', (number,))
+            rows = rows_to_dicts(cursor)
+            if not rows:
+                return None
+
+            ruling = rows[0]
+            ruling['keywords'] = json.loads(ruling['keywords']) if ruling['keywords'] else []
+            cursor = conn.execute('''
+                SELECT source, url, title, first_seen FROM ruling_sources
+                WHERE ruling_id = ? ORDER BY first_seen
+            ''', (ruling['id'],))
+            ruling['sources'] = rows_to_dicts(cursor)
+        return ruling
+
+    def stats(self, params):
+        """GET /stats，讀取觸發程序維護的筆數與彙總表"""
+        with self.pool.connection() as conn:
+            counts = dict(conn.execute('SELECT table_name, count FROM table_counts').fetchall())
+            last_update = conn.execute('SELECT MAX(scraped_date) FROM tax_rulings').fetchone()[0]
+
+            breakdown = {}
+            for dimension in ('source', 'category', 'month'):
+                order = 'month DESC' if dimension == 'month' else 'total DESC'
+                rows = conn.execute(f'''
+                    SELECT {dimension}, SUM(count) AS total FROM ruling_summary
+                    GROUP BY {dimension} HAVING total > 0 ORDER BY {order}
+                ''').fetchall()
+                breakdown[dimension] = [{'value': value, 'count': total} for value, total in rows]
+        breakdown['month'] = [row for row in breakdown['month'] if row['value']][:REPORT_MONTHS]
+
+        return {
+            'total_rulings': counts.get('tax_rulings', 0),
+            'total_news': counts.get('tax_news', 0),
+            'last_update': last_update,
+            'by_source': breakdown['source'],
+            'by_category': breakdown['category'],
+            'by_month': breakdown['month'],
+            'cache': {'hits': self.cache.hits, 'misses': self.cache.misses},
+        }
+
+    def close(self):
+        self.pool.close()
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """路徑：
+    /search?q=關鍵字             全文搜尋
+    /rulings?start=&end=         依發布日期查詢
+    /rulings/<字號>              單筆函釋
+    /stats                       統計
+    列表共用參數：limit=筆數、cursor=上一頁回應的 next
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        service = self.server.service
+        url = urlsplit(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        version = service.version()
+
+        # /stats 含快取命中數，不快取
+        key = url.path + '?' + '&'.join(f'{k}={v}' for k, v in sorted(params.items()))
+        cached = service.cache.get(key, version) if url.path != '/stats' else None
+        if cached is None:
+            try:
+                status, payload = self.route(service, url.path, params)
+            except QueryError as e:
+                status, payload = 400, {'error': str(e)}
+            body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            cached = (status, body, gzip.compress(body) if len(body) >= GZIP_MIN_BYTES else None)
+            if status == 200 and url.path != '/stats':
+                service.cache.put(key, version, cached)
+
+        status, body, compressed = cached
+        etag = f'"{version}-{len(body)}"'
+        if status == 200 and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Vary', 'Accept-Encoding')
+        if status == 200:
+            self.send_header('ETag', etag)
+        if compressed is not None and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = compressed
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def route(self, service, path, params):
+        """依路徑呼叫查詢，回傳 (狀態碼, 內容)"""
+        if path == '/search':
+            return 200, service.search(params)
+        if path == '/rulings':
+            return 200, service.rulings_between(params)
+        if path.startswith('/rulings/'):
+            ruling = service.ruling(unquote(path[len('/rulings/'):]))
+            if ruling is None:
+                return 404, {'error': '查無此函釋'}
+            return 200, ruling
+        if path == '/stats':
+            return 200, service.stats(params)
+        return 404, {'error': f'未知的路徑: {path}'}
+
+
+class QueryServer:
+    """在背景執行緒或前景啟動查詢服務（port 0 表示自動選擇可用埠）"""
+
+    def __init__(self, db_path=None, host=DEFAULT_HOST, port=DEFAULT_PORT,
+                 pool_size=DEFAULT_POOL_SIZE, cache_size=DEFAULT_CACHE_SIZE, verbose=False):
+        # 先經由 TaxDatabaseManager 套用結構遷移，唯讀連線才能查詢最新的資料表
+        db_path = TaxDatabaseManager(db_path).db_path
+        self.service = RulingQueryService(db_path, pool_size, cache_size)
+        self.httpd = ThreadingHTTPServer((host, port), QueryHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.service = self.service
+        self.httpd.verbose = verbose
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def serve_forever(self):
+        try:
+            self.httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        if self.thread is not None:
+            self.httpd.shutdown()
+        self.httpd.server_close()
+        self.service.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='啟動函釋查詢服務')
+    parser.add_argument('--db', help='資料庫路徑（預設 data/tax_monitor.db）')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='監聽位址')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='埠號')
+    parser.add_argument('--pool-size', type=int, default=DEFAULT_POOL_SIZE, help='唯讀連線數')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE, help='快取的回應數')
+    parser.add_argument('--verbose', action='store_true', help='輸出每個請求的記錄')
+    args = parser.parse_args()
+
+    server = QueryServer(args.db, args.host, args.port, args.pool_size, args.cache_size, args.verbose)
+    print(f"✓ 查詢服務: {server.base_url}（Ctrl+C 結束）")
+    print(f"  {server.base_url}/search?q=交際費")
+    print(f"  {server.base_url}/rulings?start=2024-01-01&limit=20")
+    print(f"  {server.base_url}/stats")
+    server.serve_forever()
@@ -0,0 +1,287 @@
+# rate_limiter.py - 每個主機的自適應請求速率與斷路器（政府網站限流或逾時時自動降速、暫停）
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+# 每個主機的初始與上下限速率（每秒請求數）
+DEFAULT_RATE = 2.0
+MIN_RATE = 0.2
+MAX_RATE = 8.0
+
+# 令牌桶容量（可連續送出的請求數）
+DEFAULT_BURST = 4
+
+# 成功時每次增加的速率；被限流或失敗時乘上的比例（加法增、乘法減）
+RATE_INCREASE = 0.1
+RATE_DECREASE = 0.5
+
+# 回應超過此秒數視為過慢，速率乘上 SLOW_DECREASE
+SLOW_SECONDS = 5.0
+SLOW_DECREASE = 0.8
+
+# 連續失敗幾次後斷路（暫停對該主機送出請求）
+FAILURE_THRESHOLD = 3
+
+# 斷路後的暫停秒數；再次斷路時加倍，最長 MAX_COOLOFF
+DEFAULT_COOLOFF = 15 * 60
+MAX_COOLOFF = 6 * 60 * 60
+
+# 試探請求超過此秒數仍未回報結果時視為遺失（例如被取消），再放行下一個試探請求
+PROBE_TIMEOUT = 60.0
+
+# 每個主機在同一次執行中可使用的請求秒數，用完即斷路（避免單一主機耗盡整體執行時間）
+DEFAULT_HOST_BUDGET = 300.0
+
+# 表示伺服器要求降速的狀態碼
+THROTTLE_STATUS = {429, 503}
+
+# 斷路器狀態
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+def parse_retry_after(value):
+    """解析 Retry-After 標頭（秒數或 HTTP 日期），回傳等待秒數或 None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    # email 套件載入較慢，只有遇到日期格式時才匯入
+    from email.utils import parsedate_to_datetime
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if when is None or when.tzinfo is None:
+        return None
+    return max(when.timestamp() - time.time(), 0.0)
+
+
+class HostRateLimiter:
+    """所有主機的令牌桶與斷路器
+
+    每個主機各有一個令牌桶：成功時緩慢提高速率，遇到 429/5xx、逾時或
+    回應過慢時降低速率，並遵守 Retry-After。連續失敗 FAILURE_THRESHOLD 次
+    或用完該主機的時間預算時斷路，冷卻期間對該主機的請求直接略過；
+    冷卻結束後只放行一個試探請求，成功才恢復，失敗則再次斷路。
+
+    學到的速率與斷路狀態寫入 data/host_limits.json，下次執行沿用。
+    同時供事件迴圈與工作執行緒使用，以鎖保護。
+    """
+
+    def __init__(self, path=None, rate=DEFAULT_RATE, burst=DEFAULT_BURST,
+                 min_rate=MIN_RATE, max_rate=MAX_RATE, failure_threshold=FAILURE_THRESHOLD,
+                 cooloff=DEFAULT_COOLOFF, host_budget=DEFAULT_HOST_BUDGET,
+                 slow_seconds=SLOW_SECONDS):
+        base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.path = path or os.path.join(base_path, "data", "host_limits.json")
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.rate = rate
+        self.burst = burst
+        self.max_rate = max(max_rate, rate)
+        # 上限低於預設下限時（例如指定較長的請求間隔），降速也不會超過上限
+        self.min_rate = min(min_rate, self.max_rate)
+        self.failure_threshold = failure_threshold
+        self.cooloff = cooloff
+        self.host_budget = host_budget
+        self.slow_seconds = slow_seconds
+        self.hosts = self._load()
+        self.tripped = set()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """讀取上次執行的狀態（只保留速率與斷路資訊，本次執行的計數重新開始）"""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            print("⚠ 主機限速狀態檔損毀，重新建立")
+            return {}
+        return {host: self._new_host(entry) for host, entry in saved.items()}
+
+    def _new_host(self, saved=None):
+        saved = saved or {}
+        return {
+            'rate': min(max(saved.get('rate', self.rate), self.min_rate), self.max_rate),
+            'tokens': float(self.burst),
+            'updated': time.monotonic(),
+            'paused_until': 0.0,
+            'state': saved.get('state', CLOSED),
+            'open_until': saved.get('open_until', 0.0),
+            'trips': saved.get('trips', 0),
+            'failures': 0,
+            'probe_started': None,
+            'spent': 0.0,
+            'requests': 0,
+            'throttled': 0,
+            'last_error': saved.get('last_error'),
+        }
+
+    def _host(self, host):
+        if host not in self.hosts:
+            self.hosts[host] = self._new_host()
+        return self.hosts[host]
+
+    def save(self):
+        """寫入狀態檔（先寫暫存檔再取代，避免中斷時損毀）"""
+        with self._lock:
+            saved = {
+                host: {
+                    'rate': round(entry['rate'], 3),
+                    'state': entry['state'],
+                    'open_until': entry['open_until'],
+                    'trips': entry['trips'],
+                    'last_error': entry['last_error'],
+                    'updated_at': datetime.now().isoformat()
+                }
+                for host, entry in self.hosts.items()
+            }
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(saved, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def allow(self, host):
+        """斷路中（冷卻期間）回傳 False；冷卻結束時轉為試探狀態
+
+        試探狀態只放行一個請求，其他請求在 record() 恢復或再次斷路前回傳 False。
+        """
+        with self._lock:
+            entry = self._host(host)
+            if entry['state'] == OPEN:
+                if time.time() < entry['open_until']:
+                    return False
+                entry['state'] = HALF_OPEN
+                entry['failures'] = 0
+                entry['spent'] = 0.0
+            if entry['state'] == HALF_OPEN:
+                now = time.monotonic()
+                if entry['probe_started'] is not None and now - entry['probe_started'] < PROBE_TIMEOUT:
+                    return False
+                entry['probe_started'] = now
+            return True
+
+    def reserve(self, host):
+        """取得一個令牌，回傳送出請求前需要等待的秒數"""
+        with self._lock:
+            entry = self._host(host)
+            now = time.monotonic()
+            entry['tokens'] = min(self.burst, entry['tokens'] + (now - entry['updated']) * entry['rate'])
+            entry['updated'] = now
+            # 令牌不足時預先扣除（可為負數），等待時間即補足所需的時間
+            entry['tokens'] -= 1
+            wait = max(-entry['tokens'] / entry['rate'], 0.0)
+            return max(wait, entry['paused_until'] - now)
+
+    def record(self, host, status=None, elapsed=0.0, error=None, retry_after=None):
+        """記錄一次請求結果並調整速率與斷路狀態
+
+        status 為 HTTP 狀態碼（連線錯誤或逾時時為 None，原因放在 error）。
+        """
+        with self._lock:
+            entry = self._host(host)
+            entry['requests'] += 1
+            entry['spent'] += elapsed
+            failed = error is not None or status is None or status >= 500 or status == 429
+
+            if status in THROTTLE_STATUS:
+                entry['throttled'] += 1
+                delay = parse_retry_after(retry_after)
+                if delay:
+                    entry['paused_until'] = time.monotonic() + delay
+
+            if failed:
+                entry['rate'] = max(self.min_rate, entry['rate'] * RATE_DECREASE)
+                entry['tokens'] = min(entry['tokens'], 0.0)
+                entry['failures'] += 1
+                entry['last_error'] = error or f"HTTP {status}"
+            else:
+                entry['failures'] = 0
+                if elapsed > self.slow_seconds:
+                    entry['rate'] = max(self.min_rate, entry['rate'] * SLOW_DECREASE)
+                else:
+                    entry['rate'] = min(self.max_rate, entry['rate'] + RATE_INCREASE)
+                if entry['state'] == HALF_OPEN:
+                    entry['state'] = CLOSED
+                    entry['trips'] = 0
+                    entry['probe_started'] = None
+
+            over_budget = self.host_budget is not None and entry['spent'] > self.host_budget
+            should_trip = (
+                entry['state'] == HALF_OPEN and failed
+                or entry['failures'] >= self.failure_threshold
+                or over_budget
+            )
+            if should_trip and entry['state'] != OPEN:
+                if over_budget and not failed:
+                    entry['last_error'] = f"超過時間預算 {self.host_budget:.0f}s"
+                self._trip(host, entry)
+                return True
+            return False
+
+    def _trip(self, host, entry):
+        """斷路：冷卻時間隨連續斷路次數加倍"""
+        cooloff = min(self.cooloff * (2 ** entry['trips']), MAX_COOLOFF)
+        entry['state'] = OPEN
+        entry['open_until'] = time.time() + cooloff
+        entry['probe_started'] = None
+        entry['trips'] += 1
+        self.tripped.add(host)
+        print(f"⚠ {host} 已暫停 {cooloff / 60:.0f} 分鐘（{entry['last_error']}）")
+
+    def degraded_hosts(self):
+        """本次執行中斷路過、或仍在冷卻中的主機"""
+        with self._lock:
+            now = time.time()
+            return sorted(
+                host for host, entry in self.hosts.items()
+                if host in self.tripped or (entry['state'] == OPEN and now < entry['open_until'])
+            )
+
+    def reset(self, host=None):
+        """清除指定主機（None 表示全部）的斷路狀態與學到的速率"""
+        with self._lock:
+            for name in [host] if host else list(self.hosts):
+                self.hosts.pop(name, None)
+                self.tripped.discard(name)
+
+    def report(self):
+        """輸出各主機的速率與斷路狀態，並寫入狀態檔"""
+        degraded = self.degraded_hosts()
+        for host, entry in sorted(self.hosts.items()):
+            if not entry['requests'] and host not in degraded:
+                continue
+            mark = '⚠' if host in degraded else '✓'
+            state = '暫停中' if entry['state'] == OPEN else ('試探中' if entry['state'] == HALF_OPEN else '正常')
+            print(f"{mark} {host}: {state}, 速率 {entry['rate']:.2f}/s, 請求 {entry['requests']}, "
+                  f"限流 {entry['throttled']}, 耗時 {entry['spent']:.1f}s")
+        self.save()
+        return degraded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='檢視或重設各主機的限速與斷路狀態')
+    parser.add_argument('--reset', nargs='?', const='', metavar='HOST',
+                        help='清除斷路狀態（未指定主機時清除全部）')
+    args = parser.parse_args()
+
+    limiter = HostRateLimiter()
+    if args.reset is not None:
+        limiter.reset(args.reset or None)
+        limiter.save()
+        print(f"✓ 已重設: {args.reset or '全部主機'}")
+    elif not limiter.hosts:
+        print("尚無主機紀錄")
+    else:
+        now = time.time()
+        for host, entry in sorted(limiter.hosts.items()):
+            remaining = entry['open_until'] - now
+            state = f"暫停中（剩 {remaining / 60:.0f} 分鐘）" if entry['state'] == OPEN and remaining > 0 else '正常'
+            print(f"{host:<28} 速率 {entry['rate']:.2f}/s  {state}  最近錯誤: {entry['last_error'] or '無'}")
@@ -0,0 +1,89 @@
+# ruling_number.py - 函釋字號擷取（單一預先編譯的正則表達式）
+import re
+
+# 全形數字轉半形
+FULLWIDTH_DIGITS = str.maketrans('０１２３４５６７８９', '0123456789')
+
+# 所有字號格式合併為單一交替式，一次掃描即可找出全部字號；
+# 直接比對全形數字，只在輸出時轉換字號部分，不必先轉換整段文字
+RULING_NUMBER_PATTERN = re.compile(
+    r'(?P<prefix>[台臺]財(?P<office>稅|關|產)字第|財政部)\s*(?P<digits>[0-9０-９]+)\s*號'
+    r'|(?<![0-9０-９])(?P<bare>[0-9０-９]{10,12})\s*號'
+)
+
+# 每個字號都以此字結尾，不含此字的文字可直接略過正則比對
+RULING_NUMBER_SUFFIX = '號'
+
+# 字號類別
+KIND_BY_OFFICE = {'稅': 'tax', '關': 'customs', '產': 'property'}
+
+
+def normalize_digits(text):
+    """全形數字轉為半形"""
+    return (text or '').translate(FULLWIDTH_DIGITS)
+
+
+def canonicalize(match):
+    """將比對結果轉為標準字號（半形數字、去除空白、「臺」統一為「台」）"""
+    if match.group('bare'):
+        return f"{normalize_digits(match.group('bare'))}號"
+
+    prefix = match.group('prefix').replace('臺', '台')
+    return f"{prefix}{normalize_digits(match.group('digits'))}號"
+
+
+def canonical_ruling_number(number, title=None):
+    """將已儲存的字號轉為目前的標準格式
+
+    舊版只儲存數字部分（例如「11304512345號」），標題中有相同號碼的
+    完整字號時改用完整字號；無法辨識的字號原樣回傳。
+    """
+    canonical = extract_ruling_number(number) or number
+    if not canonical or not canonical[:-1].isdigit():
+        return canonical
+    for match in RULING_NUMBER_PATTERN.finditer(title or ''):
+        if not match.group('bare') and f"{normalize_digits(match.group('digits'))}號" == canonical:
+            return canonicalize(match)
+    return canonical
+
+
+def extract_ruling_numbers(text):
+    """擷取文字中所有函釋字號
+
+    回傳 [{'raw': 原文, 'canonical': 標準字號, 'kind': 類別, 'start': 起點, 'end': 終點}]
+    """
+    results = []
+    if not text or RULING_NUMBER_SUFFIX not in text:
+        return results
+
+    for match in RULING_NUMBER_PATTERN.finditer(text):
+        if match.group('bare'):
+            kind = 'bare'
+        elif match.group('office'):
+            kind = KIND_BY_OFFICE[match.group('office')]
+        else:
+            kind = 'mof'
+
+        results.append({
+            'raw': match.group(),
+            'canonical': canonicalize(match),
+            'kind': kind,
+            'start': match.start(),
+            'end': match.end()
+        })
+    return results
+
+
+def extract_ruling_number(text):
+    """擷取第一個函釋字號（標準格式），找不到時回傳 None"""
+    if not text or RULING_NUMBER_SUFFIX not in text:
+        return None
+    match = RULING_NUMBER_PATTERN.search(text)
+    return canonicalize(match) if match else None
+
+
+def contains_ruling_number(text):
+    """文字中是否含有函釋字號"""
+    if not text or RULING_NUMBER_SUFFIX not in text:
+        return False
+    return RULING_NUMBER_PATTERN.search(text) is not None
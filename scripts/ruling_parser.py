@@ -0,0 +1,184 @@
+# ruling_parser.py - 函釋列表頁與內容頁解析器（lxml 串流 / BeautifulSoup 後端）
+import re
+from datetime import datetime
+from io import BytesIO
+
+from bs4 import BeautifulSoup
+from lxml import etree
+
+from date_utils import date_from_text
+from encoding_resolver import to_utf8
+from ruling_number import extract_ruling_number
+
+# 預設解析後端
+DEFAULT_BACKEND = 'lxml'
+
+# 內文擷取時略過的標籤
+SKIP_TAGS = ('script', 'style', 'noscript', 'nav', 'header', 'footer')
+
+# 可能包含正文的區塊（依序嘗試，取文字最多者）
+CONTENT_XPATH = (
+    '//main | //article'
+    ' | //*[contains(@class, "content") or contains(@class, "article") or contains(@id, "content")]'
+)
+
+# 內容頁的欄位標籤（「發文單位：財政部」、「發文字號：台財稅字第…號」、「發文日期：…」）
+FIELD_LABEL_PATTERNS = {
+    'authority': re.compile(r'(?:發文(?:單位|機關)|發布機關)\s*[:：]\s*([\u4e00-\u9fff]+)'),
+    'ruling_number': re.compile(r'(?:發文)?字號\s*[:：]\s*([^\s]{4,40})'),
+    'issue_date': re.compile(r'(?:發文|發布)日期\s*[:：]\s*([^\n]{6,30})'),
+}
+
+# 找不到發文機關標籤時，依字號前綴推斷
+AUTHORITY_BY_PREFIX = {'台財': '財政部', '財政部': '財政部'}
+
+
+def _to_bytes(html, encoding):
+    """統一轉為 UTF-8 位元組（Big5 等其他編碼先以 Python 轉碼，不依賴 libxml2 的編碼支援）
+
+    已有 fetch 結果的 text 時直接傳入文字，不必再從 content 解碼一次；
+    傳入位元組時 encoding 為其編碼（Python 編碼名稱），會覆寫頁面內的 <meta charset>。
+    """
+    if isinstance(html, str):
+        return html.encode('utf-8'), 'utf-8'
+    return to_utf8(html, encoding), 'utf-8'
+
+
+class LxmlBackend:
+    """以 lxml iterparse 串流解析，只處理 <title> 與 <a>，處理完即釋放節點"""
+
+    name = 'lxml'
+
+    def iter_elements(self, html, encoding='utf-8'):
+        """依文件順序產生 ('title' 或 'a', 文字, href)"""
+        content, encoding = _to_bytes(html, encoding)
+        events = etree.iterparse(
+            BytesIO(content), events=('end',), tag=('title', 'a'),
+            html=True, recover=True, encoding=encoding
+        )
+        for _, element in events:
+            text = ''.join(part.strip() for part in element.itertext())
+            yield element.tag, text, element.get('href')
+
+            # 釋放已處理的節點，以及它與各層祖先前面已解析完的兄弟節點，
+            # 讓記憶體不隨頁面大小成長
+            element.clear(keep_tail=True)
+            for node in [element, *element.iterancestors()]:
+                parent = node.getparent()
+                while parent is not None and node.getprevious() is not None:
+                    del parent[0]
+
+
+class BeautifulSoupBackend:
+    """以 BeautifulSoup html.parser 建立完整文件樹（相容舊行為的後備方案）"""
+
+    name = 'bs4'
+
+    def iter_elements(self, html, encoding='utf-8'):
+        """依文件順序產生 ('title' 或 'a', 文字, href)"""
+        if isinstance(html, bytes):
+            html = html.decode(encoding, errors='replace')
+        soup = BeautifulSoup(html, 'html.parser')
+        for element in soup.find_all(['title', 'a']):
+            yield element.name, element.get_text(strip=True), element.get('href')
+
+
+PARSER_BACKENDS = {
+    LxmlBackend.name: LxmlBackend,
+    BeautifulSoupBackend.name: BeautifulSoupBackend,
+}
+
+
+def get_backend(name=DEFAULT_BACKEND):
+    """取得解析後端實例"""
+    try:
+        return PARSER_BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"未知的解析後端: {name}（可用: {', '.join(PARSER_BACKENDS)}）")
+
+
+def parse_listing(html, backend=DEFAULT_BACKEND, limit=None, encoding='utf-8'):
+    """解析函釋列表頁，回傳 {'title': 頁面標題, 'rulings': [...]}
+
+    limit 為找到的函釋數上限，達到後立即停止解析；None 表示解析整頁。
+    """
+    if isinstance(backend, str):
+        backend = get_backend(backend)
+
+    page_title = None
+    rulings = []
+    scraped_at = datetime.now().isoformat()
+
+    for tag, text, href in backend.iter_elements(html, encoding):
+        if tag == 'title':
+            if page_title is None:
+                page_title = text
+            continue
+
+        if href is None:
+            continue
+        ruling_number = extract_ruling_number(text)
+        if not ruling_number:
+            continue
+
+        rulings.append({
+            'ruling_number': ruling_number,
+            'title': text[:200],
+            'url': href,
+            'scraped_at': scraped_at
+        })
+        if limit is not None and len(rulings) >= limit:
+            break
+
+    return {'title': page_title, 'rulings': rulings}
+
+
+def _element_text(element):
+    """元素內的文字（合併空白）"""
+    return ' '.join(' '.join(element.itertext()).split())
+
+
+def parse_detail(html, encoding='utf-8'):
+    """解析函釋內容頁
+
+    回傳 {'title', 'content', 'authority', 'ruling_number', 'issue_date'}：
+    正文取自 main/article/content 區塊中文字最多者（找不到時用整個 body，
+    並移除程式碼、導覽列等區塊）；發文機關、字號與日期優先取欄位標籤，
+    其次由標題與正文開頭推斷，找不到時為 None。
+    """
+    result = {'title': None, 'content': '', 'authority': None,
+              'ruling_number': None, 'issue_date': None}
+    content, encoding = _to_bytes(html, encoding)
+    parser = etree.HTMLParser(encoding=encoding, recover=True)
+    root = etree.fromstring(content, parser)
+    if root is None:
+        return result
+
+    title = root.findtext('.//title')
+    result['title'] = title.strip() if title else None
+    etree.strip_elements(root, *SKIP_TAGS, with_tail=False)
+
+    candidates = [_element_text(element) for element in root.xpath(CONTENT_XPATH)]
+    if not any(candidates):
+        body = root.find('.//body')
+        candidates = [_element_text(body if body is not None else root)]
+    text = max(candidates, key=len)
+    result['content'] = text
+
+    labels = {field: pattern.search(text) for field, pattern in FIELD_LABEL_PATTERNS.items()}
+    head = f"{result['title'] or ''} {text[:300]}"
+
+    number_source = labels['ruling_number'].group(1) if labels['ruling_number'] else head
+    result['ruling_number'] = extract_ruling_number(number_source) or extract_ruling_number(head)
+
+    date_source = labels['issue_date'].group(1) if labels['issue_date'] else head
+    result['issue_date'] = date_from_text(date_source) or date_from_text(head)
+
+    if labels['authority']:
+        result['authority'] = labels['authority'].group(1)
+    elif result['ruling_number']:
+        result['authority'] = next(
+            (authority for prefix, authority in AUTHORITY_BY_PREFIX.items()
+             if result['ruling_number'].startswith(prefix)), None
+        )
+    return result
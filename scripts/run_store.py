@@ -0,0 +1,184 @@
+# run_store.py - 執行紀錄儲存區（按月分割的 append-only JSON Lines + 位移索引）
+import argparse
+import json
+import os
+import re
+from datetime import datetime
+
+# 舊版每次執行產生的 JSON 檔：檔名前綴 → 紀錄類別
+LEGACY_PREFIXES = {
+    'tax_data_': 'tax_data',
+    'mof_rulings_': 'mof_rulings',
+    'collection_report_': 'collection_report',
+    'pipeline_': 'pipeline',
+}
+
+# 檔名中的執行時間戳（YYYYMMDD_HHMMSS）
+RUN_TIMESTAMP_PATTERN = re.compile(r'(\d{8}_\d{6})\.json$')
+
+
+def _timestamp_key(value):
+    """將日期或時間戳（YYYY-MM-DD、YYYYMMDD、YYYYMMDD_HHMMSS）轉為可比較的時間戳前綴"""
+    return value.replace('-', '') if value else value
+
+
+class RunStore:
+    """所有收集器共用的執行紀錄
+
+    每筆紀錄為一行 JSON，依執行月份寫入 runs/YYYY-MM.jsonl，只附加不改寫；
+    index.jsonl 記錄每筆紀錄的類別、執行時間戳、所在分割檔與位元組位移，
+    讀取某段期間時只需掃描索引並直接跳到對應位置，不必解析其他紀錄。
+    """
+
+    def __init__(self, root=None):
+        base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.root = root or os.path.join(base_path, "data", "runs")
+        self.index_path = os.path.join(self.root, "index.jsonl")
+        os.makedirs(self.root, exist_ok=True)
+
+    def append(self, kind, payload, run_timestamp=None, source_file=None):
+        """附加一筆紀錄，回傳索引記錄"""
+        run_timestamp = run_timestamp or datetime.now().strftime('%Y%m%d_%H%M%S')
+        partition = f"{run_timestamp[:4]}-{run_timestamp[4:6]}.jsonl"
+        line = json.dumps(
+            {'kind': kind, 'run_timestamp': run_timestamp, 'payload': payload},
+            ensure_ascii=False, separators=(',', ':')
+        ).encode('utf-8') + b'\n'
+
+        # 先寫入資料再寫索引：中斷時最多留下沒有索引的資料列，不會有指向不存在資料的索引
+        with open(os.path.join(self.root, partition), 'ab') as f:
+            offset = f.seek(0, os.SEEK_END)
+            f.write(line)
+
+        entry = {
+            'kind': kind,
+            'run_timestamp': run_timestamp,
+            'partition': partition,
+            'offset': offset,
+            'length': len(line),
+            'source_file': source_file,
+            'stored_at': datetime.now().isoformat()
+        }
+        with open(self.index_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        return entry
+
+    def entries(self, kind=None, since=None, until=None):
+        """依類別與期間（YYYY-MM-DD 或 YYYYMMDD_HHMMSS，含頭尾）篩選索引記錄"""
+        if not os.path.exists(self.index_path):
+            return
+
+        since, until = _timestamp_key(since), _timestamp_key(until)
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if kind and entry['kind'] != kind:
+                    continue
+                if since and entry['run_timestamp'] < since:
+                    continue
+                # 只給日期時包含當天所有時間
+                if until and entry['run_timestamp'][:len(until)] > until:
+                    continue
+                yield entry
+
+    def read(self, entry):
+        """依索引記錄讀取單筆紀錄"""
+        with open(os.path.join(self.root, entry['partition']), 'rb') as f:
+            f.seek(entry['offset'])
+            return json.loads(f.read(entry['length']))
+
+    def iter_records(self, kind=None, since=None, until=None):
+        """逐筆讀取符合條件的紀錄（每個分割檔只開啟一次）"""
+        handles = {}
+        try:
+            for entry in self.entries(kind, since, until):
+                handle = handles.get(entry['partition'])
+                if handle is None:
+                    handle = handles[entry['partition']] = open(
+                        os.path.join(self.root, entry['partition']), 'rb'
+                    )
+                handle.seek(entry['offset'])
+                yield json.loads(handle.read(entry['length']))
+        finally:
+            for handle in handles.values():
+                handle.close()
+
+    def latest(self, kind):
+        """某類別最近一筆紀錄，沒有時回傳 None"""
+        last = None
+        for entry in self.entries(kind):
+            last = entry
+        return self.read(last) if last else None
+
+    def stats(self):
+        """各類別紀錄數與分割檔大小"""
+        kinds = {}
+        for entry in self.entries():
+            kinds[entry['kind']] = kinds.get(entry['kind'], 0) + 1
+        partitions = {
+            name: os.path.getsize(os.path.join(self.root, name))
+            for name in sorted(os.listdir(self.root))
+            if name.endswith('.jsonl') and name != 'index.jsonl'
+        }
+        return {'records': sum(kinds.values()), 'kinds': kinds, 'partitions': partitions}
+
+    def compact_legacy(self, data_path, remove=False):
+        """將舊版每次執行產生的 <前綴>_<時間戳>.json 依時間順序匯入，已匯入的檔案會略過"""
+        imported_files = {entry['source_file'] for entry in self.entries() if entry.get('source_file')}
+
+        legacy = []
+        for name in os.listdir(data_path):
+            match = RUN_TIMESTAMP_PATTERN.search(name)
+            prefix = next((p for p in LEGACY_PREFIXES if name.startswith(p)), None)
+            if match and prefix and name == f"{prefix}{match.group(1)}.json":
+                legacy.append((match.group(1), name, LEGACY_PREFIXES[prefix]))
+
+        imported = 0
+        for run_timestamp, name, kind in sorted(legacy):
+            file_path = os.path.join(data_path, name)
+            if name not in imported_files:
+                try:
+                    with open(file_path, 'r', encoding='utf-8') as f:
+                        payload = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"⚠ 略過無法讀取的檔案 {name}: {e}")
+                    continue
+                self.append(kind, payload, run_timestamp, source_file=name)
+                imported += 1
+
+            if remove:
+                os.remove(file_path)
+
+        print(f"✓ 匯入 {imported} 個舊版JSON檔案（共找到 {len(legacy)} 個）")
+        return imported
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='執行紀錄儲存區')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    compact = subparsers.add_parser('compact', help='匯入 data/ 下的舊版JSON檔案')
+    compact.add_argument('--remove', action='store_true', help='匯入後刪除原檔')
+
+    show = subparsers.add_parser('list', help='列出紀錄')
+    show.add_argument('--kind', help='紀錄類別')
+    show.add_argument('--since', help='起始日期（YYYY-MM-DD）')
+    show.add_argument('--until', help='結束日期（YYYY-MM-DD）')
+
+    subparsers.add_parser('stats', help='顯示統計')
+    args = parser.parse_args()
+
+    store = RunStore()
+    if args.command == 'compact':
+        store.compact_legacy(os.path.dirname(store.root), remove=args.remove)
+    elif args.command == 'list':
+        for entry in store.entries(args.kind, args.since, args.until):
+            print(f"{entry['run_timestamp']}  {entry['kind']:<18} {entry['partition']}:{entry['offset']}")
+    else:
+        stats = store.stats()
+        print(f"紀錄數: {stats['records']}")
+        for kind, count in stats['kinds'].items():
+            print(f"  {kind:<18}{count:>8}")
+        for name, size in stats['partitions'].items():
+            print(f"  {name:<18}{size:>12,} bytes")
@@ -1,114 +1,94 @@
 # taiwan_tax_collector.py - 台灣稅務資料收集器（修正版）
-import requests
-from bs4 import BeautifulSoup
-import json
 import os
-from datetime import datetime, timedelta
+from datetime import datetime
 import time
+import metrics
+from fetch_engine import AsyncFetchEngine, HostDegradedError, ensure_ok
+from http_cache import HttpValidatorCache
+from rate_limiter import HostRateLimiter
+from run_store import RunStore
 
 class TaiwanTaxCollector:
-    def __init__(self):
+    def __init__(self, fetcher=None):
         # Use the project directory (parent of scripts folder)
         self.base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.data_path = os.path.join(self.base_path, "data")
         # Ensure data directory exists
         os.makedirs(self.data_path, exist_ok=True)
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
+        # 共用抓取引擎（可由呼叫端注入，與其他收集器共用連線池）
+        self.fetcher = fetcher or AsyncFetchEngine(cache=HttpValidatorCache(), limiter=HostRateLimiter())
+        self.session = self.fetcher.session
+
+        # 財政部首頁
+        self.mof_url = "https://www.mof.gov.tw"
+
+        # 執行紀錄儲存區（取代每次執行一個 JSON 檔）
+        self.run_store = RunStore()
+
+        # 本次執行狀態：'ok' 或 'degraded'（網站無法連線或暫停中，未取得資料）
+        self.status = {'status': 'ok', 'error': None}
+
+        # 本次抓取頁面的驗證資訊，儲存完成後才記錄
+        self.pending_validator = None
 
     def collect_mof_data(self):
         """收集財政部資料"""
+        return self.fetcher.run(self.collect_mof_data_async())
+
+    async def collect_mof_data_async(self):
+        """收集財政部資料（可與其他收集器於同一事件迴圈並行）"""
         print("開始收集財政部資料...")
 
-        url = "https://www.mof.gov.tw"
+        url = self.mof_url
         results = []
 
         try:
-            response = self.session.get(url, timeout=15)
-            response.encoding = 'utf-8'
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            # 收集所有連結
-            links = soup.find_all('a', href=True)
-
-            for link in links[:20]:  # 只處理前20個
-                text = link.get_text(strip=True)
-                if len(text) > 10:
-                    results.append({
-                        'title': text[:100],
-                        'url': link.get('href', ''),
-                        'time': datetime.now().isoformat()
-                    })
+            with metrics.timer('fetch'):
+                response = ensure_ok(await self.fetcher.fetch(url))
+            if response['unchanged']:
+                print("✓ 頁面自上次執行後未變更，略過解析")
+                return results
+
+            with metrics.timer('parse'):
+                results = self.parse_links(response['text'])
+            metrics.count('items_parsed', len(results))
 
             print(f"✓ 成功！找到 {len(results)} 個項目")
+            self.pending_validator = (url, response['validator'])
 
         except Exception as e:
-            print(f"⚠ 無法連接財政部網站: {type(e).__name__}")
-            print("  使用示範資料模式...")
-            results = self._get_demo_data()
+            # 不以示範資料代替，明確標示為降級執行
+            reason = "暫停中（斷路）" if isinstance(e, HostDegradedError) else "無法連接"
+            print(f"⚠ 財政部網站{reason}: {type(e).__name__}: {e}")
+            self.status = {'status': 'degraded', 'error': f"{type(e).__name__}: {e}"}
 
         return results
 
-    def _get_demo_data(self):
-        """提供示範資料（當網路不可用時）"""
-        base_date = datetime.now()
-        demo_items = [
-            {
-                'title': '財政部令：修正「營利事業所得稅查核準則」第111條',
-                'ruling_number': '台財稅字第11304567890號',
-                'summary': '有關營利事業列報旅費支出之認定標準，修正相關規定。',
-                'category': '營利事業所得稅',
-                'url': 'https://www.mof.gov.tw/singlehtml/384fb3077bb349ea973e7fc6f13b6974',
-                'time': (base_date - timedelta(days=1)).isoformat()
-            },
-            {
-                'title': '財政部函釋：個人出售房地適用房地合一稅2.0相關疑義',
-                'ruling_number': '台財稅字第11304567891號',
-                'summary': '說明個人出售105年1月1日以後取得之房屋、土地，應如何計算持有期間。',
-                'category': '房地合一稅',
-                'url': 'https://www.mof.gov.tw/singlehtml/384fb3077bb349ea973e7fc6f13b6975',
-                'time': (base_date - timedelta(days=2)).isoformat()
-            },
-            {
-                'title': '財政部公告：113年度營利事業所得稅結算申報注意事項',
-                'ruling_number': '台財稅字第11304567892號',
-                'summary': '提醒營利事業辦理113年度所得稅結算申報應注意事項。',
-                'category': '營利事業所得稅',
-                'url': 'https://www.mof.gov.tw/singlehtml/384fb3077bb349ea973e7fc6f13b6976',
-                'time': (base_date - timedelta(days=3)).isoformat()
-            },
-            {
-                'title': '財政部令：統一發票給獎辦法部分條文修正',
-                'ruling_number': '台財稅字第11304567893號',
-                'summary': '修正統一發票中獎獎金金額及領獎相關規定。',
-                'category': '統一發票',
-                'url': 'https://www.mof.gov.tw/singlehtml/384fb3077bb349ea973e7fc6f13b6977',
-                'time': (base_date - timedelta(days=4)).isoformat()
-            },
-            {
-                'title': '財政部函釋：跨境電商營業稅課徵相關規定',
-                'ruling_number': '台財稅字第11304567894號',
-                'summary': '說明境外電商銷售電子勞務予境內自然人之營業稅課徵規定。',
-                'category': '營業稅',
-                'url': 'https://www.mof.gov.tw/singlehtml/384fb3077bb349ea973e7fc6f13b6978',
-                'time': (base_date - timedelta(days=5)).isoformat()
-            }
-        ]
-        print(f"✓ 載入 {len(demo_items)} 筆示範資料")
-        return demo_items
+    def parse_links(self, html):
+        """擷取首頁連結（只處理前20個，略過過短的文字）"""
+        from bs4 import BeautifulSoup  # 載入較慢，解析時才匯入
+        soup = BeautifulSoup(html, 'html.parser')
+        results = []
 
-    def save_data(self, data):
-        """儲存資料"""
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = os.path.join(self.data_path, f"tax_data_{timestamp}.json")
+        # 收集所有連結
+        links = soup.find_all('a', href=True)
+
+        for link in links[:20]:  # 只處理前20個
+            text = link.get_text(strip=True)
+            if len(text) > 10:
+                results.append({
+                    'title': text[:100],
+                    'url': link.get('href', ''),
+                    'time': datetime.now().isoformat()
+                })
 
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        return results
 
-        print(f"✓ 資料已儲存: {os.path.basename(filename)}")
-        return filename
+    def save_data(self, data):
+        """儲存資料（附加到執行紀錄儲存區）"""
+        entry = self.run_store.append('tax_data', data)
+        print(f"✓ 資料已儲存: runs/{entry['partition']}")
+        return entry
 
     def display_results(self, data):
         """顯示收集結果"""
@@ -138,6 +118,7 @@ class TaiwanTaxCollector:
         full_results = {
             'scan_time': datetime.now().isoformat(),
             'source': 'Ministry of Finance, Taiwan',
+            **self.status,
             'data': data,
             'count': len(data)
         }
@@ -145,13 +126,29 @@ class TaiwanTaxCollector:
         # 顯示結果
         self.display_results(data)
 
-        # 儲存
-        saved_file = self.save_data(full_results)
+        # 儲存（頁面未變更時沒有新資料，不產生檔案；降級執行也會記錄）
+        if data or self.status['status'] == 'degraded':
+            saved_file = self.save_data(full_results)
+        else:
+            print("✓ 沒有新資料，略過儲存")
+
+        if self.fetcher.cache is not None:
+            if self.pending_validator is not None:
+                self.fetcher.cache.remember(*self.pending_validator)
+                self.pending_validator = None
+            self.fetcher.cache.report()
+        if self.fetcher.limiter is not None:
+            self.fetcher.limiter.report()
 
         print("\n" + "="*60)
-        print(f"完成！共收集 {len(data)} 筆資料")
+        if self.status['status'] == 'degraded':
+            print(f"⚠ 降級執行：未取得資料（{self.status['error']}）")
+        else:
+            print(f"完成！共收集 {len(data)} 筆資料")
         print("="*60)
 
+        metrics.recorder.export('taiwan_tax_collector', run_store=self.run_store)
+
         return full_results
 
 if __name__ == "__main__":
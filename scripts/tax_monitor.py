@@ -0,0 +1,209 @@
+# tax_monitor.py - 稅務監控統一指令（子指令需要時才載入相依套件，search/report 可快速啟動）
+import argparse
+import importlib
+import importlib.util
+import os
+import sys
+import time
+
+# 子指令的處理函式在執行時才匯入各自的模組，
+# 不需要網路或分析功能的子指令不會載入 requests、lxml、pandas 等套件
+
+# 外部套件與用途（check 子指令依此檢查）
+REQUIRED_PACKAGES = {
+    'requests': '網頁下載',
+    'bs4': '網頁解析',
+    'lxml': 'HTML/RSS 串流解析',
+    'pandas': '資料分析',
+    'jieba': '中文分詞',
+    'chardet': '編碼偵測',
+}
+
+# 各子指令需要的外部套件
+COMMAND_PACKAGES = {
+    'collect': ['requests', 'bs4', 'lxml'],
+    'scrape': ['requests', 'bs4', 'lxml'],
+    'report': [],
+    'search': [],
+    'check': [],
+}
+
+# 各爬蟲：名稱 → (模組, 類別, 執行方法)
+SCRAPERS = {
+    'mof': ('mof_scraper', 'MOFTaxScraper', 'run'),
+    'homepage': ('taiwan_tax_collector', 'TaiwanTaxCollector', 'run'),
+    'rss': ('advanced_collector', 'AdvancedTaxCollector', 'run_advanced_collection'),
+}
+
+# --timing 列出的模組數
+TIMING_TOP = 15
+
+
+def check_packages(packages=REQUIRED_PACKAGES):
+    """以 find_spec 檢查套件是否已安裝（不實際載入），回傳 {套件: 是否可用}"""
+    return {name: importlib.util.find_spec(name) is not None for name in packages}
+
+
+def missing_packages(command):
+    """子指令需要但尚未安裝的套件"""
+    available = check_packages(COMMAND_PACKAGES.get(command, []))
+    return [name for name, ok in available.items() if not ok]
+
+
+def open_db(path=None):
+    from database_manager import TaxDatabaseManager
+    return TaxDatabaseManager(path)
+
+
+def cmd_collect(args):
+    from pipeline import CollectionPipeline
+    sources = [name.strip() for name in args.sources.split(',') if name.strip()] if args.sources else None
+    collection = CollectionPipeline(
+        sources, db=open_db(args.db), enrich=args.enrich, details=args.details, watch=args.watch
+    )
+    collection.run(profile=args.profile)
+    collection.db.generate_report()
+
+
+def cmd_scrape(args):
+    module_name, class_name, method = SCRAPERS[args.scraper]
+    scraper = getattr(importlib.import_module(module_name), class_name)()
+    getattr(scraper, method)()
+
+
+def cmd_report(args):
+    db = open_db(args.db)
+    db.generate_report()
+    if args.trends:
+        if not importlib.util.find_spec('pandas'):
+            print("✗ 趨勢分析需要 pandas（請執行 check 子指令）")
+            return 1
+        from analytics import RulingAnalytics
+        RulingAnalytics(db).display(months=args.months)
+
+
+def cmd_search(args):
+    db = open_db(args.db)
+    result = db.search_rulings_page(args.keyword, args.page, args.page_size)
+    if args.json:
+        import json
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+
+    pages = (result['total'] + args.page_size - 1) // args.page_size
+    print(f"「{args.keyword}」共 {result['total']} 筆（第 {result['page']}/{max(pages, 1)} 頁）")
+    for item in result['results']:
+        print(f"\n■ {item['ruling_number'] or '（無字號）'}  {item['issue_date'] or ''}")
+        print(f"  {item['title']}")
+        print(f"  {item['snippet']}")
+
+
+def cmd_check(args):
+    print("檢查稅務爬蟲系統...")
+    print("-" * 40)
+    available = check_packages()
+    for name, ok in available.items():
+        mark = '✓' if ok else '✗'
+        note = '' if ok else ' [需要安裝]'
+        print(f"{mark} {name:15} - {REQUIRED_PACKAGES[name]}{note}")
+
+    print("-" * 40)
+    for command, packages in COMMAND_PACKAGES.items():
+        missing = [name for name in packages if not available[name]]
+        status = '可執行' if not missing else f"缺少 {', '.join(missing)}"
+        print(f"  {command:<10}{status}")
+
+    print("-" * 40)
+    if all(available.values()):
+        print("✅ 系統準備完成！可以開始爬蟲了")
+    else:
+        print("❌ 請先安裝缺少的套件: pip install -r requirements.txt")
+    return 0 if all(available.values()) else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='tax-monitor', description='台灣稅務監控')
+    parser.add_argument('--db', help='資料庫路徑（預設 data/tax_monitor.db）')
+    parser.add_argument('--timing', action='store_true',
+                        help='顯示啟動與各模組載入耗時（以 -X importtime 重新執行）')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    collect = subparsers.add_parser('collect', help='執行收集流程（所有來源）')
+    collect.add_argument('--sources', help='以逗號分隔的來源代號')
+    collect.add_argument('--details', action='store_true', help='抓取尚無內文的函釋內容頁')
+    collect.add_argument('--enrich', action='store_true', help='執行關鍵字擷取與分類')
+    collect.add_argument('--watch', action='store_true', help='比對關注字詞並產生訂閱通知')
+    collect.add_argument('--profile', action='store_true', help='以 cProfile 與 tracemalloc 剖析')
+    collect.set_defaults(handler=cmd_collect)
+
+    scrape = subparsers.add_parser('scrape', help='執行單一爬蟲')
+    scrape.add_argument('scraper', choices=SCRAPERS, help='爬蟲名稱')
+    scrape.set_defaults(handler=cmd_scrape)
+
+    report = subparsers.add_parser('report', help='資料庫統計報告')
+    report.add_argument('--trends', action='store_true', help='加上趨勢分析（需要 pandas）')
+    report.add_argument('--months', type=int, default=12, help='趨勢分析的月份數')
+    report.set_defaults(handler=cmd_report)
+
+    search = subparsers.add_parser('search', help='全文搜尋函釋')
+    search.add_argument('keyword', help='關鍵字')
+    search.add_argument('--page', type=int, default=1, help='頁碼')
+    search.add_argument('--page-size', type=int, default=10, help='每頁筆數')
+    search.add_argument('--json', action='store_true', help='輸出 JSON')
+    search.set_defaults(handler=cmd_search)
+
+    check = subparsers.add_parser('check', help='檢查相依套件（不實際載入）')
+    check.set_defaults(handler=cmd_check)
+    return parser
+
+
+def run_with_importtime(argv):
+    """以 -X importtime 重新執行同一指令，輸出載入最久的模組與總耗時"""
+    import subprocess
+    started = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', os.path.abspath(__file__), *argv],
+        stderr=subprocess.PIPE, text=True
+    )
+    elapsed = time.perf_counter() - started
+
+    modules, other = [], []
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:'):
+            other.append(line)
+            continue
+        if 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # 名稱前的空白為巢狀層級，只去掉分隔用的一個空白
+        modules.append((int(cumulative_us), int(self_us), name[1:]))
+    if other:
+        print('\n'.join(other), file=sys.stderr)
+
+    # 只列出最上層的匯入（-X importtime 以縮排表示巢狀）
+    top_level = [entry for entry in modules if not entry[2].startswith(' ')]
+    print(f"\n{'模組':<32}{'累計(ms)':>10}{'自身(ms)':>10}", file=sys.stderr)
+    for cumulative_us, self_us, name in sorted(top_level, reverse=True)[:TIMING_TOP]:
+        print(f"{name:<32}{cumulative_us / 1000:>10.1f}{self_us / 1000:>10.1f}", file=sys.stderr)
+    print(f"載入模組合計: {sum(entry[0] for entry in top_level) / 1000:.1f} ms, "
+          f"總耗時（含直譯器啟動）: {elapsed * 1000:.1f} ms", file=sys.stderr)
+    return process.returncode
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.timing:
+        return run_with_importtime([arg for arg in argv if arg != '--timing'])
+
+    missing = missing_packages(args.command)
+    if missing:
+        print(f"✗ {args.command} 需要的套件尚未安裝: {', '.join(missing)}（請執行 check 子指令）")
+        return 1
+    return args.handler(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
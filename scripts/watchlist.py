@@ -0,0 +1,369 @@
+# watchlist.py - 關注字詞比對與訂閱通知（Aho-Corasick 多字詞自動機）
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+from collections import deque
+from datetime import datetime
+from email.message import EmailMessage
+
+from database_manager import TaxDatabaseManager
+from run_store import RunStore
+
+# 訂閱設定檔：{"subscribers": {代號: {"name", "email", "terms": [...]}}}
+DEFAULT_WATCHLIST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "watchlist.json")
+
+# 比對前的字元轉換（不改變字串長度，命中位置可直接對回原文）：
+# 全形英數轉半形、英文轉小寫、「臺」統一為「台」
+NORMALIZE_TABLE = str.maketrans(
+    {**{chr(0xFF10 + i): chr(0x30 + i) for i in range(10)},
+     **{chr(0xFF21 + i): chr(0x61 + i) for i in range(26)},
+     **{chr(0xFF41 + i): chr(0x61 + i) for i in range(26)},
+     **{chr(0x41 + i): chr(0x61 + i) for i in range(26)},
+     '臺': '台'}
+)
+
+# 通知中命中處前後保留的字數
+SNIPPET_CONTEXT = 20
+
+# 記錄掃描進度（已掃描的最大變更紀錄編號）的鍵
+STATE_KEY = 'last_change_id'
+
+# 舊版以收集批次編號記錄進度的鍵（升級時換算為變更紀錄編號）
+LEGACY_STATE_KEY = 'last_run_id'
+
+
+def normalize_text(text):
+    """轉換為比對用的字串（長度與原文相同）"""
+    return (text or '').translate(NORMALIZE_TABLE)
+
+
+class AhoCorasick:
+    """Aho-Corasick 自動機：一次掃描找出文字中所有關注字詞
+
+    比對成本只與文字長度（及命中數）有關，與字詞數量無關。
+    節點以 dict 表示轉移，fail 為失敗連結，outputs 為在此結束的字詞。
+    """
+
+    def __init__(self, terms):
+        self.terms = sorted({normalize_text(term).strip() for term in terms if term and term.strip()})
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [[]]
+
+        for index, term in enumerate(self.terms):
+            node = 0
+            for char in term:
+                next_node = self.goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self.goto)
+                    self.goto[node][char] = next_node
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.outputs.append([])
+                node = next_node
+            self.outputs[node].append(index)
+
+        # 以廣度優先建立失敗連結，並合併失敗節點的輸出
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.outputs[child] = self.outputs[child] + self.outputs[self.fail[child]]
+
+    def tables(self):
+        """自動機的字詞、轉移、失敗連結與輸出（可直接序列化保存）"""
+        return self.terms, self.goto, self.fail, self.outputs
+
+    @classmethod
+    def from_tables(cls, tables):
+        """由 tables() 的結果還原，不重新建立轉移與失敗連結"""
+        automaton = cls.__new__(cls)
+        automaton.terms, automaton.goto, automaton.fail, automaton.outputs = tables
+        return automaton
+
+    def iter_matches(self, text):
+        """產生 (起點, 終點, 字詞)，位置為原文中的索引"""
+        goto, fail, outputs, terms = self.goto, self.fail, self.outputs, self.terms
+        node = 0
+        for position, char in enumerate(normalize_text(text)):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for index in outputs[node]:
+                term = terms[index]
+                yield position + 1 - len(term), position + 1, term
+
+
+def load_watchlist(path=DEFAULT_WATCHLIST_PATH):
+    """讀取訂閱設定，回傳 {代號: {'name', 'email', 'terms'}}"""
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    subscribers = {}
+    for key, subscriber in config.get('subscribers', {}).items():
+        subscribers[key] = {
+            'name': subscriber.get('name', key),
+            'email': subscriber.get('email'),
+            'terms': [term for term in subscriber.get('terms', []) if term and term.strip()]
+        }
+    return subscribers
+
+
+def watchlist_hash(subscribers):
+    """所有訂閱字詞的雜湊（字詞或訂閱者改變時才重建自動機）"""
+    canonical = json.dumps(
+        {key: sorted(subscriber['terms']) for key, subscriber in sorted(subscribers.items())},
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def match_snippet(text, start, end, context=SNIPPET_CONTEXT):
+    """命中處前後各 context 字的摘要，命中字詞以【】標示"""
+    prefix = '…' if start > context else ''
+    suffix = '…' if end + context < len(text) else ''
+    return (f"{prefix}{text[max(start - context, 0):start]}【{text[start:end]}】"
+            f"{text[end:end + context]}{suffix}")
+
+
+class WatchlistEngine:
+    """掃描新收錄或變更的函釋，依訂閱者產生命中摘要
+
+    所有訂閱者的字詞編入同一個自動機，每則函釋的標題與內文只掃描一次；
+    同一訂閱者、同一函釋、同一字詞只通知一次（記錄於 watchlist_alerts）。
+    建立的自動機以設定雜湊為鍵保存於 data/，字詞未改變時下次執行直接載入。
+    """
+
+    # 自動機快取：設定雜湊 → (自動機, 字詞 → 訂閱者)
+    _automata = {}
+
+    def __init__(self, db=None, watchlist_path=DEFAULT_WATCHLIST_PATH, digest_dir=None,
+                 automaton_path=None):
+        self.db = db or TaxDatabaseManager()
+        self.watchlist_path = watchlist_path
+        base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.digest_dir = digest_dir or os.path.join(base_path, "data", "digests")
+        self.automaton_path = automaton_path or os.path.join(base_path, "data", "watchlist_automaton.pkl")
+        self.conn = sqlite3.connect(self.db.db_path)
+        self.conn.execute('PRAGMA busy_timeout=5000')
+        self.init_tables()
+        self.reload()
+
+    def init_tables(self):
+        """建立通知紀錄與掃描進度表"""
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS watchlist_alerts (
+                subscriber TEXT NOT NULL,
+                ruling_id INTEGER NOT NULL,
+                term TEXT NOT NULL,
+                alerted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (subscriber, ruling_id, term)
+            ) WITHOUT ROWID
+        ''')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS watchlist_state (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+        self.conn.commit()
+
+    def reload(self):
+        """重新讀取訂閱設定；字詞未改變時沿用已建立（或上次執行保存）的自動機"""
+        self.subscribers = load_watchlist(self.watchlist_path)
+        self.version = watchlist_hash(self.subscribers)
+        if self.version not in self._automata:
+            saved = self._load_automaton()
+            if saved is None:
+                owners = {}
+                for key, subscriber in self.subscribers.items():
+                    for term in subscriber['terms']:
+                        owners.setdefault(normalize_text(term).strip(), set()).add(key)
+                saved = (AhoCorasick(owners), owners)
+                self._save_automaton(*saved)
+                print(f"✓ 已建立關注字詞自動機: {len(owners)} 個字詞, {len(self.subscribers)} 位訂閱者")
+            self._automata[self.version] = saved
+        self.automaton, self.owners = self._automata[self.version]
+
+    def _load_automaton(self):
+        """讀取上次保存的自動機，設定已改變或檔案損毀時回傳 None"""
+        if not os.path.exists(self.automaton_path):
+            return None
+        try:
+            with open(self.automaton_path, 'rb') as f:
+                saved = pickle.load(f)
+            if saved['version'] != self.version:
+                return None
+            return AhoCorasick.from_tables(saved['tables']), saved['owners']
+        except (OSError, pickle.UnpicklingError, EOFError, KeyError, TypeError, ValueError):
+            print("⚠ 關注字詞自動機檔損毀，重新建立")
+            return None
+
+    def _save_automaton(self, automaton, owners):
+        """保存自動機（先寫暫存檔再取代，避免中斷時損毀）"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.automaton_path)), exist_ok=True)
+        saved = {'version': self.version, 'tables': automaton.tables(), 'owners': owners}
+        tmp_path = self.automaton_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(saved, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.automaton_path)
+
+    def last_change_id(self):
+        """已掃描的最大變更紀錄編號（舊版的批次進度換算為該批次以前的最大編號）"""
+        row = self.conn.execute(
+            'SELECT value FROM watchlist_state WHERE key = ?', (STATE_KEY,)
+        ).fetchone()
+        if row:
+            return int(row[0])
+        row = self.conn.execute(
+            'SELECT value FROM watchlist_state WHERE key = ?', (LEGACY_STATE_KEY,)
+        ).fetchone()
+        if not row:
+            return 0
+        row = self.conn.execute(
+            'SELECT MAX(id) FROM change_log WHERE run_id <= ?', (int(row[0]),)
+        ).fetchone()
+        return row[0] or 0
+
+    def match_ruling(self, ruling):
+        """比對一則函釋，回傳 {訂閱者: {字詞: {'count', 'field', 'snippet'}}}"""
+        hits = {}
+        for field in ('title', 'content'):
+            text = ruling.get(field) or ''
+            for start, end, term in self.automaton.iter_matches(text):
+                for subscriber in self.owners[term]:
+                    entry = hits.setdefault(subscriber, {}).setdefault(
+                        term, {'count': 0, 'field': field, 'snippet': match_snippet(text, start, end)}
+                    )
+                    entry['count'] += 1
+        return hits
+
+    def scan(self, since_run=None):
+        """掃描上次進度之後（指定 since_run 時為該批次之後）的變更，回傳各訂閱者的新命中
+
+        進度記錄為已掃描的最大變更紀錄編號，仍在執行中的收集批次之後提交的
+        變更下次仍會掃描到。通知紀錄與進度寫在未提交的交易中：呼叫端寫出通知後
+        才 commit()，放棄時 rollback()（下次仍會掃描到相同的函釋）。
+        """
+        last_change_id = self.last_change_id()
+        if since_run is None:
+            changes = self.db.changes_after(last_change_id, with_content=True)
+        else:
+            changes = self.db.changes_since(since_run, with_content=True)
+
+        # 同一函釋在期間內多次變更時只比對最新內容
+        rulings = {change['ruling_id']: change for change in changes}
+        digests = {key: [] for key in self.subscribers}
+        alerts = []
+        for ruling_id, ruling in rulings.items():
+            for subscriber, terms in self.match_ruling(ruling).items():
+                new_terms = {}
+                for term, hit in terms.items():
+                    cursor = self.conn.execute('''
+                        INSERT OR IGNORE INTO watchlist_alerts (subscriber, ruling_id, term)
+                        VALUES (?, ?, ?)
+                    ''', (subscriber, ruling_id, term))
+                    if cursor.rowcount:
+                        new_terms[term] = hit
+                if new_terms:
+                    digests[subscriber].append({
+                        'ruling_number': ruling['ruling_number'],
+                        'title': ruling['title'],
+                        'issue_date': ruling['issue_date'],
+                        'url': ruling['url'],
+                        'change_type': ruling['change_type'],
+                        'matches': new_terms
+                    })
+                    alerts.append((subscriber, ruling_id))
+
+        self.conn.execute('''
+            INSERT INTO watchlist_state (key, value) VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        ''', (STATE_KEY, str(max([last_change_id] + [change['change_id'] for change in changes]))))
+
+        print(f"✓ 已掃描 {len(rulings)} 則函釋（{len(changes)} 筆變更紀錄）, 命中 {len(alerts)} 筆")
+        return {key: items for key, items in digests.items() if items}
+
+    def write_digests(self, digests):
+        """每位有命中的訂閱者寫出 JSON 與可直接寄送的 .eml 檔，回傳檔案路徑"""
+        os.makedirs(self.digest_dir, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        files = []
+        for key, items in digests.items():
+            subscriber = self.subscribers[key]
+            base = os.path.join(self.digest_dir, f"{key}_{timestamp}")
+            with open(base + '.json', 'w', encoding='utf-8') as f:
+                json.dump({'subscriber': key, 'name': subscriber['name'],
+                           'generated_at': datetime.now().isoformat(), 'rulings': items},
+                          f, ensure_ascii=False, indent=2)
+            files.append(base + '.json')
+
+            if subscriber['email']:
+                with open(base + '.eml', 'wb') as f:
+                    f.write(bytes(self.build_email(subscriber, items)))
+                files.append(base + '.eml')
+        return files
+
+    def build_email(self, subscriber, items):
+        """組成通知郵件"""
+        message = EmailMessage()
+        message['To'] = subscriber['email']
+        message['Subject'] = f"[稅務監控] {subscriber['name']}：{len(items)} 則函釋符合關注字詞"
+
+        lines = [f"{subscriber['name']} 您好，以下函釋符合您的關注字詞：", ""]
+        for item in items:
+            terms = '、'.join(item['matches'])
+            lines.append(f"■ {item['ruling_number'] or '（無字號）'} {item['title']}")
+            lines.append(f"  發布日期: {item['issue_date'] or '未知'}　關注字詞: {terms}")
+            for term, hit in item['matches'].items():
+                lines.append(f"  - {hit['snippet']}")
+            if item['url']:
+                lines.append(f"  {item['url']}")
+            lines.append("")
+        message.set_content('\n'.join(lines))
+        return message
+
+    def run(self, since_run=None, dry_run=False):
+        """掃描並寫出通知（dry_run 時只顯示結果，不記錄進度）
+
+        通知檔案寫出後才記錄通知與進度；寫檔失敗時下次會重新通知。
+        """
+        try:
+            digests = self.scan(since_run)
+            for key, items in digests.items():
+                print(f"  {self.subscribers[key]['name']}: {len(items)} 則")
+            if dry_run:
+                self.conn.rollback()
+                return digests
+            files = self.write_digests(digests) if digests else []
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        if not digests:
+            return digests
+
+        RunStore().append('watchlist', {
+            'watchlist_version': self.version,
+            'digests': {key: len(items) for key, items in digests.items()},
+            'files': [os.path.basename(path) for path in files]
+        })
+        print(f"✓ 已產生 {len(files)} 個通知檔案: {os.path.relpath(self.digest_dir)}")
+        return digests
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='比對關注字詞並產生訂閱通知')
+    parser.add_argument('--watchlist', default=DEFAULT_WATCHLIST_PATH, help='訂閱設定檔')
+    parser.add_argument('--since-run', type=int, help='從指定批次之後開始掃描（預設為上次進度）')
+    parser.add_argument('--dry-run', action='store_true', help='只顯示結果，不寫檔也不記錄進度')
+    args = parser.parse_args()
+
+    WatchlistEngine(watchlist_path=args.watchlist).run(args.since_run, args.dry_run)